@@ -0,0 +1,248 @@
+import argparse
+import random
+import sys
+
+# 1レーンあたりの配置
+LANE_LENGTH = 20.0
+LANE_WIDTH = 3.5
+LANE_PITCH_X = 30.0
+LANE_PITCH_Y = 12.0
+LANES_PER_ROW = 100
+# 10レーンを1ブロックとし、ブロックごとにtraffic_lightを1つ置く
+BLOCK_SIZE = 10
+
+# ブロック内の位置ごとのレーンの種類
+LANE_KINDS = [
+    "signal_road",     # cp.signal_id でブロックのtraffic_lightを参照
+    "road",
+    "road",
+    "crosswalk",       # 偶数ブロックのみregulatory_elementから参照される
+    "plant",           # height付き、左右のノード数は同じ
+    "road",
+    "turn_road",       # turn_direction付き
+    "lrdiff_road",     # 左右のノード数が異なる
+    "straight_road",   # 中間点が完全に直線上にある
+    "dummy",           # remove_dummy_relationsの削除対象
+]
+
+MGRS_CODE = "54SUE"
+ORIGIN_LAT = 35.0
+ORIGIN_LON = 139.0
+
+
+def parse_size(text):
+    """1k, 10M のような表記のノード数を整数にする"""
+    units = {"k": 1000, "m": 1000000}
+    text = text.strip().lower()
+    if text and text[-1] in units:
+        return int(float(text[:-1]) * units[text[-1]])
+    return int(text)
+
+
+class IdAllocator:
+    """VMBと同様に node・way・relation で通し番号のIDを振る"""
+
+    def __init__(self, start=1):
+        self.next_id = start
+
+    def __call__(self):
+        new_id = self.next_id
+        self.next_id += 1
+        return new_id
+
+
+class MapBuilder:
+    """
+    レーン番号から決まる乱数で地図を組み立てる。
+    同じ seed・レーン数なら何度実行しても同じ要素が同じ順序で得られるため、
+    node・way・relation を別々の走査で書き出せる。
+    """
+
+    def __init__(self, seed):
+        self.seed = seed
+
+    def lane_random(self, i):
+        return random.Random(self.seed * 1000003 + i)
+
+    def iter_elements(self, n_lanes=None):
+        """
+        ("node", id, x, y, z) / ("way", id, refs, tags) / ("relation", id, members, tags)
+        をレーン順に返す。n_lanes を省略した場合は無限に続ける。
+        """
+        new_id = IdAllocator()
+        signal_id = None
+        i = 0
+        while n_lanes is None or i < n_lanes:
+            rng = self.lane_random(i)
+            block, kind_index = divmod(i, BLOCK_SIZE)
+            kind = LANE_KINDS[kind_index]
+            row, col = divmod(i, LANES_PER_ROW)
+            x0 = col * LANE_PITCH_X
+            y0 = row * LANE_PITCH_Y
+
+            if kind_index == 0:
+                signal_id = yield from self.traffic_light(new_id, x0, y0)
+
+            n_left = rng.randint(3, 8)
+            if kind == "lrdiff_road":
+                n_right = max(2, n_left + rng.choice([-1, 1]) * rng.randint(1, 2))
+            else:
+                n_right = n_left
+            jitter = 0.0 if kind == "straight_road" else 0.05
+
+            left, right = [], []
+            for refs, n, dy in ((left, n_left, 0.0), (right, n_right, LANE_WIDTH)):
+                for k in range(n):
+                    t = k / (n - 1)
+                    node_id = new_id()
+                    x = x0 + LANE_LENGTH * t
+                    y = y0 + dy + (rng.uniform(-jitter, jitter) if 0 < k < n - 1 else 0.0)
+                    z = 1.0 + 0.1 * t * LANE_LENGTH
+                    refs.append(node_id)
+                    yield ("node", node_id, x, y, z)
+
+            left_id = new_id()
+            yield ("way", left_id, left, {"type": "line_thin", "subtype": "solid"})
+            right_id = new_id()
+            yield ("way", right_id, right, {"type": "line_thin", "subtype": "dashed"})
+
+            members = [("way", left_id, "left"), ("way", right_id, "right")]
+            if kind == "crosswalk":
+                tags = {"type": "lanelet", "subtype": "crosswalk", "speed_limit": "10",
+                        "participant:pedestrian": "yes"}
+            elif kind == "plant":
+                tags = {"type": "lanelet", "subtype": "plant", "height": str(rng.choice([1, 1.5, 2]))}
+            elif kind == "dummy":
+                tags = {"type": "lanelet", "subtype": "dummy"} if block % 2 else \
+                    {"type": "lanelet", "subtype": "road_shoulder", "dummy": "1"}
+            else:
+                tags = {"type": "lanelet", "subtype": "road", "speed_limit": str(rng.choice([10, 15, 30, 40, 60])),
+                        "location": "urban", "one_way": "yes"}
+                if kind == "turn_road":
+                    tags["turn_direction"] = rng.choice(["left", "right", "straight"])
+                if kind == "signal_road":
+                    tags["cp.signal_id"] = str(signal_id)
+
+            lanelet_id = new_id()
+            yield ("relation", lanelet_id, members, tags)
+
+            if kind == "crosswalk" and block % 2 == 0:
+                polygon_id = new_id()
+                yield ("way", polygon_id, left + right[::-1], {"type": "crosswalk_polygon", "area": "yes"})
+                yield ("relation", new_id(),
+                       [("way", polygon_id, "crosswalk_polygon"), ("relation", lanelet_id, "refers")],
+                       {"type": "regulatory_element", "subtype": "crosswalk"})
+            i += 1
+
+    def traffic_light(self, new_id, x0, y0):
+        """
+        ブロックの先頭に停止線と信号機のwayとtraffic_lightのregulatory_elementを置く。
+        戻り値はregulatory_elementのID
+        """
+        stop_refs = []
+        light_refs = []
+        for refs, z in ((stop_refs, 1.0), (light_refs, 6.0)):
+            for dy in (0.0, LANE_WIDTH):
+                node_id = new_id()
+                refs.append(node_id)
+                yield ("node", node_id, x0 + LANE_LENGTH, y0 + dy, z)
+        stop_id = new_id()
+        yield ("way", stop_id, stop_refs, {"type": "stop_line"})
+        light_id = new_id()
+        yield ("way", light_id, light_refs, {"type": "traffic_light", "subtype": "red_yellow_green", "height": "1.2"})
+        signal_id = new_id()
+        yield ("relation", signal_id,
+               [("way", light_id, "refers"), ("way", stop_id, "ref_line")],
+               {"type": "regulatory_element", "subtype": "traffic_light"})
+        return signal_id
+
+
+def count_lanes(builder, target_nodes):
+    """ノード数が target_nodes 以上になるレーン数"""
+    nodes = 0
+    lanes = 0
+    for elem in builder.iter_elements():
+        if elem[0] == "node":
+            nodes += 1
+        elif elem[0] == "relation" and elem[3].get("type") == "lanelet":
+            lanes += 1
+            if nodes >= target_nodes:
+                return lanes
+    return lanes
+
+
+def format_tags(tags):
+    return "".join(f'    <tag k="{k}" v="{v}"/>\n' for k, v in tags.items())
+
+
+def write_map(output, target_nodes, seed):
+    """
+    VMBの出力と同じ体裁のosmファイルを書き出す。
+    要素を保持しないよう、node・way・relation の順に3回走査して書き出す。
+    """
+    builder = MapBuilder(seed)
+    n_lanes = count_lanes(builder, target_nodes)
+    counts = {"node": 0, "way": 0, "relation": 0}
+
+    with open(output, "w", encoding="utf-8", buffering=1 << 20) as f:
+        f.write('<?xml version="1.0" encoding="UTF-8"?>\n<osm generator="VMB">\n')
+        f.write('  <MetaInfo format_version="1" map_version="2"/>\n')
+
+        for kind in ("node", "way", "relation"):
+            for elem in builder.iter_elements(n_lanes):
+                if elem[0] != kind:
+                    continue
+                counts[kind] += 1
+                if kind == "node":
+                    _, node_id, x, y, z = elem
+                    lat = ORIGIN_LAT + y / 111000.0
+                    lon = ORIGIN_LON + x / 91000.0
+                    f.write(
+                        f'  <node id="{node_id}" lat="{lat:.9f}" lon="{lon:.9f}">\n'
+                        f'    <tag k="mgrs_code" v="{MGRS_CODE}"/>\n'
+                        f'    <tag k="local_x" v="{x:.4f}"/>\n'
+                        f'    <tag k="local_y" v="{y:.4f}"/>\n'
+                        f'    <tag k="ele" v="{z:.4f}"/>\n'
+                        f'  </node>\n'
+                    )
+                elif kind == "way":
+                    _, way_id, refs, tags = elem
+                    f.write(f'  <way id="{way_id}">\n')
+                    f.write("".join(f'    <nd ref="{ref}"/>\n' for ref in refs))
+                    f.write(format_tags(tags))
+                    f.write('  </way>\n')
+                else:
+                    _, rel_id, members, tags = elem
+                    f.write(f'  <relation id="{rel_id}">\n')
+                    f.write("".join(
+                        f'    <member type="{t}" ref="{ref}" role="{role}"/>\n' for t, ref, role in members
+                    ))
+                    f.write(format_tags(tags))
+                    f.write('  </relation>\n')
+
+        f.write('</osm>\n')
+
+    counts["lanes"] = n_lanes
+    return counts
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Generate a synthetic Vector Map Builder style lanelet2 map.")
+    parser.add_argument("output", help="Output OSM file")
+    parser.add_argument("--nodes", default="10k", help="Approximate number of nodes (e.g. 1k, 100k, 10M)")
+    parser.add_argument("--seed", type=int, default=0, help="Random seed")
+    args = parser.parse_args()
+
+    try:
+        target_nodes = parse_size(args.nodes)
+    except ValueError:
+        print(f"Invalid --nodes value: {args.nodes}")
+        sys.exit(1)
+
+    counts = write_map(args.output, target_nodes, args.seed)
+    print(f"{args.output}: {counts['node']} nodes, {counts['way']} ways, "
+          f"{counts['relation']} relations ({counts['lanes']} lanes)")
+
+
+if __name__ == "__main__":
+    main()
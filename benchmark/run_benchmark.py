@@ -0,0 +1,280 @@
+import argparse
+import json
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import threading
+import time
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+from generate_map import parse_size, write_map
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# (名前, スクリプト, 追加の引数)。地図のパスは最初の引数として渡す
+TOOLS = [
+    ("check_crosswalk_regulatory", "check_crosswalk_regulatory/check_crosswalk_regulatory.py", []),
+    ("check_kvtypo", "check_kvtypo/check_kvtype.py", []),
+    ("check_signal_config", "check_signal_config/check_signal_config.py", []),
+    ("find_lanelet_speed_limit", "find_lanelet_speed_limit/find_lanelet_speed_limit.py", ["--lower", "10", "--upper", "30"]),
+    ("osm_relation_checker", "osm_relation_checker/osm_relation_checker.py", []),
+    ("map_validator", "map_validator/map_validator.py", []),
+    ("make_crosswalk_polygon", "make_crosswalk_polygon/make_crosswalk_polygon.py", []),
+    ("generate_crosswalk_regulatory", "generate_crosswalk_regulatory/generate_crosswalk_regulatory.py", []),
+    ("remove_dummy_relations", "remove_dummy_relations/remove_dummy_relations.py", []),
+    ("find_collinear_nodes", "find_collinear_nodes/find_collinear_nodes.py", ["--eps", "1e-6"]),
+    ("modify_lrdiff_lane", "modify_lrdiff_lane/modify_lrdiff_lane.py", []),
+    ("map_pipeline", "map_pipeline/map_pipeline.py", ["--eps", "1e-6"]),
+    ("plant_area_maker", "plant_area_maker/plant_area_maker.py", ["--step", "0.5"]),
+]
+TOOL_NAMES = [name for name, _, _ in TOOLS]
+
+
+def maxrss_mb(rusage):
+    # ru_maxrss はLinuxではKB、macOSではバイト単位
+    if sys.platform == "darwin":
+        return rusage.ru_maxrss / (1024 * 1024)
+    return rusage.ru_maxrss / 1024
+
+
+def run_measured(cmd, cwd, env, log_path, timeout):
+    """
+    cmd を実行し (状態, 終了コード, 経過時間[s], ピークRSS[MB]) を返す。
+    RSSは os.wait4 でその子プロセス自身の値を取得する。
+    """
+    with open(log_path, "wb") as log:
+        start = time.perf_counter()
+        proc = subprocess.Popen(cmd, cwd=cwd, env=env, stdout=log, stderr=subprocess.STDOUT)
+        timed_out = threading.Event()
+
+        def kill():
+            timed_out.set()
+            proc.kill()
+
+        timer = threading.Timer(timeout, kill) if timeout else None
+        if timer:
+            timer.start()
+        try:
+            _, status, rusage = os.wait4(proc.pid, 0)
+        finally:
+            if timer:
+                timer.cancel()
+        wall = time.perf_counter() - start
+    proc.returncode = os.waitstatus_to_exitcode(status)
+
+    if timed_out.is_set():
+        state = "timeout"
+    elif proc.returncode != 0:
+        state = "failed"
+    else:
+        state = "ok"
+    return state, proc.returncode, wall, maxrss_mb(rusage)
+
+
+def load_phases(profile_path):
+    try:
+        with open(profile_path, encoding="utf-8") as f:
+            return json.load(f)["phases"]
+    except (OSError, ValueError, KeyError):
+        return []
+
+
+def clean_run_dir(run_dir, keep):
+    """前のツールの出力ファイルを削除する（上書き防止で連番が付くのを避けるため）"""
+    for name in os.listdir(run_dir):
+        path = os.path.join(run_dir, name)
+        if name != keep and os.path.isfile(path):
+            os.remove(path)
+
+
+def prepare_map(workdir, size_text, seed):
+    """サイズごとの地図を生成する。同じサイズ・seedの地図があれば再利用する"""
+    target = parse_size(size_text)
+    map_dir = os.path.join(workdir, "maps")
+    os.makedirs(map_dir, exist_ok=True)
+    map_path = os.path.join(map_dir, f"bench_{target}_s{seed}.osm")
+    info_path = map_path + ".json"
+    if os.path.exists(map_path) and os.path.exists(info_path):
+        with open(info_path, encoding="utf-8") as f:
+            return map_path, json.load(f)
+
+    print(f"Generating map with ~{target} nodes ...", flush=True)
+    start = time.perf_counter()
+    counts = write_map(map_path, target, seed)
+    counts["generate_seconds"] = time.perf_counter() - start
+    with open(info_path, "w", encoding="utf-8") as f:
+        json.dump(counts, f)
+    return map_path, counts
+
+
+def warm_snapshot(map_path, env):
+    """計測前にスナップショットを作成しておき、全ツールを同じ条件で計測する"""
+    code = (
+        "import sys; sys.path.insert(0, sys.argv[1]);"
+        "from osm_common.osm_loader import load_osm; load_osm(sys.argv[2])"
+    )
+    subprocess.run([sys.executable, "-c", code, REPO_ROOT, map_path], env=env, check=True)
+
+
+def run_benchmark(args):
+    workdir = os.path.abspath(args.workdir)
+    os.makedirs(workdir, exist_ok=True)
+    env = dict(os.environ)
+    env["MAP_UTILS_CACHE_DIR"] = os.path.join(workdir, "cache")
+    env["MAP_UTILS_SNAPSHOT"] = "1" if args.snapshot else "0"
+    tools = [tool for tool in TOOLS if not args.tools or tool[0] in args.tools]
+
+    results = []
+    header_printed = False
+    for size_text in args.sizes:
+        source, counts = prepare_map(workdir, size_text, args.seed)
+        run_dir = os.path.join(workdir, f"run_{parse_size(size_text)}")
+        log_dir = os.path.join(workdir, "logs")
+        os.makedirs(run_dir, exist_ok=True)
+        os.makedirs(log_dir, exist_ok=True)
+
+        # 出力ファイルは入力と同じディレクトリに作られるため、実行用ディレクトリから参照する
+        map_name = os.path.basename(source)
+        map_path = os.path.join(run_dir, map_name)
+        if not os.path.exists(map_path):
+            try:
+                os.symlink(source, map_path)
+            except OSError:
+                shutil.copyfile(source, map_path)
+        if args.snapshot:
+            warm_snapshot(map_path, env)
+
+        if not header_printed:
+            print(format_header(), flush=True)
+            header_printed = True
+
+        for name, script, extra in tools:
+            runs = []
+            for _ in range(args.repeat):
+                clean_run_dir(run_dir, map_name)
+                cmd = [sys.executable, os.path.join(REPO_ROOT, script), map_name] + extra
+                log_path = os.path.join(log_dir, f"{parse_size(size_text)}_{name}.log")
+                # 各スクリプトのフェーズごとの計測結果もあわせて記録する
+                profile_path = os.path.join(log_dir, f"{parse_size(size_text)}_{name}.profile.json")
+                if os.path.exists(profile_path):
+                    os.remove(profile_path)
+                run_env = dict(env, MAP_UTILS_PROFILE_JSON=profile_path)
+                state, returncode, wall, rss = run_measured(cmd, run_dir, run_env, log_path, args.timeout)
+                runs.append({
+                    "state": state, "returncode": returncode, "wall": wall, "rss_mb": rss,
+                    "phases": load_phases(profile_path),
+                })
+                if state != "ok":
+                    break
+            clean_run_dir(run_dir, map_name)
+
+            # 失敗した場合はその実行を、すべて成功した場合は最短の時間と最大のRSSを記録する
+            result = {"size": size_text, "nodes": counts["node"], "tool": name}
+            if runs[-1]["state"] != "ok":
+                result.update(runs[-1])
+            else:
+                result.update(min(runs, key=lambda run: run["wall"]))
+                result["rss_mb"] = max(run["rss_mb"] for run in runs)
+            results.append(result)
+            print(format_row(result), flush=True)
+
+    return {
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "seed": args.seed,
+        "snapshot": args.snapshot,
+        "repeat": args.repeat,
+        "results": results,
+    }
+
+
+def result_key(result):
+    # "1k" と "1000" を同じサイズとして比較する
+    return parse_size(result["size"]), result["tool"]
+
+
+def format_header(baseline=False):
+    header = f"{'size':>6}  {'tool':<30} {'state':<8} {'wall':>11} {'peak RSS':>12}"
+    if baseline:
+        header += f" {'wall':>10} {'RSS':>10}"
+    return header
+
+
+def format_row(result, baseline=None, threshold=None):
+    row = f"{result['size']:>6}  {result['tool']:<30} {result['state']:<8}"
+    row += f" {result['wall']:>9.2f} s {result['rss_mb']:>9.1f} MB"
+    if baseline is not None:
+        base = baseline.get(result_key(result))
+        if base is None or base["state"] != "ok" or result["state"] != "ok":
+            row += "         -          -"
+        else:
+            wall_ratio = result["wall"] / base["wall"] if base["wall"] > 0 else 1.0
+            rss_ratio = result["rss_mb"] / base["rss_mb"] if base["rss_mb"] > 0 else 1.0
+            row += f"   x{wall_ratio:>6.2f}{'!' if wall_ratio > threshold else ' '}"
+            row += f"  x{rss_ratio:>6.2f}{'!' if rss_ratio > threshold else ' '}"
+    return row
+
+
+def find_regressions(report, baseline, threshold):
+    regressions = []
+    for result in report["results"]:
+        base = baseline.get(result_key(result))
+        if base is None or base["state"] != "ok":
+            continue
+        if result["state"] != "ok":
+            regressions.append((result, "state"))
+            continue
+        if base["wall"] > 0 and result["wall"] / base["wall"] > threshold:
+            regressions.append((result, "wall"))
+        if base["rss_mb"] > 0 and result["rss_mb"] / base["rss_mb"] > threshold:
+            regressions.append((result, "rss"))
+    return regressions
+
+
+def load_baseline(path):
+    with open(path, encoding="utf-8") as f:
+        report = json.load(f)
+    return {result_key(r): r for r in report["results"]}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure wall time and peak RSS of every map_utils tool on synthetic maps.")
+    parser.add_argument("--sizes", nargs="+", default=["1k", "10k", "100k"], help="Map sizes in nodes (e.g. 1k 100k 10M)")
+    parser.add_argument("--tools", nargs="+", choices=TOOL_NAMES, help="Tools to run (default: all)")
+    parser.add_argument("--seed", type=int, default=0, help="Random seed for the generated maps")
+    parser.add_argument("--repeat", type=int, default=1, help="Runs per tool; the fastest run is reported")
+    parser.add_argument("--timeout", type=float, default=1800, help="Timeout per run in seconds (0 to disable)")
+    parser.add_argument("--workdir", default="benchmark_work", help="Directory for generated maps, outputs and logs")
+    parser.add_argument("--no-snapshot", dest="snapshot", action="store_false", help="Disable the load_osm snapshot cache")
+    parser.add_argument("--json", help="Write the results to this JSON file")
+    parser.add_argument("--baseline", help="JSON file from a previous run to compare against")
+    parser.add_argument("--threshold", type=float, default=1.2, help="Ratio to the baseline reported as a regression")
+    args = parser.parse_args()
+
+    report = run_benchmark(args)
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+        print(f"Results written to: {args.json}")
+
+    if args.baseline:
+        baseline = load_baseline(args.baseline)
+        print()
+        print(f"=== compared with {args.baseline} (threshold x{args.threshold}) ===")
+        print(format_header(baseline=True))
+        for result in report["results"]:
+            print(format_row(result, baseline, args.threshold))
+        regressions = find_regressions(report, baseline, args.threshold)
+        if regressions:
+            print()
+            print("Regressions:")
+            for result, kind in regressions:
+                print(f"  {result['size']} {result['tool']}: {kind}")
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,38 +1,21 @@
-import xml.etree.ElementTree as ET
+import os
 import sys
 
-def find_unreferenced_crosswalk_lanelets(osm_file):
-    tree = ET.parse(osm_file)
-    root = tree.getroot()
-
-    # crosswalk lanelet relation の ID を収集
-    lanelet_crosswalk_ids = set()
-    for relation in root.findall("relation"):
-        tags = {tag.get("k"): tag.get("v") for tag in relation.findall("tag")}
-        if tags.get("type") == "lanelet" and tags.get("subtype") == "crosswalk":
-            lanelet_crosswalk_ids.add(relation.get("id"))
-
-    # regulatory_element crosswalk が参照している relation の ID を収集
-    referenced_ids = set()
-    for relation in root.findall("relation"):
-        tags = {tag.get("k"): tag.get("v") for tag in relation.findall("tag")}
-        if tags.get("type") == "regulatory_element" and tags.get("subtype") == "crosswalk":
-            for member in relation.findall("member"):
-                if member.get("type") == "relation" and member.get("role") == "refers":
-                    referenced_ids.add(member.get("ref"))
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from osm_common.profiler import init_profiler
+from osm_common.rules import CrosswalkRegulatoryRule
+from osm_common.validator import run_rules
 
-    # 一度も参照されていない lanelet crosswalk を抽出
-    unreferenced_ids = lanelet_crosswalk_ids - referenced_ids
-
-    # 結果表示
-    if unreferenced_ids:
-        print("一度も参照されていない crosswalk lanelet relation の ID:")
-        for rid in sorted(unreferenced_ids, key=int):
-            print(rid)
-    else:
-        print("すべての crosswalk lanelet は regulatory_element から参照されています。")
+def find_unreferenced_crosswalk_lanelets(osm_file):
+    # crosswalk lanelet relation のうち regulatory_element crosswalk から
+    # 一度も参照されていないものを抽出して表示
+    rule = CrosswalkRegulatoryRule()
+    run_rules(osm_file, [rule])
+    for line in rule.report():
+        print(line)
 
 if __name__ == "__main__":
+    init_profiler("check_crosswalk_regulatory")
     if len(sys.argv) != 2:
         print("使用方法: python script_name.py input.osm")
         sys.exit(1)
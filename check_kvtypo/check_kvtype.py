@@ -1,50 +1,20 @@
-import xml.etree.ElementTree as ET
 import argparse
+import os
+import sys
 
-def load_exclusion_list(filepath):
-    """除外リストファイルを読み込んでセットとして返す"""
-    try:
-        with open(filepath, 'r', encoding='utf-8') as f:
-            return set(line.strip() for line in f if line.strip())
-    except FileNotFoundError:
-        print(f"Warning: Exclusion file '{filepath}' not found. Ignoring.")
-        return set()
-
-def is_numeric(value):
-    """数値データかどうかを判定する"""
-    try:
-        float(value)
-        return True
-    except ValueError:
-        return False
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from osm_common.profiler import init_profiler
+from osm_common.rules import KvTypoRule, load_exclusion_list
+from osm_common.validator import run_rules
 
 def extract_tags(osm_file, exclude_keys, exclude_values):
-    tree = ET.parse(osm_file)
-    root = tree.getroot()
-    
-    keys = set()
-    values = set()
-    
-    for elem in root:
-        if elem.tag in {'node', 'way', 'relation'}:
-            for tag in elem.findall('tag'):
-                key = tag.get('k')
-                value = tag.get('v')
-
-                if key and key not in exclude_keys:
-                    keys.add(key)
-                if value and not is_numeric(value) and value not in exclude_values:
-                    values.add(value)
-    
-    print("Keys:")
-    for key in sorted(keys):
-        print(f"  {key}")
-    
-    print("\nValues:")
-    for value in sorted(values):
-        print(f"  {value}")
+    rule = KvTypoRule(exclude_keys, exclude_values)
+    run_rules(osm_file, [rule])
+    for line in rule.report():
+        print(line)
 
 def main():
+    init_profiler("check_kvtypo")
     parser = argparse.ArgumentParser(description="Extract tag keys and non-numeric values from an OSM file.")
     parser.add_argument("osm_file", help="Path to the OSM file")
     parser.add_argument("--exk", help="Path to exclude_keys.list", default=None)
@@ -1,7 +1,25 @@
 import os
+import sys
 import math
+import heapq
 import argparse
-import xml.etree.ElementTree as ET
+from itertools import chain
+
+import numpy as np
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from osm_common.map_edit import MapEditor
+from osm_common.orphan import format_size_report, remove_orphan_nodes
+from osm_common.osm_loader import load_osm
+from osm_common.profiler import get_profiler, init_profiler
+
+VALID_TYPES = {"line_thin", "virtual", "road_border", "stop_line", "fence", "guard_rail"}
+# dp: Douglas–Peucker, vw: Visvalingam–Whyatt（いずれも元の折れ線からのずれを eps 未満とする）
+SIMPLIFY_METHODS = ("dp", "vw")
+# vw で外すコストを元の点から直接求める区間の点数の上限（それより長い区間は上限値で見積もる）
+VW_EXACT_SPAN = 32
+# dp で距離を求める点の延べ数の上限（内部の点の数 n に対する n log2 n の倍数）。超えたら残りの区間は vw で簡略化する
+DP_WORK_FACTOR = 4
 
 def parse_args():
     parser = argparse.ArgumentParser()
@@ -10,6 +28,8 @@ def parse_args():
     parser.add_argument('--m', action='store_true')
     parser.add_argument('--cm', action='store_true')
     parser.add_argument('--mm', action='store_true')
+    parser.add_argument('--remove-orphans', action='store_true', help='Remove nodes that are no longer referenced by any way or relation')
+    parser.add_argument('--simplify', choices=SIMPLIFY_METHODS, help='Simplify whole ways keeping every removed node within eps of the result, in O(n log n) per way (dp hands the ranges left after 4 n log2 n distance evaluations to vw; vw uses an upper bound of the deviation, so it may keep more nodes than dp)')
     return parser.parse_args()
 
 def apply_unit_conversion(args):
@@ -26,122 +46,328 @@ def apply_unit_conversion(args):
         print(f"eps overwritten to {args.eps} based on unit conversion.")
     return args
 
-def load_osm_data(input_file):
-    tree = ET.parse(input_file)
-    root = tree.getroot()
-
-    nodes = {}
+def collect_target_ways(editor):
     ways = []
-    unmodified_ways = []
-    relations = []
-    meta = []
-
-    valid_types = {"line_thin", "virtual", "road_border", "stop_line", "fence", "guard_rail"}
-
-    for child in root:
-        if child.tag == 'node':
-            node_id = child.get('id')
-            try:
-                local_x = float(child.find("./tag[@k='local_x']").get('v'))
-                local_y = float(child.find("./tag[@k='local_y']").get('v'))
-                ele = float(child.find("./tag[@k='ele']").get('v'))
-                nodes[node_id] = (local_x, local_y, ele, child)
-            except:
-                continue
-        elif child.tag == 'way':
-            way_id = child.get('id')
-            nds = [nd.get('ref') for nd in child.findall('nd')]
-            tag = child.find("./tag[@k='type']")
-            type_value = tag.get('v') if tag is not None else ""
-            if type_value in valid_types:
-                ways.append((way_id, nds, type_value, child))
-            else:
-                unmodified_ways.append(child)
-        elif child.tag == 'relation':
-            relations.append(child)
-        else:
-            meta.append(child)
 
-    return nodes, ways, unmodified_ways, relations, meta
+    for way in editor.iter_ways():
+        type_value = way.tags.get("type", "")
+        if type_value in VALID_TYPES:
+            ways.append((way.id, list(way.refs), type_value))
+
+    return ways
+
+def flatten_ways(ways):
+    """
+    ways のノード参照を1本の配列にまとめ、(refs, offsets) を返す。
+    i 番目のwayのノードは refs[offsets[i]:offsets[i + 1]]
+    """
+    lengths = np.fromiter((len(nds) for _, nds, _ in ways), dtype=np.int64, count=len(ways))
+    offsets = np.zeros(len(ways) + 1, dtype=np.int64)
+    np.cumsum(lengths, out=offsets[1:])
+    refs = np.fromiter(chain.from_iterable(nds for _, nds, _ in ways), dtype=np.int64, count=int(offsets[-1]))
+    return refs, offsets
 
-def build_ref_count(ways):
-    ref_count = {}
-    for _, nds, _, _ in ways:
-        for nd in nds:
-            ref_count[nd] = ref_count.get(nd, 0) + 1
-    return ref_count
+def build_ref_count(refs):
+    """refs の各位置のノードが対象のway全体で参照される回数"""
+    _, inverse, counts = np.unique(refs, return_inverse=True, return_counts=True)
+    return counts[inverse.reshape(-1)]
+
+def node_coords(editor, node_ids):
+    """
+    ノードの座標を (N, 3) の配列で返す。存在しない・座標が欠けているノードは NaN を含む行になる
+    （editor.node_xyz が None を返すノードと同じ）。
+    """
+    node_ids = np.asarray(node_ids, dtype=np.int64)
+    nodes = editor.osm.nodes
+    ids = np.asarray(nodes.ids, dtype=np.int64)
+    xyz = np.full((len(node_ids), 3), np.nan)
+    if len(ids):
+        # IDの昇順に並べて二分探索で引く
+        order = np.argsort(ids, kind="stable")
+        pos = np.minimum(np.searchsorted(ids, node_ids, sorter=order), len(ids) - 1)
+        i = order[pos]
+        found = ids[i] == node_ids
+        for k, values in enumerate((nodes.x, nodes.y, nodes.z)):
+            xyz[found, k] = np.asarray(values, dtype=np.float64)[i[found]]
+
+    # 変更・追加・削除したノード（件数は少ない）は node_xyz で引き直す
+    overlay = set(editor.moved_nodes) | set(editor.added_nodes)
+    overlay.update(elem_id for kind, elem_id in editor.removed if kind == "node")
+    if overlay:
+        for k in np.nonzero(np.isin(node_ids, np.fromiter(overlay, dtype=np.int64, count=len(overlay))))[0]:
+            point = editor.node_xyz(int(node_ids[k]))
+            xyz[k] = np.nan if point is None else point
+    return xyz
 
 def distance_from_line(p1, p2, p3):
-    v1 = [p2[i] - p1[i] for i in range(3)]
-    v2 = [p3[i] - p1[i] for i in range(3)]
-    cross = [
-        v1[1]*v2[2] - v1[2]*v2[1],
-        v1[2]*v2[0] - v1[0]*v2[2],
-        v1[0]*v2[1] - v1[1]*v2[0]
-    ]
-    cross_norm = math.sqrt(sum(c**2 for c in cross))
-    v1_norm = math.sqrt(sum(c**2 for c in v1))
-    return cross_norm / v1_norm if v1_norm != 0 else 0
-
-def find_removable_nodes(nodes, ways, ref_count, eps):
+    """
+    p1・p2 を通る直線から p3 までの距離（p1 と p2 が一致する場合は0）。
+    各引数は (3,) または (N, 3) の配列で、(N, 3) の場合は N 組をまとめて計算する。
+    """
+    p1, p2, p3 = (np.asarray(p, dtype=np.float64) for p in (p1, p2, p3))
+    v1 = p2 - p1
+    v2 = p3 - p1
+    cross = np.stack([
+        v1[..., 1]*v2[..., 2] - v1[..., 2]*v2[..., 1],
+        v1[..., 2]*v2[..., 0] - v1[..., 0]*v2[..., 2],
+        v1[..., 0]*v2[..., 1] - v1[..., 1]*v2[..., 0]
+    ], axis=-1)
+    # 成分の2乗の和は x, y, z の順に足す（以前の逐次計算と同じ丸めにする）
+    cross_norm = np.sqrt((cross[..., 0]**2 + cross[..., 1]**2) + cross[..., 2]**2)
+    v1_norm = np.sqrt((v1[..., 0]**2 + v1[..., 1]**2) + v1[..., 2]**2)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        return np.where(v1_norm != 0, cross_norm / np.where(v1_norm != 0, v1_norm, 1), 0.0)
+
+def find_removable_nodes(editor, refs, offsets, ref_count, eps, log=print):
+    """
+    すべての対象のwayの中間ノード（両端以外）について、前後のノードとの3点をまとめて判定する。
+    他のwayと共有するノード（ref_count が1以外）・座標が無いノードを含む3点は対象外とする。
+    """
+    lengths = np.diff(offsets)
+    # 中間ノードの位置：各wayの offsets[i] + 1 〜 offsets[i + 1] - 2
+    middle_lengths = np.maximum(lengths - 2, 0)
+    owner = np.repeat(np.arange(len(lengths)), middle_lengths)
+    middle = np.arange(owner.size) - (np.cumsum(middle_lengths) - middle_lengths)[owner] + offsets[:-1][owner] + 1
+    middle = middle[ref_count[middle] == 1]
+
+    xyz = node_coords(editor, refs)
+    p1, p2, p3 = xyz[middle - 1], xyz[middle], xyz[middle + 1]
+    valid = ~(np.isnan(p1).any(axis=1) | np.isnan(p2).any(axis=1) | np.isnan(p3).any(axis=1))
+    middle, p1, p2, p3 = middle[valid], p1[valid], p2[valid], p3[valid]
+
+    error = distance_from_line(p1, p2, p3)
+    removable = error < eps
+    removable_nodes = set()
+    for n2, e in zip(refs[middle[removable]].tolist(), error[removable].tolist()):
+        removable_nodes.add(n2)
+        log(f"id:{n2}:error={e:.5e}")
+    return removable_nodes
+
+def segment_distance(points, starts, ends):
+    """点 points から線分 starts〜ends までの距離（各引数は (N, 3) の配列）"""
+    d = ends - starts
+    length2 = (d * d).sum(axis=1)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        t = np.where(length2 > 0, ((points - starts) * d).sum(axis=1) / np.where(length2 > 0, length2, 1), 0.0)
+    t = np.clip(t, 0.0, 1.0)
+    return np.linalg.norm(points - (starts + t[:, None] * d), axis=1)
+
+def _point_segment_distance(p, a, b):
+    dx, dy, dz = b[0] - a[0], b[1] - a[1], b[2] - a[2]
+    px, py, pz = p[0] - a[0], p[1] - a[1], p[2] - a[2]
+    length2 = dx*dx + dy*dy + dz*dz
+    t = 0.0
+    if length2 > 0:
+        t = min(1.0, max(0.0, (px*dx + py*dy + pz*dz) / length2))
+    px, py, pz = px - t*dx, py - t*dy, pz - t*dz
+    return math.sqrt(px*px + py*py + pz*pz)
+
+def simplify_ranges(refs, offsets, ref_count, xyz):
+    """
+    簡略化で動かせない位置（各wayの両端、他のwayと共有するノード、座標が無いノード）で
+    wayを区切り、間にノードを含む区間 (始点の位置, 終点の位置) の配列を返す。
+    """
+    lengths = np.diff(offsets)
+    fixed = (ref_count != 1) | np.isnan(xyz).any(axis=1)
+    fixed[offsets[:-1][lengths > 0]] = True
+    fixed[offsets[1:][lengths > 0] - 1] = True
+    anchors = np.nonzero(fixed)[0]
+    # 隣り合う固定点の間（同じway内で間にノードがある場合）が区間になる
+    starts, ends = anchors[:-1], anchors[1:]
+    same_way = np.searchsorted(offsets, starts, side="right") == np.searchsorted(offsets, ends, side="right")
+    keep = same_way & (ends - starts > 1)
+    return starts[keep], ends[keep]
+
+def range_positions(starts, ends):
+    """各区間の内部の位置を並べた配列と、それぞれが属する区間の番号の配列"""
+    sizes = ends - starts - 1
+    owner = np.repeat(np.arange(len(starts)), sizes)
+    first = np.cumsum(sizes) - sizes
+    return np.arange(owner.size) - first[owner] + starts[owner] + 1, owner
+
+def douglas_peucker(xyz, starts, ends, eps):
+    """
+    すべての区間を同時に Douglas–Peucker で分割し、残す位置の真偽配列を返す。
+    各段階で、分割中の区間の内部の点から区間の端点を結ぶ線分までの距離をまとめて求め、
+    最大値が eps 以上の区間をその点で2つに分ける。1段階は点の数 n に比例し、段階の数は分割の深さ
+    （通常は log n 程度、端の隣で分かれ続けると n）なので、距離を求めた点の延べ数が
+    DP_WORK_FACTOR * n log2 n を超えたら、分割中の区間は visvalingam で簡略化する（全体で O(n log n)）。
+    """
+    kept = np.zeros(len(xyz), dtype=bool)
+    kept[starts] = True
+    kept[ends] = True
+    sizes = ends - starts - 1
+    budget = DP_WORK_FACTOR * int(sizes.sum()) * int(np.max(sizes, initial=0)).bit_length()
+    while len(starts) and budget > 0:
+        position, owner = range_positions(starts, ends)
+        budget -= len(position)
+        distance = segment_distance(xyz[position], xyz[starts[owner]], xyz[ends[owner]])
+        # 区間ごとの最大値（同じ値なら先頭）の位置
+        sizes = ends - starts - 1
+        maximum = np.maximum.reduceat(distance, np.cumsum(sizes) - sizes)
+        split = maximum >= eps
+        is_max = distance == maximum[owner]
+        candidates = np.nonzero(is_max & split[owner])[0]
+        _, first_candidate = np.unique(owner[candidates], return_index=True)
+        pivots = position[candidates[first_candidate]]
+        kept[pivots] = True
+        # 分けた区間のうち、間にノードを含むものを次の段階で調べる
+        starts, ends = np.concatenate([starts[split], pivots]), np.concatenate([pivots, ends[split]])
+        more = ends - starts > 1
+        starts, ends = starts[more], ends[more]
+    if len(starts):
+        position, _ = range_positions(starts, ends)
+        kept[position] = visvalingam(xyz, starts, ends, eps)[position]
+    return kept
+
+def visvalingam(xyz, starts, ends, eps):
+    """
+    区間ごとに Visvalingam–Whyatt の順序で点を外し、残す位置の真偽配列を返す。
+    残った各線分には、それが代表する元の点（すでに外した点）の線分からの距離の上限を持たせる。
+    点 i を外すコストは新しい線分が代表する元の点の距離の上限で、元の点が VW_EXACT_SPAN 個以下なら
+    元の点から直接求め、それより多ければ前後の線分の上限の大きい方に i から新しい線分までの距離を足す
+    （三角不等式による上限）。どちらも1回の更新は定数時間なので、ヒープを使って区間の点数 n に対して
+    O(n log n) で、コストが最小の点から eps 未満である限り外す。
+    """
+    kept = np.ones(len(xyz), dtype=bool)
+    points = xyz.tolist()
+    # 前後の残っている位置（区間の外の位置は使わない）
+    prev = list(range(-1, len(xyz) - 1))
+    next_ = list(range(1, len(xyz) + 1))
+    # 位置 i から次の残っている位置までの線分が代表する元の点の距離の上限
+    bound = [0.0] * len(xyz)
+
+    def cost(i):
+        p, n = prev[i], next_[i]
+        a, b = points[p], points[n]
+        if n - p - 1 <= VW_EXACT_SPAN:
+            return max(_point_segment_distance(points[j], a, b) for j in range(p + 1, n))
+        return max(bound[p], bound[i]) + _point_segment_distance(points[i], a, b)
+
+    # 最初のコストは隣り合う2点を結ぶ線分からの距離なのでまとめて求める
+    position, _ = range_positions(starts, ends)
+    initial = segment_distance(xyz[position], xyz[position - 1], xyz[position + 1])
+    for start, end in zip(starts.tolist(), ends.tolist()):
+        lo, hi = np.searchsorted(position, (start, end))
+        current = dict(zip(position[lo:hi].tolist(), initial[lo:hi].tolist()))
+        heap = [(c, i) for i, c in current.items()]
+        heapq.heapify(heap)
+        while heap:
+            c, i = heapq.heappop(heap)
+            if current.get(i) != c:
+                continue
+            if c >= eps:
+                break
+            kept[i] = False
+            del current[i]
+            p, n = prev[i], next_[i]
+            next_[p] = n
+            prev[n] = p
+            bound[p] = c
+            for j in (p, n):
+                if j in current:
+                    current[j] = cost(j)
+                    heapq.heappush(heap, (current[j], j))
+    return kept
+
+def simplify_ways(editor, refs, offsets, ref_count, eps, method="dp", log=print):
+    """
+    対象のwayを method の方法で簡略化し、外すノードのIDの集合を返す。
+    外したノードは、残ったノードを結ぶ線分（そのノードを挟む2点の間）から eps 未満の距離にある。
+    元の折れ線の各辺は線分なので、元の折れ線全体が簡略化した折れ線から eps 未満に収まる。
+    """
+    xyz = node_coords(editor, refs)
+    starts, ends = simplify_ranges(refs, offsets, ref_count, xyz)
+    if method == "dp":
+        kept = douglas_peucker(xyz, starts, ends, eps)
+    elif method == "vw":
+        kept = visvalingam(xyz, starts, ends, eps)
+    else:
+        raise ValueError(f"Unknown simplify method: {method}")
+
+    # 外した点と、それを代表する線分（前後の残した点）との距離を記録する
+    position, _ = range_positions(starts, ends)
+    removed = position[~kept[position]]
+    kept_positions = np.nonzero(kept)[0]
+    before = kept_positions[np.searchsorted(kept_positions, removed) - 1]
+    after = kept_positions[np.searchsorted(kept_positions, removed)]
+    error = segment_distance(xyz[removed], xyz[before], xyz[after])
     removable_nodes = set()
-    for _, nds, _, _ in ways:
-        if len(nds) < 3:
-            continue
-        for i in range(1, len(nds) - 1):
-            n1, n2, n3 = nds[i-1], nds[i], nds[i+1]
-            if all(n in nodes for n in (n1, n2, n3)) and ref_count.get(n2, 0) == 1:
-                p1 = nodes[n1][:3]
-                p2 = nodes[n2][:3]
-                p3 = nodes[n3][:3]
-                error = distance_from_line(p1, p2, p3)
-                if error < eps:
-                    removable_nodes.add(n2)
-                    print(f"id:{n2}:error={error:.5e}")
+    for node_id, e in zip(refs[removed].tolist(), error.tolist()):
+        removable_nodes.add(node_id)
+        log(f"id:{node_id}:error={e:.5e}")
     return removable_nodes
 
-def update_ways(ways, removable_nodes):
+def update_ways(ways, removable_nodes, refs=None, offsets=None):
+    """
+    removable_nodes を両端以外から外したwayの (way_id, new_nds) のリストと、変更があったかを返す。
+    refs・offsets（flatten_ways の戻り値）を渡した場合は変更のあるwayだけを調べる。
+    """
+    if refs is None:
+        refs, offsets = flatten_ways(ways)
+    removed = np.isin(refs, np.fromiter(removable_nodes, dtype=np.int64, count=len(removable_nodes)))
+    # 両端のノードは外さない
+    lengths = np.diff(offsets)
+    removed[offsets[:-1][lengths > 0]] = False
+    removed[offsets[1:][lengths > 0] - 1] = False
+    counts = np.bincount(np.repeat(np.arange(len(lengths)), lengths), weights=removed, minlength=len(lengths))
+
+    # 外したあとのノード参照と各wayの位置
+    kept = refs[~removed]
+    new_offsets = offsets - np.concatenate([[0], np.cumsum(counts)]).astype(np.int64)
     updated_ways = []
-    modified = False
-    for way_id, nds, type_value, elem in ways:
-        new_nds = [nds[0]] if nds else []
-        for i in range(1, len(nds) - 1):
-            if nds[i] not in removable_nodes:
-                new_nds.append(nds[i])
-        if len(nds) >= 2:
-            new_nds.append(nds[-1])
-        if new_nds != nds:
-            modified = True
-            for nd in list(elem.findall('nd')):
-                elem.remove(nd)
-            for ref in new_nds:
-                ET.SubElement(elem, 'nd', ref=ref)
-        updated_ways.append(elem)
-    return updated_ways, modified
-
-def save_osm(input_file, nodes, updated_ways, unmodified_ways, relations, meta):
-    new_root = ET.Element("osm", generator="VMB")
-    for m in meta:
-        new_root.append(m)
-    for node_id, (_, _, _, node_elem) in nodes.items():
-        new_root.append(node_elem)
-    for way_elem in updated_ways + unmodified_ways:
-        new_root.append(way_elem)
-    for rel in relations:
-        new_root.append(rel)
+    for i in np.nonzero(counts)[0].tolist():
+        updated_ways.append((ways[i][0], kept[new_offsets[i]:new_offsets[i + 1]].tolist()))
+    return updated_ways, bool(updated_ways)
+
+def remove_collinear_nodes(editor, eps, log=print, simplify=None):
+    """
+    対象のwayから直線上にある中間ノードを外す。simplify（SIMPLIFY_METHODS）を指定した場合は
+    隣り合う3点ごとの判定の代わりにway全体を簡略化する（simplify_ways を参照）。
+    戻り値は外したノードのIDの集合と、変更したwayの (way_id, new_nds) のリスト
+    """
+    profiler = get_profiler()
+    with profiler.phase("collect_target_ways") as phase:
+        ways = collect_target_ways(editor)
+        phase.count(ways=len(ways))
+    with profiler.phase("build_ref_count") as phase:
+        refs, offsets = flatten_ways(ways)
+        ref_count = build_ref_count(refs)
+        phase.count(refs=len(refs))
+    with profiler.phase("find_removable_nodes") as phase:
+        if simplify is None:
+            removable_nodes = find_removable_nodes(editor, refs, offsets, ref_count, eps, log)
+        else:
+            removable_nodes = simplify_ways(editor, refs, offsets, ref_count, eps, simplify, log)
+        phase.count(removable=len(removable_nodes))
+    with profiler.phase("update_ways") as phase:
+        updated_ways, _ = update_ways(ways, removable_nodes, refs, offsets)
+        phase.count(updated=len(updated_ways))
+    for way_id, new_nds in updated_ways:
+        editor.set_way_refs(way_id, new_nds)
+    return removable_nodes, updated_ways
 
+def save_osm(editor, input_file, report=False):
+    # 変更した way 以外は元のファイルの内容をそのまま書き出す
     out_file = os.path.splitext(input_file)[0] + "_colinear.osm"
-    ET.ElementTree(new_root).write(out_file, encoding="UTF-8", xml_declaration=True)
+    counts = editor.write(out_file)
+    if report:
+        print(format_size_report(input_file, out_file, counts))
     print(f"Updated OSM saved to: {out_file}")
 
 def main():
+    profiler = init_profiler("find_collinear_nodes")
     args = apply_unit_conversion(parse_args())
-    nodes, ways, unmodified_ways, relations, meta = load_osm_data(args.input_file)
-    ref_count = build_ref_count(ways)
-    removable_nodes = find_removable_nodes(nodes, ways, ref_count, args.eps)
-    updated_ways, modified = update_ways(ways, removable_nodes)
-    if modified:
-        save_osm(args.input_file, nodes, updated_ways, unmodified_ways, relations, meta)
+    editor = MapEditor(load_osm(args.input_file))
+    _, updated_ways = remove_collinear_nodes(editor, args.eps, simplify=args.simplify)
+    if args.remove_orphans:
+        with profiler.phase("remove_orphan_nodes") as phase:
+            orphans = remove_orphan_nodes(editor)
+            phase.count(orphans=len(orphans))
+        print(f"removed_orphan_nodes={len(orphans)}")
+    if updated_ways or (args.remove_orphans and orphans):
+        with profiler.phase("save_osm"):
+            save_osm(editor, args.input_file, args.remove_orphans)
     else:
         print("No changes detected. Output file not written.")
 
@@ -1,104 +1,100 @@
-import xml.etree.ElementTree as ET
+import os
 import sys
-import copy
 from collections import defaultdict
-from xml.dom import minidom
-
-def parse_osm(osm_path):
-    tree = ET.parse(osm_path)
-    root = tree.getroot()
-    return tree, root
-
-def get_max_id(root):
-    max_id = 0
-    for elem in root:
-        if "id" in elem.attrib:
-            try:
-                max_id = max(max_id, int(elem.attrib["id"]))
-            except ValueError:
-                continue
-    return max_id
 
-def build_node_map(root):
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from osm_common.map_edit import MapEditor
+from osm_common.osm_loader import load_osm
+from osm_common.profiler import get_profiler, init_profiler
+
+def build_node_map(editor):
     node_map = defaultdict(set)
-    for way in root.findall("way"):
-        way_id = way.get("id")
-        for nd in way.findall("nd"):
-            node_map[way_id].add(nd.get("ref"))
+    for way in editor.iter_ways():
+        node_map[way.id].update(way.refs)
     return node_map
 
-def get_way_tags(way):
-    return {tag.get("k"): tag.get("v") for tag in way.findall("tag")}
+def build_polygon_index(editor, node_map):
+    """
+    crosswalk_polygon の way をノード集合で引けるようにする。
+    同じノード集合の way が複数ある場合はファイル上で先のものを使う。
+    """
+    polygon_index = {}
+    for way in editor.iter_ways():
+        tags = way.tags
+        if tags.get("type") != "crosswalk_polygon" or tags.get("area") != "yes":
+            continue
+        polygon_index.setdefault(frozenset(node_map.get(way.id, set())), way.id)
+    return polygon_index
 
-def find_polygon_candidate(root, left_id, right_id, node_map):
+def find_polygon_candidate(polygon_index, left_id, right_id, node_map):
     left_nodes = node_map.get(left_id, set())
     right_nodes = node_map.get(right_id, set())
     combined_nodes = left_nodes.union(right_nodes)
+    return polygon_index.get(frozenset(combined_nodes))
 
-    for way in root.findall("way"):
-        tags = get_way_tags(way)
-        if tags.get("type") != "crosswalk_polygon" or tags.get("area") != "yes":
-            continue
-        way_id = way.get("id")
-        way_nodes = node_map.get(way_id, set())
-        if combined_nodes == way_nodes:
-            return way_id
-    return None
-
-def find_unreferenced_crosswalk_lanelets(root):
+def find_unreferenced_crosswalk_lanelets(editor):
     lanelet_ids = set()
     id_to_elem = {}
-    for relation in root.findall("relation"):
-        tags = {t.get("k"): t.get("v") for t in relation.findall("tag")}
-        if tags.get("type") == "lanelet" and tags.get("subtype") == "crosswalk":
-            rid = relation.get("id")
-            lanelet_ids.add(rid)
-            id_to_elem[rid] = relation
-
     referenced_ids = set()
-    for relation in root.findall("relation"):
-        tags = {t.get("k"): t.get("v") for t in relation.findall("tag")}
-        if tags.get("type") == "regulatory_element" and tags.get("subtype") == "crosswalk":
-            for member in relation.findall("member"):
-                if member.get("type") == "relation" and member.get("role") == "refers":
-                    referenced_ids.add(member.get("ref"))
+    for relation in editor.iter_relations():
+        tags = relation.tags
+        if tags.get("type") == "lanelet" and tags.get("subtype") == "crosswalk":
+            lanelet_ids.add(relation.id)
+            id_to_elem[relation.id] = relation
+        elif tags.get("type") == "regulatory_element" and tags.get("subtype") == "crosswalk":
+            for member in relation.members:
+                if member.type == "relation" and member.role == "refers":
+                    referenced_ids.add(member.ref)
 
     return lanelet_ids - referenced_ids, id_to_elem
 
-def create_regulatory_relation(new_id, refers_id, polygon_way_id=None):
-    relation = ET.Element("relation", id=str(new_id))
-
+def create_regulatory_relation(editor, refers_id, polygon_way_id=None):
+    members = []
     if polygon_way_id:
-        ET.SubElement(relation, "member", {
-            "type": "way",
-            "role": "crosswalk_polygon",
-            "ref": polygon_way_id
-        })
+        members.append(("way", polygon_way_id, "crosswalk_polygon"))
+    members.append(("relation", refers_id, "refers"))
 
-    ET.SubElement(relation, "member", {
-        "type": "relation",
-        "role": "refers",
-        "ref": refers_id
-    })
+    return editor.add_relation(members, {"type": "regulatory_element", "subtype": "crosswalk"})
 
-    ET.SubElement(relation, "tag", {"k": "type", "v": "regulatory_element"})
-    ET.SubElement(relation, "tag", {"k": "subtype", "v": "crosswalk"})
+def get_member_way_ids(relation, role):
+    return [m.ref for m in relation.members if m.type == "way" and m.role == role]
+
+def add_crosswalk_regulatory(editor):
+    """
+    参照されていない crosswalk lanelet に regulatory_element を作成し、
+    lanelet に regulatory_element への member を追加する。
+    戻り値は作成した relation の ID のリスト
+    """
+    profiler = get_profiler()
+    with profiler.phase("build_node_map") as phase:
+        node_map = build_node_map(editor)
+        polygon_index = build_polygon_index(editor, node_map)
+        phase.count(ways=len(node_map), polygons=len(polygon_index))
+    with profiler.phase("find_unreferenced_crosswalk_lanelets") as phase:
+        unreferenced_ids, id_to_elem = find_unreferenced_crosswalk_lanelets(editor)
+        phase.count(unreferenced=len(unreferenced_ids))
 
-    return relation
+    created_ids = []
+    with profiler.phase("create_regulatory_relations") as phase:
+        for rel_id in sorted(unreferenced_ids):
+            rel = id_to_elem[rel_id]
+            left_ids = get_member_way_ids(rel, "left")
+            right_ids = get_member_way_ids(rel, "right")
+            if len(left_ids) != 1 or len(right_ids) != 1:
+                continue
 
-def get_member_way_ids(relation, role):
-    return [m.get("ref") for m in relation.findall("member") if m.get("type") == "way" and m.get("role") == role]
+            polygon_id = find_polygon_candidate(polygon_index, left_ids[0], right_ids[0], node_map)
+            new_id = create_regulatory_relation(editor, rel_id, polygon_id)
 
-def write_pretty_xml(root, output_path):
-    rough_string = ET.tostring(root, encoding="utf-8")
-    reparsed = minidom.parseString(rough_string)
-    pretty_xml = reparsed.toprettyxml(indent="  ")
-    with open(output_path, "w", encoding="utf-8") as f:
-        for line in pretty_xml.splitlines():
-            if line.strip():  # 空行を除去
-                f.write(line + "\n")
+            # 元の crosswalk relation に <member role="regulatory_element" ...> を追加
+            editor.add_relation_member(rel_id, "relation", new_id, "regulatory_element")
+
+            created_ids.append(new_id)
+        phase.count(created=len(created_ids))
+    return created_ids
 
 def main():
+    init_profiler("generate_crosswalk_regulatory")
     if len(sys.argv) != 2:
         print("Usage: python generate_crosswalk_regulatory.py input.osm")
         sys.exit(1)
@@ -106,41 +102,12 @@ def main():
     input_path = sys.argv[1]
     output_path = input_path.replace(".osm", "_crosswalk.osm")
 
-    tree, root = parse_osm(input_path)
-    original = copy.deepcopy(root)
-
-    node_map = build_node_map(root)
-    unreferenced_ids, id_to_elem = find_unreferenced_crosswalk_lanelets(root)
-    max_id = get_max_id(root)
-    new_id = max_id + 1
-    created_ids = []
-
-    for rel_id in unreferenced_ids:
-        rel = id_to_elem[rel_id]
-        left_ids = get_member_way_ids(rel, "left")
-        right_ids = get_member_way_ids(rel, "right")
-        if len(left_ids) != 1 or len(right_ids) != 1:
-            continue
+    editor = MapEditor(load_osm(input_path))
+    created_ids = add_crosswalk_regulatory(editor)
 
-        polygon_id = find_polygon_candidate(root, left_ids[0], right_ids[0], node_map)
-        regulatory_relation = create_regulatory_relation(new_id, rel_id, polygon_id)
-        root.append(regulatory_relation)
-
-        # 元の crosswalk relation に <member role="regulatory_element" ...> を追加
-        ET.SubElement(rel, "member", {
-            "type": "relation",
-            "role": "regulatory_element",
-            "ref": str(new_id)
-        })
-
-        created_ids.append(new_id)
-        new_id += 1
-
-    # 差分検出と出力
-    new_data = ET.tostring(root, encoding="unicode")
-    old_data = ET.tostring(original, encoding="unicode")
-    if new_data != old_data:
-        write_pretty_xml(root, output_path)
+    # 差分検出と出力（変更した relation 以外は元のファイルの内容をそのまま書き出す）
+    if created_ids:
+        editor.write(output_path)
         print(f"[更新されたファイル] {output_path}")
         print("=== 作成された relation ID ===")
         for i in created_ids:
@@ -1,8 +1,12 @@
-import xml.etree.ElementTree as ET
 import argparse
 import os
+import sys
 from collections import defaultdict
 
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from osm_common.osm_loader import load_osm
+from osm_common.profiler import get_profiler, init_profiler
+
 def normalize_polygon(nodes):
     """
     ノードIDのリストをソートし、循環的な等価性を考慮して比較可能な形にする。
@@ -12,53 +16,41 @@ def normalize_polygon(nodes):
     min_index = min(range(len(nodes)), key=lambda i: nodes[i])
     return tuple(nodes[min_index:] + nodes[:min_index])
 
-def find_referenced_nodes(osm_file):
-    tree = ET.parse(osm_file)
-    root = tree.getroot()
-    
+def find_referenced_nodes(osm):
+    """osm は load_osm の戻り値または MapEditor"""
     ways_dict = {}
     max_way_id = -1
     existing_polygons = set()
     
-    for way in root.findall('way'):
-        way_id = int(way.get('id'))
-        nodes = [nd.get('ref') for nd in way.findall('nd')]
+    for way in osm.iter_ways():
+        way_id = way.id
+        nodes = [str(ref) for ref in way.refs]
         ways_dict[way_id] = nodes
         max_way_id = max(max_way_id, way_id)
         
-        for tag in way.findall('tag'):
-            if tag.get('k') == 'type' and tag.get('v') == 'crosswalk_polygon':
-                existing_polygons.add(normalize_polygon(nodes))
+        if way.tags.get('type') == 'crosswalk_polygon':
+            existing_polygons.add(normalize_polygon(nodes))
     
     relations_dict = defaultdict(lambda: {'left': [], 'right': []})
     
-    for relation in root.findall('relation'):
-        has_type_lanelet = False
-        has_subtype_crosswalk = False
-        
-        for tag in relation.findall('tag'):
-            if tag.get('k') == 'type' and tag.get('v') == 'lanelet':
-                has_type_lanelet = True
-            if tag.get('k') == 'subtype' and tag.get('v') == 'crosswalk':
-                has_subtype_crosswalk = True
-        
-        if has_type_lanelet and has_subtype_crosswalk:
-            relation_id = relation.get('id')
-            for member in relation.findall('member'):
-                if member.get('type') == 'way':
-                    if member.get('role') == 'left':
-                        relations_dict[relation_id]['left'].append(member.get('ref'))
-                    elif member.get('role') == 'right':
-                        relations_dict[relation_id]['right'].append(member.get('ref'))
+    for relation in osm.iter_relations():
+        tags = relation.tags
+        if tags.get('type') == 'lanelet' and tags.get('subtype') == 'crosswalk':
+            relation_id = str(relation.id)
+            for member in relation.members:
+                if member.type == 'way':
+                    if member.role == 'left':
+                        relations_dict[relation_id]['left'].append(member.ref)
+                    elif member.role == 'right':
+                        relations_dict[relation_id]['right'].append(member.ref)
     
     return relations_dict, ways_dict, max_way_id, existing_polygons
 
-def create_crosswalk_polygon(osm_file, relations_dict, ways_dict, start_id, existing_polygons):
-    base_name, _ = os.path.splitext(osm_file)
-    output_file = os.path.abspath(f"{base_name}_append.osm")
-    added_count = 0
-    
-    new_content = []
+def find_new_polygons(relations_dict, ways_dict, existing_polygons, log=print):
+    """
+    既存の crosswalk_polygon と同じノード構成にならない crosswalk について、
+    polygon のノードIDのリストを順に返す。
+    """
     for relation_id, refs in relations_dict.items():
         left_node_ids = []
         right_node_ids = []
@@ -78,18 +70,44 @@ def create_crosswalk_polygon(osm_file, relations_dict, ways_dict, start_id, exis
         new_polygon = normalize_polygon(left_sorted + right_sorted)
         
         if new_polygon in existing_polygons:
-            print(f"Skipping existing crosswalk_polygon for relation {relation_id}")
+            log(f"Skipping existing crosswalk_polygon for relation {relation_id}")
             continue
         
+        existing_polygons.add(new_polygon)
+        yield left_sorted + right_sorted
+
+def add_crosswalk_polygons(editor, log=print):
+    """
+    crosswalk_polygon を editor に直接追加する（パイプライン用）。
+    戻り値は追加した way の ID のリスト
+    """
+    profiler = get_profiler()
+    with profiler.phase("find_referenced_nodes") as phase:
+        relations_dict, ways_dict, _, existing_polygons = find_referenced_nodes(editor)
+        phase.count(crosswalks=len(relations_dict), existing_polygons=len(existing_polygons))
+    added_ids = []
+    with profiler.phase("create_crosswalk_polygon") as phase:
+        for node_ids in find_new_polygons(relations_dict, ways_dict, existing_polygons, log):
+            refs = [int(node_id) for node_id in node_ids]
+            added_ids.append(editor.add_way(refs, {"type": "crosswalk_polygon", "area": "yes"}))
+        phase.count(added=len(added_ids))
+    return added_ids
+
+def create_crosswalk_polygon(osm_file, relations_dict, ways_dict, start_id, existing_polygons):
+    base_name, _ = os.path.splitext(osm_file)
+    output_file = os.path.abspath(f"{base_name}_append.osm")
+    added_count = 0
+    
+    new_content = []
+    for node_ids in find_new_polygons(relations_dict, ways_dict, existing_polygons):
         new_way_id = start_id + 1
         new_content.append(f'<way id="{new_way_id}">\n')
-        for node_id in left_sorted + right_sorted:
+        for node_id in node_ids:
             new_content.append(f'    <nd ref="{node_id}"/>\n')
         new_content.append('    <tag k="type" v="crosswalk_polygon"/>\n')
         new_content.append('    <tag k="area" v="yes"/>\n')
         new_content.append('</way>\n')
         
-        existing_polygons.add(new_polygon)
         added_count += 1
         start_id += 1
     
@@ -101,10 +119,14 @@ def create_crosswalk_polygon(osm_file, relations_dict, ways_dict, start_id, exis
         print("No new crosswalk_polygon added. Output file was not created.")
 
 if __name__ == "__main__":
+    profiler = init_profiler("make_crosswalk_polygon")
     parser = argparse.ArgumentParser(description="Create crosswalk_polygon from OSM relations with type 'lanelet' and subtype 'crosswalk'.")
     parser.add_argument("osm_file", help="Path to the OSM file")
     args = parser.parse_args()
 
-    relations_dict, ways_dict, max_way_id, existing_polygons = find_referenced_nodes(args.osm_file)
-    create_crosswalk_polygon(args.osm_file, relations_dict, ways_dict, max_way_id, existing_polygons)
+    with profiler.phase("find_referenced_nodes") as phase:
+        relations_dict, ways_dict, max_way_id, existing_polygons = find_referenced_nodes(load_osm(args.osm_file))
+        phase.count(crosswalks=len(relations_dict), existing_polygons=len(existing_polygons))
+    with profiler.phase("create_crosswalk_polygon"):
+        create_crosswalk_polygon(args.osm_file, relations_dict, ways_dict, max_way_id, existing_polygons)
 
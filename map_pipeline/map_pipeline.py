@@ -0,0 +1,116 @@
+import argparse
+import os
+import sys
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from find_collinear_nodes.find_collinear_nodes import SIMPLIFY_METHODS, remove_collinear_nodes
+from generate_crosswalk_regulatory.generate_crosswalk_regulatory import add_crosswalk_regulatory
+from make_crosswalk_polygon.make_crosswalk_polygon import add_crosswalk_polygons
+from modify_lrdiff_lane.modify_lrdiff_lane import ENGINES, correct_lrdiff_lanes
+from osm_common.map_edit import MapEditor
+from osm_common.orphan import format_size_report, remove_orphan_nodes
+from osm_common.osm_loader import load_osm
+from osm_common.profiler import init_profiler
+from remove_dummy_relations.remove_dummy_relations import remove_dummy_relations
+
+# 地図リリース時に各スクリプトを実行する順序
+STAGES = [
+    "remove_dummy_relations",
+    "find_collinear_nodes",
+    "modify_lrdiff_lane",
+    "make_crosswalk_polygon",
+    "generate_crosswalk_regulatory",
+]
+# --remove-orphans を指定した場合に最後に実行する
+ORPHAN_STAGE = "remove_orphan_nodes"
+
+def run_stage(name, editor, args, log):
+    """ステージを editor に適用し、変更件数の辞書を返す"""
+    if name == "remove_dummy_relations":
+        removed = remove_dummy_relations(editor)
+        for rel_id in removed:
+            log(f"削除: relation id={rel_id}")
+        return {"removed_relations": len(removed)}
+    if name == ORPHAN_STAGE:
+        removed = remove_orphan_nodes(editor)
+        for node_id in removed:
+            log(f"削除: node id={node_id}")
+        return {"removed_nodes": len(removed)}
+    if name == "find_collinear_nodes":
+        removable_nodes, updated_ways = remove_collinear_nodes(editor, args.eps, log, args.simplify)
+        return {"removed_nodes": len(removable_nodes), "modified_ways": len(updated_ways)}
+    if name == "modify_lrdiff_lane":
+        osm = correct_lrdiff_lanes(editor, log, args.lrdiff_engine)
+        return {
+            "modified_relations": len(osm.modified_relations),
+            "modified_ways": len(osm.modified_ways),
+            "added_nodes": len(osm.added_nodes),
+        }
+    if name == "make_crosswalk_polygon":
+        added = add_crosswalk_polygons(editor, log)
+        return {"added_polygons": len(added)}
+    if name == "generate_crosswalk_regulatory":
+        created = add_crosswalk_regulatory(editor)
+        for rel_id in created:
+            log(f"作成: relation id={rel_id}")
+        return {"created_regulatory_elements": len(created)}
+    raise ValueError(f"Unknown stage: {name}")
+
+def generate_output_filename(input_file):
+    base, ext = os.path.splitext(input_file)
+    output_file = base + "_pipeline" + ext
+    counter = 1
+    while os.path.exists(output_file):
+        output_file = f"{base}_pipeline_{counter}{ext}"
+        counter += 1
+    return output_file
+
+def main():
+    profiler = init_profiler("map_pipeline")
+    parser = argparse.ArgumentParser(description="Apply the map release transforms in memory with a single load and a single write.")
+    parser.add_argument("osm_file", help="Path to the OSM file")
+    parser.add_argument("--stages", nargs="+", choices=STAGES, help="Stages to run (default: all, always in release order)")
+    parser.add_argument("--eps", type=float, default=1e-15, help="Tolerance (in meters) for find_collinear_nodes")
+    parser.add_argument("--simplify", choices=SIMPLIFY_METHODS, help="Simplify whole ways in find_collinear_nodes (see find_collinear_nodes)")
+    parser.add_argument("--lrdiff-engine", choices=ENGINES, default="nearest", help="How modify_lrdiff_lane places the inserted nodes (default: nearest)")
+    parser.add_argument("--remove-orphans", action="store_true", help="Finally remove nodes that are not referenced by any way or relation")
+    parser.add_argument("-o", "--output", help="Output OSM file (default: <input>_pipeline.osm)")
+    parser.add_argument("--verbose", action="store_true", help="Print the messages of each stage")
+    args = parser.parse_args()
+
+    if not os.path.exists(args.osm_file):
+        print(f"File not found: {args.osm_file}")
+        sys.exit(1)
+
+    selected = set(args.stages or STAGES)
+    stages = [name for name in STAGES if name in selected]
+    if args.remove_orphans:
+        stages.append(ORPHAN_STAGE)
+    log = print if args.verbose else (lambda *a, **k: None)
+
+    editor = MapEditor(load_osm(args.osm_file))
+
+    results = []
+    for name in stages:
+        with profiler.phase(name) as phase:
+            counts = run_stage(name, editor, args, log)
+            phase.count(**counts)
+        results.append((name, counts))
+
+    print("=== pipeline ===")
+    for name, counts in results:
+        print(f"{name}: " + ", ".join(f"{k}={v}" for k, v in counts.items()))
+
+    if not any(v for _, counts in results for v in counts.values()):
+        print("変更はありませんでした。")
+        return
+
+    output_file = args.output or generate_output_filename(args.osm_file)
+    with profiler.phase("write_osm"):
+        counts = editor.write(output_file)
+    if args.remove_orphans:
+        print(format_size_report(args.osm_file, output_file, counts))
+    print(f"出力ファイル: {output_file}")
+
+if __name__ == "__main__":
+    main()
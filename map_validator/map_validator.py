@@ -0,0 +1,136 @@
+import argparse
+import json
+import os
+import sys
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from osm_common.batch import expand_paths, run_batch
+from osm_common.profiler import init_profiler
+from osm_common.rules import (
+    CrosswalkRegulatoryRule,
+    KvTypoRule,
+    RelationNodeCountRule,
+    SignalConfigRule,
+    SpeedLimitRule,
+    load_exclusion_list,
+)
+from osm_common.validator import run_rules
+
+RULE_NAMES = [
+    CrosswalkRegulatoryRule.name,
+    SignalConfigRule.name,
+    KvTypoRule.name,
+    RelationNodeCountRule.name,
+    SpeedLimitRule.name,
+]
+
+def build_rules(args, exclude_keys, exclude_values):
+    rules = {
+        CrosswalkRegulatoryRule.name: CrosswalkRegulatoryRule(),
+        SignalConfigRule.name: SignalConfigRule(),
+        KvTypoRule.name: KvTypoRule(exclude_keys, exclude_values),
+        RelationNodeCountRule.name: RelationNodeCountRule(),
+        SpeedLimitRule.name: SpeedLimitRule(args.lower, args.upper),
+    }
+    selected = args.rules or RULE_NAMES
+    return [rules[name] for name in selected]
+
+def validate_file(path, args, exclude_keys, exclude_values):
+    """1ファイル分のチェック。バッチ処理ではワーカーのプロセスで実行される"""
+    if not os.path.exists(path):
+        raise FileNotFoundError(f"File not found: {path}")
+    report = run_rules(path, build_rules(args, exclude_keys, exclude_values))
+    return {
+        "lines": report.lines(),
+        "counts": {rule.name: rule.count() for rule in report.rules},
+    }
+
+def summary_lines(results, rule_names):
+    width = max(len(result.path) for result in results)
+    lines = [
+        "=== summary ===",
+        f"{'file':<{width}} {'state':<6} {'time[s]':>8}  " + "  ".join(rule_names),
+    ]
+    for result in results:
+        row = f"{result.path:<{width}} {'ok' if result.ok else 'failed':<6} {result.seconds:>8.2f}"
+        if result.ok:
+            row += "  " + "  ".join(f"{result.value['counts'][name]:>{len(name)}}" for name in rule_names)
+        lines.append(row.rstrip())
+    failed = sum(1 for result in results if not result.ok)
+    lines.append(f"{len(results)} files, {failed} failed")
+    return lines
+
+def write_json(path, results):
+    data = [
+        {
+            "path": result.path,
+            "ok": result.ok,
+            "seconds": result.seconds,
+            "counts": result.value["counts"] if result.ok else None,
+            "report": result.value["lines"] if result.ok else None,
+            "error": result.error,
+        }
+        for result in results
+    ]
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(data, f, ensure_ascii=False, indent=2)
+
+def main():
+    init_profiler("map_validator")
+    parser = argparse.ArgumentParser(description="Run all map checks on OSM files with a single parse per file.")
+    parser.add_argument("osm_files", nargs="*", help="Paths or glob patterns of the OSM files")
+    parser.add_argument("--list", help="Text file listing OSM files (one path or glob per line)")
+    parser.add_argument("--jobs", "-j", type=int, default=os.cpu_count() or 1, help="Number of worker processes when checking several files")
+    parser.add_argument("--json", help="Write the per-file results to this JSON file")
+    parser.add_argument("--rules", nargs="+", choices=RULE_NAMES, help="Rules to run (default: all)")
+    parser.add_argument("--exk", help="Path to exclude_keys.list for check_kvtypo", default=None)
+    parser.add_argument("--exv", help="Path to exclude_values.list for check_kvtypo", default=None)
+    parser.add_argument("--lower", type=float, default=10, help="Lower bound of speed_limit for find_lanelet_speed_limit")
+    parser.add_argument("--upper", type=float, default=10, help="Upper bound of speed_limit for find_lanelet_speed_limit")
+    args = parser.parse_args()
+
+    paths = expand_paths(args.osm_files, args.list)
+    if not paths:
+        parser.error("no OSM files given")
+
+    exclude_keys = load_exclusion_list(args.exk) if args.exk else set()
+    exclude_values = load_exclusion_list(args.exv) if args.exv else set()
+
+    if len(paths) == 1 and not os.path.exists(paths[0]):
+        print(f"File not found: {paths[0]}")
+        sys.exit(1)
+
+    results = run_batch(paths, validate_file, (args, exclude_keys, exclude_values), args.jobs)
+    if len(paths) == 1:
+        # 1ファイルの場合はこれまでどおりレポートだけを表示する
+        result = results[0]
+        print("\n".join(result.value["lines"]) if result.ok else result.error.rstrip())
+        if args.json:
+            write_json(args.json, results)
+        if not result.ok:
+            sys.exit(1)
+        return
+
+    for result in results:
+        print(f"##### {result.path} #####")
+        if result.ok:
+            for line in result.value["lines"]:
+                print(line)
+        else:
+            # トレースバック全体は --json の出力に残す
+            print("Error: " + result.error.rstrip().splitlines()[-1])
+        print()
+
+    rule_names = args.rules or RULE_NAMES
+    for line in summary_lines(results, rule_names):
+        print(line)
+
+    if args.json:
+        write_json(args.json, results)
+        print(f"Results written to: {args.json}")
+
+    if not all(result.ok for result in results):
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -1,25 +1,38 @@
-import xml.etree.ElementTree as ET
 import sys
 import os
 import math
+import argparse
 from collections import defaultdict
 
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from osm_common.map_edit import MapEditor
+from osm_common.osm_loader import COORD_KEYS, load_osm
+from osm_common.profiler import get_profiler, init_profiler
+
+# 挿入位置の求め方（nearest: 従来の総当たりの最近傍、arclength: 弧長による線形時間の対応付け）
+ENGINES = ("nearest", "arclength")
+#一致されると管理上面倒なので、挿入する点は線分の端点からわずかにずらす
+SEGMENT_EPSILON = 1e-10
+
 class OSMManager:
-    def __init__(self, tree: ET.ElementTree):
-        self.tree = tree
-        self.root = tree.getroot()
+    def __init__(self, editor):
+        # 変更を保持する地図（MapEditor）。元の地図は editor.osm で読み取り専用
+        self.editor = editor
+        self.osm = editor.osm
 
         # 最大ID管理
         self.max_node_id = 0
         self.max_way_id = 0
         self.max_rel_id = 0
 
-        # 要素辞書（ID:str -> XML要素）
-        self.nodes = {}
-        self.ways = {}
+        # リレーション（ID:str -> Relation）
         self.relations = {}
+        # リレーションの順序（ID:str -> 読み込んだ順の番号）
+        self.relation_order = {}
+        # ウェイをmemberに持つリレーションの逆引き（way_id:str -> {rel_id:str}）
+        self.way_relations = defaultdict(set)
 
-        # ノード情報辞書（id:str -> dict(x,y,zなど)）
+        # 追加・更新したノードの情報（id:str -> dict(x,y,zなど)）
         self.node_data = {}
 
         # 追加物管理（IDセット）
@@ -27,57 +40,52 @@ class OSMManager:
         self.modified_relations = set()
         self.added_nodes = set()
 
-        self._init_from_tree()
+        self._init_from_osm()
+
+    def _init_from_osm(self):
+        osm = self.osm
+        editor = self.editor
 
-    def _init_from_tree(self):
-        # ノードを読み込み最大ID更新
-        for node in self.root.findall("node"):
-            nid = node.get("id")
-            self.nodes[nid] = node
-            self.max_node_id = max(self.max_node_id, int(nid))
-            self.node_data[nid] = self.extract_node_data(node)
+        # ノードの座標を確認し最大ID更新
+        for i in range(len(osm.nodes)):
+            self.extract_node_data(i)
+        self.max_node_id = max(list(osm.nodes.ids) + list(editor.added_nodes), default=0)
 
-        # ウェイを読み込み最大ID更新
-        for way in self.root.findall("way"):
-            wid = way.get("id")
-            self.ways[wid] = way
-            self.max_way_id = max(self.max_way_id, int(wid))
+        # ウェイの最大ID更新
+        self.max_way_id = max(list(osm.ways.ids) + list(editor.added_ways), default=0)
 
         # リレーションを読み込み最大ID更新
-        for rel in self.root.findall("relation"):
-            rid = rel.get("id")
-            self.relations[rid] = rel
-            self.max_rel_id = max(self.max_rel_id, int(rid))
+        for rel in editor.iter_relations():
+            self._set_relation(str(rel.id), rel)
+        self.max_rel_id = max(list(osm.relations.ids) + list(editor.added_relations), default=0)
 
-    def extract_node_data(self, node_elem):
+    def extract_node_data(self, i):
         """
-        ノード要素から local_x, local_y, ele を抽出して (x, y, z) にマッピング。
+        ノードの座標配列から local_x, local_y, ele を抽出して (x, y, z) にマッピング。
         必須タグが存在しない場合は例外を発生させる。
         """
-        x = y = z = None
-        for tag in node_elem.findall("tag"):
-            k = tag.get("k")
-            v = tag.get("v")
-            if k == "local_x":
-                x = float(v)
-            elif k == "local_y":
-                y = float(v)
-            elif k == "ele":
-                z = float(v)
-
-        missing = []
-        if x is None:
-            missing.append("local_x")
-        if y is None:
-            missing.append("local_y")
-        if z is None:
-            missing.append("ele")
+        nodes = self.osm.nodes
+        x, y, z = nodes.xyz(i)
+
+        missing = [key for key, v in zip(COORD_KEYS, (x, y, z)) if math.isnan(v)]
 
         if missing:
-            raise ValueError(f"Node ID {node_elem.get('id')} is missing required tags: {', '.join(missing)}")
+            raise ValueError(f"Node ID {nodes.ids[i]} is missing required tags: {', '.join(missing)}")
 
         return {"x": x, "y": y, "z": z}
 
+    def get_node_data(self, node_id):
+        """
+        ノード情報 {'x', 'y', 'z'} を取得
+        """
+        data = self.node_data.get(node_id)
+        if data is not None:
+            return data
+        xyz = self.editor.node_xyz(int(node_id))
+        if xyz is None:
+            raise KeyError(node_id)
+        return {"x": xyz[0], "y": xyz[1], "z": xyz[2]}
+
     def get_new_node_id(self):
         self.max_node_id += 1
         return str(self.max_node_id)
@@ -93,19 +101,13 @@ class OSMManager:
     # --- ノード操作 ---
     def add_node(self, node_info):
         """
-        新ノードを追加し、XMLツリー・辞書を同期。
+        新ノードを追加し、出力用の変更・辞書を同期。
         node_info: {'x': float, 'y': float, 'z': float}
         lat/lon は空文字とし、local_x, local_y, ele をタグに記録。
         """
         new_id = self.get_new_node_id()
-        node_elem = ET.Element("node", id=str(new_id), lat="", lon="")  # 必須属性のみ指定
+        self.editor.add_node(node_info["x"], node_info["y"], node_info.get("z", 0), node_id=int(new_id))
 
-        ET.SubElement(node_elem, "tag", k="local_x", v=str(node_info["x"]))
-        ET.SubElement(node_elem, "tag", k="local_y", v=str(node_info["y"]))
-        ET.SubElement(node_elem, "tag", k="ele", v=str(node_info.get("z", 0)))
-
-        self.root.append(node_elem)
-        self.nodes[new_id] = node_elem
         self.node_data[new_id] = node_info
         self.added_nodes.add(new_id)
         return new_id
@@ -114,24 +116,10 @@ class OSMManager:
         """
         ノード情報を更新（local_x, local_y, ele）
         """
-        if node_id not in self.nodes:
+        if self.editor.node_xyz(int(node_id)) is None:
             return False
-        node_elem = self.nodes[node_id]
-        node_elem.set("lat", "")
-        node_elem.set("lon", "")
-
-        # local_x, local_y, ele のタグを更新
-        def set_or_create_tag(k, v):
-            for tag in node_elem.findall("tag"):
-                if tag.get("k") == k:
-                    tag.set("v", str(v))
-                    return
-            ET.SubElement(node_elem, "tag", k=k, v=str(v))
-
-        set_or_create_tag("local_x", node_info["x"])
-        set_or_create_tag("local_y", node_info["y"])
-        set_or_create_tag("ele", node_info.get("z", 0))
 
+        self.editor.set_node_xyz(int(node_id), node_info["x"], node_info["y"], node_info.get("z", 0))
         self.node_data[node_id] = node_info
         return True
 
@@ -141,60 +129,98 @@ class OSMManager:
         """
         指定ウェイのノードIDリストを取得
         """
-        way_elem = self.ways.get(way_id)
-        if way_elem is None:
+        way = self.editor.way_by_id(int(way_id))
+        if way is None:
             return None
-        return [nd.get("ref") for nd in way_elem.findall("nd")]
+        return [str(ref) for ref in way.refs]
 
     def set_way_nodes(self, way_id, node_refs):
         """
-        ウェイのノード参照リストを更新しXMLも同期
+        ウェイのノード参照リストを更新（XMLへの反映は write で行う）
         """
-        way_elem = self.ways.get(way_id)
-        if way_elem is None:
+        if self.editor.way_by_id(int(way_id)) is None:
             return False
-        # 既存ndを削除
-        for nd in list(way_elem.findall("nd")):
-            way_elem.remove(nd)
-        # 新規ndを追加
-        for ref in node_refs:
-            ET.SubElement(way_elem, "nd", ref=ref)
+        self.editor.set_way_refs(int(way_id), [int(ref) for ref in node_refs])
         return True
 
     def insert_node_to_way(self, way_id, after_node_id, new_node_id):
         """
         指定ノードの直後に新ノードを挿入
         """
+        return bool(self.insert_nodes_to_way(way_id, [(after_node_id, new_node_id)]))
+
+    def insert_nodes_to_way(self, way_id, insertions):
+        """
+        insertions（(after_node_id, new_node_id) の並び）の新ノードをまとめてウェイに挿入し、
+        挿入した新ノードのIDのリストを返す。同じノードの直後に挿入する新ノードは insertions の順に並ぶ
+        （同じノードがウェイに複数回現れる場合は最初の位置）。ウェイのノード列を1回走査して組み立て、
+        set_way_nodes で1回だけ反映する。ウェイに含まれないノードの直後への挿入は行わない。
+        """
         nodes = self.get_way_nodes(way_id)
         if nodes is None:
-            return False
-        try:
-            idx = nodes.index(after_node_id)
-        except ValueError:
-            return False
-        nodes.insert(idx + 1, new_node_id)
-        return self.set_way_nodes(way_id, nodes)
+            return []
+        following = defaultdict(list)
+        for after_node_id, new_node_id in insertions:
+            following[after_node_id].append(new_node_id)
+
+        merged = []
+        inserted = []
+        for node_id in nodes:
+            merged.append(node_id)
+            new_node_ids = following.pop(node_id, None)
+            if new_node_ids:
+                merged.extend(new_node_ids)
+                inserted.extend(new_node_ids)
+        if inserted and not self.set_way_nodes(way_id, merged):
+            return []
+        return inserted
 
     # --- リレーション操作 ---
+    def _set_relation(self, rel_id, rel):
+        """リレーションを登録・更新し、ウェイからの逆引きに member のウェイを追加する"""
+        self.relations[rel_id] = rel
+        self.relation_order.setdefault(rel_id, len(self.relation_order))
+        for member in rel.members:
+            if member.type == "way":
+                self.way_relations[str(member.ref)].add(rel_id)
+
+    def relations_using_ways(self, way_ids, exclude=None):
+        """
+        way_ids のいずれかをmemberに持つリレーションのID（exclude を除く）をリレーションの順序で返す。
+        逆引きを使うので、リレーション全体を走査せずに済む。
+        """
+        rel_ids = set()
+        for way_id in way_ids:
+            rel_ids.update(self.way_relations.get(way_id, ()))
+        rel_ids.discard(exclude)
+        return sorted(rel_ids, key=self.relation_order.__getitem__)
+
     def get_relation_members(self, rel_id):
         """
-        指定リレーションのmember要素のリストを取得
+        指定リレーションのmemberのリストを取得
         """
-        rel_elem = self.relations.get(rel_id)
-        if rel_elem is None:
+        rel = self.relations.get(rel_id)
+        if rel is None:
             return None
-        return list(rel_elem.findall("member"))
+        return list(rel.members)
 
     def add_relation_member(self, rel_id, member_type, ref, role):
         """
         リレーションにメンバーを追加
         """
-        rel_elem = self.relations.get(rel_id)
-        if rel_elem is None:
+        if rel_id not in self.relations:
             return False
-        ET.SubElement(rel_elem, "member", type=member_type, ref=ref, role=role)
+        self.editor.add_relation_member(int(rel_id), member_type, int(ref), role)
+        self._set_relation(rel_id, self.editor.relation_by_id(int(rel_id)))
         return True
 
+    # --- 出力 ---
+    def write(self, output_path):
+        """
+        元ファイルを流しながら変更した要素だけを差し替えて書き出す
+        """
+        return self.editor.write(output_path)
+
     # 必要に応じて他メソッドも追加してください
 
 def distance(a, b):
@@ -216,9 +242,7 @@ def project_onto_segment(p, a, b):
         return a, 0
 
     t = sum(ap[i] * ab[i] for i in range(3)) / ab_len_sq
-    #一致されると管理上面倒なのでわずかにずらす
-    epsilon = 1e-10
-    t_clamped = max(epsilon, min(1.0 - epsilon, t))
+    t_clamped = max(SEGMENT_EPSILON, min(1.0 - SEGMENT_EPSILON, t))
 
     proj = {
         "x": ax + ab[0] * t_clamped,
@@ -227,19 +251,154 @@ def project_onto_segment(p, a, b):
     }
     return proj, t_clamped
 
-def extract_node_data(node):
-    tags = {tag.get("k"): tag.get("v") for tag in node.findall("tag")}
-    return {
-        "x": tags.get("local_x", "0"),
-        "y": tags.get("local_y", "0"),
-        "z": tags.get("ele", "0")
-    }
-
-def parse_osm_and_correct(file_path):
-    tree = ET.parse(file_path)
-    osm = OSMManager(tree)  # OSMManagerクラスのインスタンス化
+def insert_nodes_nearest(osm, fewer_way, fewer_nodes, more_nodes, log=print):
+    """
+    fewer_nodes の中間ノードごとに more_nodes の中間ノードから最も近いものを総当たりで対応付け、
+    対応しなかった more_nodes のノードを fewer_way の最も近い線分に射影した位置に挿入する。
+    挿入したノードは以降の射影の対象に含めるため fewer_nodes の複製に順に挿入し、
+    ウェイには最後に1回だけ反映する。挿入したノードの数を返す。
+    """
+    # fewer_nodes から closest more_nodes を探し、対応済みにする
+    # 距離が同じ場合の選択や挿入の順序が実行ごとに変わらないよう、more_nodes の並び順で走査する
+    candidate_more_nodes = list(more_nodes[1:-1])
+    matched_more_nodes = set()
+
+    for fn_id in fewer_nodes[1:-1]:
+        f_pos = osm.get_node_data(fn_id)
+
+        min_dist = float("inf")
+        closest_mn_id = None
+
+        for mn_id in candidate_more_nodes:
+            if mn_id in matched_more_nodes:
+                continue
+            m_pos = osm.get_node_data(mn_id)
+            d = distance(f_pos, m_pos)
+            if d < min_dist:
+                min_dist = d
+                closest_mn_id = mn_id
+
+        if closest_mn_id:
+            matched_more_nodes.add(closest_mn_id)
+
+    # 未対応の more_node だけを補間対象とする
+    unmatched_more_nodes = [mn_id for mn_id in candidate_more_nodes if mn_id not in matched_more_nodes]
+    log(f"Looping over {len(unmatched_more_nodes)} unmatched intermediate nodes")
+
+    # ここから補間処理（新ノード挿入など）
+    fewer_nodes = list(fewer_nodes)
+    new_node_ids = []
+    for mn_id in unmatched_more_nodes:
+        m_pos = osm.get_node_data(mn_id)
+
+        min_dist = float("inf")
+        best_proj = None
+        insert_index = 1
+
+        for i in range(len(fewer_nodes) - 1):
+            nid1 = fewer_nodes[i]
+            nid2 = fewer_nodes[i + 1]
+            proj, _ = project_onto_segment(m_pos, osm.get_node_data(nid1), osm.get_node_data(nid2))
+            d = distance(proj, m_pos)
+            if d < min_dist:
+                min_dist = d
+                best_proj = proj
+                insert_index = i + 1
+
+        new_node_id = osm.add_node(best_proj)
+        fewer_nodes.insert(insert_index, new_node_id)
+        new_node_ids.append(new_node_id)
+
+    if new_node_ids and not osm.set_way_nodes(fewer_way, fewer_nodes):
+        log(f"Failed to insert nodes {', '.join(new_node_ids)} in way {fewer_way}")
+        return 0
+    osm.added_nodes.update(new_node_ids)
+    return len(new_node_ids)
+
+def arc_lengths(positions):
+    """
+    折れ線の各ノードまでの道のりを全長で割った値（0〜1）のリスト。
+    全長が0の場合はノードの番号で等分する。
+    """
+    lengths = [0.0]
+    for a, b in zip(positions, positions[1:]):
+        lengths.append(lengths[-1] + distance(a, b))
+    total = lengths[-1]
+    if total > 0:
+        return [v / total for v in lengths]
+    n = len(positions) - 1
+    return [i / n if n else 0.0 for i in range(len(positions))]
+
+def match_by_arc_length(fewer_s, more_s):
+    """
+    fewer の中間ノードを先頭から順に、more の中間ノードのうち弧長の値が最も近いものに対応付け、
+    対応しなかった more の中間ノードの位置のリストを返す（fewer_s・more_s は両端を含む弧長の値）。
+    対応付けは順序を保ち、残りの fewer のノードの分の対応先を残す。
+    more の位置は戻らないので、処理時間はノード数に比例する。
+    """
+    k = len(fewer_s) - 2
+    n = len(more_s) - 2
+    unmatched = []
+    j = 1
+    for i in range(1, k + 1):
+        # i 番目に対応付けられる more の位置の上限（後ろの k - i 個の分を残す）
+        last = n - (k - i)
+        while j < last and abs(more_s[j + 1] - fewer_s[i]) < abs(more_s[j] - fewer_s[i]):
+            unmatched.append(j)
+            j += 1
+        j += 1
+    unmatched.extend(range(j, n + 1))
+    return unmatched
+
+def insert_nodes_arclength(osm, fewer_way, fewer_nodes, more_nodes, log=print):
+    """
+    左右の折れ線を全長で割った弧長でパラメータ化し、対応しなかった more_nodes のノードと同じ弧長の
+    fewer_way 上の位置にノードを挿入する。対応付け・挿入位置の探索はどちらも弧長の順に1回ずつ進めるだけで、
+    lanelet ごとの処理時間はノード数に比例する。挿入したノードの数を返す。
+    """
+    if len(fewer_nodes) < 2:
+        return 0
+    fewer_pos = [osm.get_node_data(node_id) for node_id in fewer_nodes]
+    fewer_s = arc_lengths(fewer_pos)
+    more_s = arc_lengths([osm.get_node_data(node_id) for node_id in more_nodes])
+    unmatched = match_by_arc_length(fewer_s, more_s)
+    log(f"Looping over {len(unmatched)} unmatched intermediate nodes")
+
+    insertions = []
+    segment = 0
+    for j in unmatched:
+        target = more_s[j]
+        # target を含む fewer の線分まで進める（unmatched は弧長の昇順）
+        while segment < len(fewer_nodes) - 2 and fewer_s[segment + 1] < target:
+            segment += 1
+        a, b = fewer_pos[segment], fewer_pos[segment + 1]
+        span = fewer_s[segment + 1] - fewer_s[segment]
+        t = (target - fewer_s[segment]) / span if span > 0 else 0.5
+        t = max(SEGMENT_EPSILON, min(1.0 - SEGMENT_EPSILON, t))
+        point = {k: float(a[k]) + (float(b[k]) - float(a[k])) * t for k in ("x", "y", "z")}
+
+        # 同じ線分に挿入するノードは弧長の順に insertions に並ぶので、その順序のまま挿入される
+        insertions.append((fewer_nodes[segment], osm.add_node(point)))
+
+    inserted = osm.insert_nodes_to_way(fewer_way, insertions)
+    for insert_after, new_node_id in insertions:
+        if new_node_id not in inserted:
+            log(f"Failed to insert node {new_node_id} after {insert_after} in way {fewer_way}")
+    osm.added_nodes.update(inserted)
+    return len(inserted)
+
+def correct_lrdiff_lanes(editor, log=print, engine="nearest"):
+    """
+    左右のノード数が異なる lanelet の少ない側にノードを挿入する。
+    engine は挿入位置の求め方（ENGINES。nearest: insert_nodes_nearest、arclength: insert_nodes_arclength）。
+    戻り値は変更内容（modified_relations, modified_ways, added_nodes）を保持する OSMManager
+    """
+    profiler = get_profiler()
+    with profiler.phase("init_manager"):
+        osm = OSMManager(editor)  # OSMManagerクラスのインスタンス化
 
     changed = True
+    iteration = 0
     new_relations = list(osm.relations.values())  # relation要素のリスト
 
     while changed:
@@ -248,116 +407,65 @@ def parse_osm_and_correct(file_path):
         new_relations = []
         total = len(current_relations)
 
-        for idx, relation in enumerate(current_relations, start=1):
-            rid = relation.get("id")
-            #print(f"Processing relation {idx}/{total} (ID: {rid})")
-            # left/right のmemberを取得
-            members = {m.get("role"): m.get("ref") for m in relation.findall("member") if m.get("role") in ["left", "right"]}
-            if "left" not in members or "right" not in members:
-                continue
+        iteration += 1
+        added_before = len(osm.added_nodes)
+        with profiler.phase(f"iteration {iteration}") as phase:
+            for idx, relation in enumerate(current_relations, start=1):
+                rid = str(relation.id)
+                #print(f"Processing relation {idx}/{total} (ID: {rid})")
+                # left/right のmemberを取得
+                members = {m.role: str(m.ref) for m in relation.members if m.role in ["left", "right"]}
+                if "left" not in members or "right" not in members:
+                    continue
 
-            left_id = members["left"]
-            right_id = members["right"]
-            left_nodes = osm.get_way_nodes(left_id) or []
-            right_nodes = osm.get_way_nodes(right_id) or []
-
-            if len(left_nodes) == len(right_nodes):
-                print(f"Relation {rid} has equal node counts.")
-                # その way が他の relation にも使われているかチェック
-                used_elsewhere = False
-                for other_rel in osm.relations.values():
-                    if other_rel == relation:
-                        continue
-                    for mem in other_rel.findall("member"):
-                        if mem.get("ref") in [left_id, right_id]:
-                            used_elsewhere = True
-                            print(f"Way {mem.get('ref')} is also used in relation {other_rel.get('id')}")
-                            break
+                left_id = members["left"]
+                right_id = members["right"]
+                left_nodes = osm.get_way_nodes(left_id) or []
+                right_nodes = osm.get_way_nodes(right_id) or []
+
+                if len(left_nodes) == len(right_nodes):
+                    log(f"Relation {rid} has equal node counts.")
+                    # その way が他の relation にも使われているかチェック（ウェイからの逆引きで調べる）
+                    others = osm.relations_using_ways([left_id, right_id], exclude=rid)
+                    used_elsewhere = bool(others)
                     if used_elsewhere:
-                        break
-                if not used_elsewhere:
-                    print(f"Relation {rid} is fully resolved and can be skipped in future.")
-                    continue
+                        other_rel = osm.relations[others[0]]
+                        mem = next(m for m in other_rel.members if m.type == "way" and str(m.ref) in [left_id, right_id])
+                        log(f"Way {mem.ref} is also used in relation {other_rel.id}")
+                    if not used_elsewhere:
+                        log(f"Relation {rid} is fully resolved and can be skipped in future.")
+                        continue
+                    else:
+                        new_relations.append(relation)
+                        continue  # 将来的に再評価される可能性あり
+                log(f"Processing relation {rid} with lengths: {len(left_nodes)} vs {len(right_nodes)}")
+
+                if len(left_nodes) < len(right_nodes):
+                    fewer_nodes, more_nodes = left_nodes, right_nodes
+                    fewer_way = left_id
                 else:
-                    new_relations.append(relation)
-                    continue  # 将来的に再評価される可能性あり
-            print(f"Processing relation {rid} with lengths: {len(left_nodes)} vs {len(right_nodes)}")
-
-            if len(left_nodes) < len(right_nodes):
-                fewer_nodes, more_nodes = left_nodes, right_nodes
-                fewer_way = left_id
-            else:
-                fewer_nodes, more_nodes = right_nodes, left_nodes
-                fewer_way = right_id
-
-            relation_changed = False
-            # fewer_nodes から closest more_nodes を探し、対応済みにする
-            candidate_more_nodes = set(more_nodes[1:-1])
-            matched_more_nodes = set()
-
-            for fn_id in fewer_nodes[1:-1]:
-                f_pos = osm.node_data[fn_id]
-
-                min_dist = float("inf")
-                closest_mn_id = None
-
-                for mn_id in candidate_more_nodes - matched_more_nodes:
-                    m_pos = osm.node_data[mn_id]
-                    d = distance(f_pos, m_pos)
-                    if d < min_dist:
-                        min_dist = d
-                        closest_mn_id = mn_id
-
-                if closest_mn_id:
-                    matched_more_nodes.add(closest_mn_id)
-
-            # 未対応の more_node だけを補間対象とする
-            unmatched_more_nodes = list(candidate_more_nodes - matched_more_nodes)
-            print(f"Looping over {len(unmatched_more_nodes)} unmatched intermediate nodes")
-
-            # ここから補間処理（新ノード挿入など）
-            for mn_id in unmatched_more_nodes:
-                m_pos = osm.node_data[mn_id]
-
-                min_dist = float("inf")
-                best_proj = None
-                best_t = None
-                insert_after = fewer_nodes[0]
-                best_1 = None
-                best_2 = None
-
-                for i in range(len(fewer_nodes) - 1):
-                    nid1 = fewer_nodes[i]
-                    nid2 = fewer_nodes[i + 1]
-                    proj, t = project_onto_segment(m_pos, osm.node_data[nid1], osm.node_data[nid2])
-                    d = distance(proj, m_pos)
-                    if d < min_dist:
-                        min_dist = d
-                        best_proj = proj
-                        insert_after = nid1
-                        best_t = t
-                        best_1 = nid1
-                        best_2 = nid2
-
-                new_node_id = osm.add_node(best_proj)
-                success = osm.insert_node_to_way(fewer_way, insert_after, new_node_id)
-
-                if success:
-                    # ↓ ここで fewer_nodes を最新の状態に更新する
-                    fewer_nodes = osm.get_way_nodes(fewer_way)
+                    fewer_nodes, more_nodes = right_nodes, left_nodes
+                    fewer_way = right_id
+
+                if engine == "arclength":
+                    inserted = insert_nodes_arclength(osm, fewer_way, fewer_nodes, more_nodes, log)
+                else:
+                    inserted = insert_nodes_nearest(osm, fewer_way, fewer_nodes, more_nodes, log)
 
+                relation_changed = inserted > 0
+                if relation_changed:
                     osm.modified_ways.add(fewer_way)
                     osm.modified_relations.add(rid)
-                    osm.added_nodes.add(new_node_id)
-                    relation_changed = True
                     changed = True
-                else:
-                    print(f"Failed to insert node {new_node_id} after {insert_after} in way {fewer_way}")
+                    new_relations.append(relation)
+                    # 変更があればウェイ要素のnd要素は各エンジンがlaneletごとに1回だけ同期済みのため、改めて削除・追加は不要
+                    #break  # 1回のループで1relationまで処理し再検証へ
+            phase.count(relations=total, requeued=len(new_relations), added_nodes=len(osm.added_nodes) - added_before)
+
+    return osm
 
-            if relation_changed:
-                new_relations.append(relation)
-                # 変更があればウェイ要素のnd要素はosm.insert_node_to_wayで同期済みのため、改めて削除・追加は不要
-                #break  # 1回のループで1relationまで処理し再検証へ
+def parse_osm_and_correct(file_path, engine="nearest"):
+    osm = correct_lrdiff_lanes(MapEditor(load_osm(file_path)), engine=engine)
 
     if osm.modified_relations:
         print("Modified relation IDs:", ", ".join(sorted(osm.modified_relations,key=int)))
@@ -372,15 +480,18 @@ def parse_osm_and_correct(file_path):
         if os.path.exists(output_path):
             print("Output file already exists. Aborting.")
         else:
-            osm.tree.write(output_path, encoding="utf-8", xml_declaration=True)
+            with get_profiler().phase("write_osm"):
+                osm.write(output_path)
             print("Modified OSM file written to:", output_path)
     else:
         print("No relation modifications were necessary.")
 
 
 if __name__ == "__main__":
-    if len(sys.argv) != 2:
-        print("Usage: python script.py <osm_file>")
-        sys.exit(1)
-    parse_osm_and_correct(sys.argv[1])
+    init_profiler("modify_lrdiff_lane")
+    parser = argparse.ArgumentParser(description="Insert nodes so that both sides of each lanelet have the same number of nodes.")
+    parser.add_argument("osm_file", help="Path to the OSM file")
+    parser.add_argument("--engine", choices=ENGINES, default="nearest", help="How to place the inserted nodes (default: nearest)")
+    args = parser.parse_args()
+    parse_osm_and_correct(args.osm_file, args.engine)
 
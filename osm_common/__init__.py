@@ -0,0 +1 @@
+from .osm_loader import load_osm, OSMData, Way, Relation, Member, COORD_KEYS
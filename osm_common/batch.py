@@ -0,0 +1,82 @@
+import glob
+import os
+import time
+import traceback
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+
+class BatchResult:
+    """1ファイル分の処理結果。失敗した場合は error にトレースバックの文字列を保持する"""
+
+    def __init__(self, path, value=None, error=None, seconds=0.0):
+        self.path = path
+        self.value = value
+        self.error = error
+        self.seconds = seconds
+
+    @property
+    def ok(self):
+        return self.error is None
+
+
+def expand_paths(patterns, list_file=None):
+    """
+    ファイルパス・globのパターン・リストファイル（1行に1パス、#以降はコメント）から
+    処理対象のファイルを重複なく指定順に返す。一致するファイルがないパターンはそのまま返す。
+    """
+    patterns = list(patterns)
+    if list_file:
+        with open(list_file, encoding="utf-8") as f:
+            for line in f:
+                line = line.split("#", 1)[0].strip()
+                if line:
+                    patterns.append(line)
+
+    paths = []
+    seen = set()
+    for pattern in patterns:
+        matches = sorted(glob.glob(pattern, recursive=True)) if glob.has_magic(pattern) else [pattern]
+        for path in matches or [pattern]:
+            key = os.path.abspath(path)
+            if key not in seen:
+                seen.add(key)
+                paths.append(path)
+    return paths
+
+
+def _call(func, path, args):
+    # ワーカーで実行する。例外は呼び出し元に返し、他のファイルの処理は続ける
+    start = time.perf_counter()
+    try:
+        return BatchResult(path, value=func(path, *args), seconds=time.perf_counter() - start)
+    except Exception:
+        return BatchResult(path, error=traceback.format_exc(), seconds=time.perf_counter() - start)
+
+
+def run_batch(paths, func, args=(), jobs=1):
+    """
+    paths の各ファイルに func(path, *args) を実行し、BatchResult を paths と同じ順序で返す。
+    jobs が2以上の場合はプロセスプールで並列に実行する（func・args・戻り値はpickleできること）。
+    ワーカーのプロセスが異常終了した場合は、巻き込まれたファイルを1つずつ別のプロセスで実行し直す。
+    """
+    if jobs <= 1 or len(paths) <= 1:
+        return [_call(func, path, args) for path in paths]
+
+    results = [None] * len(paths)
+    broken = []
+    with ProcessPoolExecutor(max_workers=min(jobs, len(paths))) as pool:
+        futures = [pool.submit(_call, func, path, args) for path in paths]
+        for i, future in enumerate(futures):
+            try:
+                results[i] = future.result()
+            except BrokenProcessPool:
+                broken.append(i)
+
+    for i in broken:
+        with ProcessPoolExecutor(max_workers=1) as pool:
+            try:
+                results[i] = pool.submit(_call, func, paths[i], args).result()
+            except BrokenProcessPool:
+                results[i] = BatchResult(paths[i], error="worker process terminated abruptly")
+    return results
@@ -0,0 +1,203 @@
+import xml.etree.ElementTree as ET
+
+from .osm_loader import COORD_KEYS, Member, Relation, Way
+from .osm_patch import OSMPatch, set_members, set_nd_refs, write_patched
+
+
+def _set_node_xyz(node_elem, x, y, z):
+    # 座標を変更したノードは lat/lon を空文字とし、local_x, local_y, ele のタグを更新する
+    node_elem.set("lat", "")
+    node_elem.set("lon", "")
+    for k, v in zip(COORD_KEYS, (x, y, z)):
+        for tag in node_elem.findall("tag"):
+            if tag.get("k") == k:
+                tag.set("v", str(v))
+                break
+        else:
+            ET.SubElement(node_elem, "tag", k=k, v=str(v))
+
+
+class MapEditor:
+    """
+    load_osm で読み込んだ地図（読み取り専用）に対する変更を保持する。
+    参照系のメソッドは変更を反映した値を返すので、複数の変換を順に適用できる。
+    write で変更した要素だけを元のファイルに差し替えて書き出す。
+    """
+
+    def __init__(self, osm):
+        self.osm = osm
+        self.removed = set()
+        # 変更・追加したウェイのノード参照（ID -> refsのリスト）
+        self.way_refs = {}
+        # 変更・追加したリレーションのmember（ID -> Memberのリスト）
+        self.relation_members = {}
+        # 座標を変更したノード（ID -> (x, y, z)）
+        self.moved_nodes = {}
+        # 追加した要素（ID -> 座標またはタグ）。追加した順に書き出す
+        self.added_nodes = {}
+        self.added_ways = {}
+        self.added_relations = {}
+        self._next_id = osm.max_id() + 1
+
+    def new_id(self):
+        """node・way・relation で重複しない新しいID"""
+        new_id = self._next_id
+        self._next_id += 1
+        return new_id
+
+    def _reserve_id(self, elem_id):
+        self._next_id = max(self._next_id, elem_id + 1)
+
+    # --- 参照 ---
+    def is_removed(self, kind, elem_id):
+        return (kind, elem_id) in self.removed
+
+    def node_xyz(self, node_id):
+        """ノードの (x, y, z)。存在しない・座標が欠けている場合はNone"""
+        if ("node", node_id) in self.removed:
+            return None
+        xyz = self.added_nodes.get(node_id) or self.moved_nodes.get(node_id)
+        if xyz is not None:
+            return xyz
+        nodes = self.osm.nodes
+        i = nodes.index.get(node_id)
+        if i is None or not nodes.has_coords(i):
+            return None
+        return nodes.xyz(i)
+
+    def _way(self, way):
+        refs = self.way_refs.get(way.id)
+        return way if refs is None else way._replace(refs=refs)
+
+    def way_by_id(self, way_id):
+        if ("way", way_id) in self.removed:
+            return None
+        if way_id in self.added_ways:
+            return Way(way_id, self.way_refs[way_id], self.added_ways[way_id])
+        way = self.osm.way_by_id(way_id)
+        return None if way is None else self._way(way)
+
+    def iter_ways(self):
+        """ファイル上の順序でウェイを返し、続けて追加したウェイを返す"""
+        removed = self.removed
+        for way in self.osm.iter_ways():
+            if ("way", way.id) not in removed:
+                yield self._way(way)
+        for way_id, tags in self.added_ways.items():
+            if ("way", way_id) not in removed:
+                yield Way(way_id, self.way_refs[way_id], tags)
+
+    def _relation(self, relation):
+        members = self.relation_members.get(relation.id)
+        return relation if members is None else relation._replace(members=members)
+
+    def relation_by_id(self, rel_id):
+        if ("relation", rel_id) in self.removed:
+            return None
+        if rel_id in self.added_relations:
+            return Relation(rel_id, self.relation_members[rel_id], self.added_relations[rel_id])
+        relation = self.osm.relation_by_id(rel_id)
+        return None if relation is None else self._relation(relation)
+
+    def iter_relations(self):
+        """ファイル上の順序でリレーションを返し、続けて追加したリレーションを返す"""
+        removed = self.removed
+        for relation in self.osm.iter_relations():
+            if ("relation", relation.id) not in removed:
+                yield self._relation(relation)
+        for rel_id, tags in self.added_relations.items():
+            if ("relation", rel_id) not in removed:
+                yield Relation(rel_id, self.relation_members[rel_id], tags)
+
+    # --- 変更 ---
+    def remove(self, kind, elem_id):
+        self.removed.add((kind, elem_id))
+
+    def set_node_xyz(self, node_id, x, y, z):
+        if node_id in self.added_nodes:
+            self.added_nodes[node_id] = (x, y, z)
+        else:
+            self.moved_nodes[node_id] = (x, y, z)
+
+    def set_way_refs(self, way_id, refs):
+        self.way_refs[way_id] = list(refs)
+
+    def add_relation_member(self, rel_id, member_type, ref, role):
+        relation = self.relation_by_id(rel_id)
+        if relation is None:
+            return False
+        self.relation_members[rel_id] = list(relation.members) + [Member(member_type, ref, role)]
+        return True
+
+    def add_node(self, x, y, z, node_id=None):
+        """local_x・local_y・ele を持つノードを追加する。node_id を省略した場合は新しいIDを振る"""
+        if node_id is None:
+            node_id = self.new_id()
+        self._reserve_id(node_id)
+        self.added_nodes[node_id] = (x, y, z)
+        return node_id
+
+    def add_way(self, refs, tags, way_id=None):
+        if way_id is None:
+            way_id = self.new_id()
+        self._reserve_id(way_id)
+        self.added_ways[way_id] = dict(tags)
+        self.way_refs[way_id] = list(refs)
+        return way_id
+
+    def add_relation(self, members, tags, rel_id=None):
+        if rel_id is None:
+            rel_id = self.new_id()
+        self._reserve_id(rel_id)
+        self.added_relations[rel_id] = dict(tags)
+        self.relation_members[rel_id] = [Member(*m) for m in members]
+        return rel_id
+
+    # --- 出力 ---
+    def to_patch(self):
+        """変更をOSMPatchにまとめる"""
+        patch = OSMPatch()
+        for kind, elem_id in self.removed:
+            patch.remove(kind, elem_id)
+
+        for node_id, xyz in self.moved_nodes.items():
+            patch.modify("node", node_id, lambda elem, xyz=xyz: _set_node_xyz(elem, *xyz))
+        for way_id, refs in self.way_refs.items():
+            if way_id not in self.added_ways:
+                patch.modify("way", way_id, lambda elem, refs=refs: set_nd_refs(elem, refs))
+        for rel_id, members in self.relation_members.items():
+            if rel_id not in self.added_relations:
+                patch.modify("relation", rel_id, lambda elem, members=members: set_members(elem, members))
+
+        for node_id, (x, y, z) in self.added_nodes.items():
+            if ("node", node_id) in self.removed:
+                continue
+            # lat/lon は空文字とし、local_x, local_y, ele をタグに記録
+            elem = ET.Element("node", id=str(node_id), lat="", lon="")
+            ET.SubElement(elem, "tag", k="local_x", v=str(x))
+            ET.SubElement(elem, "tag", k="local_y", v=str(y))
+            ET.SubElement(elem, "tag", k="ele", v=str(z))
+            patch.add(elem)
+        for way_id, tags in self.added_ways.items():
+            if ("way", way_id) in self.removed:
+                continue
+            elem = ET.Element("way", id=str(way_id))
+            for ref in self.way_refs[way_id]:
+                ET.SubElement(elem, "nd", ref=str(ref))
+            for k, v in tags.items():
+                ET.SubElement(elem, "tag", k=k, v=v)
+            patch.add(elem)
+        for rel_id, tags in self.added_relations.items():
+            if ("relation", rel_id) in self.removed:
+                continue
+            elem = ET.Element("relation", id=str(rel_id))
+            for member in self.relation_members[rel_id]:
+                ET.SubElement(elem, "member", type=member.type, ref=str(member.ref), role=member.role)
+            for k, v in tags.items():
+                ET.SubElement(elem, "tag", k=k, v=v)
+            patch.add(elem)
+        return patch
+
+    def write(self, output):
+        """元のファイルを流しながら変更を適用して output に書き出す"""
+        return write_patched(self.osm.path, output, self.to_patch())
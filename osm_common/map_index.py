@@ -0,0 +1,59 @@
+from array import array
+from collections import defaultdict
+
+from .osm_loader import load_osm
+
+
+class MapIndex:
+    """
+    OSMDataからID引きの辞書とウェイごとの座標配列を1回の走査で作成する。
+    要素の検索は辞書引きになるため、findallによる線形探索を繰り返す必要がない。
+
+    - ways: ウェイID -> Way
+    - relations: リレーションID -> Relation（ファイル上の順序を保持）
+    - way_xyz: ウェイID -> [x0, y0, z0, x1, y1, z1, ...] のfloat配列
+    - relations_by_subtype: subtypeの値 -> Relationのリスト
+    """
+
+    def __init__(self, osm):
+        self.osm = osm
+        self.ways = {}
+        self.way_xyz = {}
+        self.relations = {}
+        self.relations_by_subtype = defaultdict(list)
+
+        nodes = osm.nodes
+        for way in osm.iter_ways():
+            self.ways[way.id] = way
+            xyz = array("d")
+            for ref in way.refs:
+                i = nodes.index.get(ref)
+                # 存在しない・座標を持たないノードは飛ばす
+                if i is not None and nodes.has_coords(i):
+                    xyz.extend((nodes.x[i], nodes.y[i], nodes.z[i]))
+            self.way_xyz[way.id] = xyz
+
+        for relation in osm.iter_relations():
+            self.relations[relation.id] = relation
+            subtype = relation.tags.get("subtype")
+            if subtype is not None:
+                self.relations_by_subtype[subtype].append(relation)
+
+    @classmethod
+    def from_file(cls, path):
+        return cls(load_osm(path))
+
+    def way_coords(self, way_id):
+        """ウェイのノード座標を (x, y, z) のリストで返す。ウェイが無い場合はNone"""
+        xyz = self.way_xyz.get(int(way_id))
+        if xyz is None:
+            return None
+        return [tuple(xyz[i:i + 3]) for i in range(0, len(xyz), 3)]
+
+    @staticmethod
+    def member_ref(relation, role):
+        """指定したroleを持つ最初のmemberのref。存在しない場合はNone"""
+        for member in relation.members:
+            if member.role == role:
+                return member.ref
+        return None
@@ -0,0 +1,80 @@
+import os
+
+import numpy as np
+
+
+def _referenced_in_base(editor):
+    """
+    読み込んだ地図のウェイ・リレーションのうち、削除・変更していないものが参照するノードID。
+    配列のまま参照を集めるので、ウェイ・リレーションを1つずつ取り出すより速い。
+    """
+    osm = editor.osm
+    removed = editor.removed
+    parts = []
+
+    ways = osm.ways
+    way_ids = np.asarray(ways.ids, dtype=np.int64)
+    excluded = [way_id for kind, way_id in removed if kind == "way"]
+    excluded.extend(editor.way_refs)
+    keep = ~np.isin(way_ids, np.asarray(excluded, dtype=np.int64))
+    lengths = np.diff(np.asarray(ways.offsets, dtype=np.int64))
+    parts.append(np.asarray(ways.refs, dtype=np.int64)[np.repeat(keep, lengths)])
+
+    node_type = osm.strings._lookup.get("node")
+    if node_type is not None:
+        relations = osm.relations
+        rel_ids = np.asarray(relations.ids, dtype=np.int64)
+        excluded = [rel_id for kind, rel_id in removed if kind == "relation"]
+        excluded.extend(editor.relation_members)
+        keep = ~np.isin(rel_ids, np.asarray(excluded, dtype=np.int64))
+        lengths = np.diff(np.asarray(relations.offsets, dtype=np.int64))
+        is_node = np.asarray(relations.member_types, dtype=np.int64) == node_type
+        parts.append(np.asarray(relations.member_refs, dtype=np.int64)[np.repeat(keep, lengths) & is_node])
+    return parts
+
+
+def referenced_node_ids(editor):
+    """editor の変更を反映したウェイのnd・リレーションのnode memberが参照するノードIDの配列（重複なし）"""
+    parts = _referenced_in_base(editor)
+    # 変更・追加したウェイ・リレーション（件数は少ない）は参照をそのまま集める
+    extra = []
+    for way_id, refs in editor.way_refs.items():
+        if ("way", way_id) not in editor.removed:
+            extra.extend(refs)
+    for rel_id, members in editor.relation_members.items():
+        if ("relation", rel_id) not in editor.removed:
+            extra.extend(member.ref for member in members if member.type == "node")
+    parts.append(np.asarray(extra, dtype=np.int64))
+    return np.unique(np.concatenate(parts))
+
+
+def find_orphan_nodes(editor):
+    """
+    どのウェイ・リレーションからも参照されていないノード（削除済みを除く）のIDを、
+    ファイル上の順序（追加したノードは追加した順に後ろ）のリストで返す。
+    """
+    node_ids = np.asarray(editor.osm.nodes.ids, dtype=np.int64)
+    if editor.added_nodes:
+        node_ids = np.concatenate([node_ids, np.fromiter(editor.added_nodes, dtype=np.int64, count=len(editor.added_nodes))])
+    orphan = ~np.isin(node_ids, referenced_node_ids(editor))
+    return [node_id for node_id in node_ids[orphan].tolist() if ("node", node_id) not in editor.removed]
+
+
+def remove_orphan_nodes(editor):
+    """参照されていないノードを editor から削除し、削除したノードのIDのリストを返す"""
+    orphans = find_orphan_nodes(editor)
+    for node_id in orphans:
+        editor.remove("node", node_id)
+    return orphans
+
+
+def format_size_report(source, output, counts):
+    """
+    write_patched の結果（counts）と入出力ファイルの大きさから、削減した要素数・バイト数の報告を返す。
+    """
+    before = os.path.getsize(source)
+    after = os.path.getsize(output)
+    return (
+        f"removed_elements={counts['removed']}, removed_bytes={counts['removed_bytes']}, "
+        f"size={before} -> {after} bytes (saved {before - after} bytes)"
+    )
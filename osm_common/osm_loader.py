@@ -0,0 +1,361 @@
+import math
+import os
+import xml.etree.ElementTree as ET
+from array import array
+from collections import namedtuple
+
+from .profiler import get_profiler
+
+# ノードの座標として配列に格納するタグ
+COORD_KEYS = ("local_x", "local_y", "ele")
+
+Way = namedtuple("Way", "id refs tags")
+Relation = namedtuple("Relation", "id members tags")
+Member = namedtuple("Member", "type ref role")
+
+
+class StringTable:
+    """文字列を番号で管理するテーブル（roleやmemberのtype用）"""
+
+    def __init__(self):
+        self.strings = []
+        self._lookup = {}
+
+    def __len__(self):
+        return len(self.strings)
+
+    def intern(self, s):
+        idx = self._lookup.get(s)
+        if idx is None:
+            idx = len(self.strings)
+            self._lookup[s] = idx
+            self.strings.append(s)
+        return idx
+
+
+class TagTable:
+    """
+    タグ集合をインターンして保持するテーブル。
+    同じタグの組み合わせを持つ要素は同じ辞書を共有する。番号0は空のタグ集合。
+    返される辞書は共有されているので書き換えないこと。
+    itemsには重複キーも含めたファイル上の並びのままのタグを保持する。
+    """
+
+    def __init__(self):
+        self.sets = [{}]
+        self.items = [()]
+        self._lookup = {(): 0}
+
+    def __len__(self):
+        return len(self.sets)
+
+    def intern(self, items):
+        key = tuple(items)
+        idx = self._lookup.get(key)
+        if idx is None:
+            idx = len(self.sets)
+            self._lookup[key] = idx
+            self.sets.append(dict(key))
+            self.items.append(key)
+        return idx
+
+
+def _id_index(store):
+    """
+    ID -> インデックスの辞書。スナップショットから読み込んだ場合は
+    最初に参照されたときにIDの配列から作成する。
+    """
+    if store._index is None:
+        store._index = dict(zip(store.ids, range(len(store.ids))))
+    return store._index
+
+
+class NodeStore:
+    """
+    ノードの座標を連続したfloat配列で保持する。
+    ノードIDは密なインデックスに対応付けられ、x/y/zは同じインデックスで参照する。
+    座標タグが無い・数値でない場合はNaNを格納する。
+    """
+
+    def __init__(self):
+        self.ids = array("q")
+        self.x = array("d")
+        self.y = array("d")
+        self.z = array("d")
+        self.tag_ids = array("i")
+        self._index = {}
+
+    def __len__(self):
+        return len(self.ids)
+
+    @property
+    def index(self):
+        return _id_index(self)
+
+    def add(self, node_id, x, y, z, tag_id):
+        self._index[node_id] = len(self.ids)
+        self.ids.append(node_id)
+        self.x.append(x)
+        self.y.append(y)
+        self.z.append(z)
+        self.tag_ids.append(tag_id)
+
+    def lookup(self, node_id):
+        """ノードIDからインデックスを返す。存在しない場合はNone"""
+        return self.index.get(int(node_id))
+
+    def xyz(self, i):
+        return (self.x[i], self.y[i], self.z[i])
+
+    def has_coords(self, i):
+        return not (math.isnan(self.x[i]) or math.isnan(self.y[i]) or math.isnan(self.z[i]))
+
+
+class WayStore:
+    """ウェイのノード参照を1本の配列にまとめ、オフセットで区切って保持する"""
+
+    def __init__(self):
+        self.ids = array("q")
+        self.offsets = array("q", [0])
+        self.refs = array("q")
+        self.tag_ids = array("i")
+        self._index = {}
+
+    def __len__(self):
+        return len(self.ids)
+
+    @property
+    def index(self):
+        return _id_index(self)
+
+    def add(self, way_id, refs, tag_id):
+        self._index[way_id] = len(self.ids)
+        self.ids.append(way_id)
+        self.refs.extend(refs)
+        self.offsets.append(len(self.refs))
+        self.tag_ids.append(tag_id)
+
+    def lookup(self, way_id):
+        return self.index.get(int(way_id))
+
+    def refs_of(self, i):
+        return self.refs[self.offsets[i]:self.offsets[i + 1]]
+
+
+class RelationStore:
+    """リレーションのmemberを type / ref / role の並列配列で保持する"""
+
+    def __init__(self):
+        self.ids = array("q")
+        self.offsets = array("q", [0])
+        self.member_types = array("i")
+        self.member_refs = array("q")
+        self.member_roles = array("i")
+        self.tag_ids = array("i")
+        self._index = {}
+
+    def __len__(self):
+        return len(self.ids)
+
+    @property
+    def index(self):
+        return _id_index(self)
+
+    def add(self, rel_id, types, refs, roles, tag_id):
+        self._index[rel_id] = len(self.ids)
+        self.ids.append(rel_id)
+        self.member_types.extend(types)
+        self.member_refs.extend(refs)
+        self.member_roles.extend(roles)
+        self.offsets.append(len(self.member_refs))
+        self.tag_ids.append(tag_id)
+
+    def lookup(self, rel_id):
+        return self.index.get(int(rel_id))
+
+
+class OSMData:
+    """
+    load_osmで読み込んだ地図データ。
+    ノードは座標配列、ウェイ・リレーションはオフセット付きの配列として保持し、
+    XMLのDOMは保持しない。IDはすべて整数として扱う。
+    スナップショットから読み込んだ場合、配列はmmap上のmemoryviewで読み取り専用となる。
+    """
+
+    def __init__(self, path=None):
+        self.path = path
+        self.root_attrib = {}
+        self.meta = []
+        self.tags = TagTable()
+        self.strings = StringTable()
+        self.nodes = NodeStore()
+        self.ways = WayStore()
+        self.relations = RelationStore()
+        self.mmap = None
+
+    # --- ノード ---
+    def node_index(self, node_id):
+        return self.nodes.lookup(node_id)
+
+    def node_xyz(self, node_id):
+        """ノードIDから (x, y, z) を返す。存在しない場合はNone"""
+        i = self.nodes.lookup(node_id)
+        if i is None:
+            return None
+        return self.nodes.xyz(i)
+
+    def node_tags(self, i):
+        """座標以外のノードのタグ"""
+        return self.tags.sets[self.nodes.tag_ids[i]]
+
+    # --- ウェイ ---
+    def way(self, i):
+        ways = self.ways
+        return Way(ways.ids[i], ways.refs_of(i), self.tags.sets[ways.tag_ids[i]])
+
+    def way_by_id(self, way_id):
+        i = self.ways.lookup(way_id)
+        if i is None:
+            return None
+        return self.way(i)
+
+    def iter_ways(self):
+        for i in range(len(self.ways)):
+            yield self.way(i)
+
+    def way_coords(self, way):
+        """ウェイのノード座標のリスト。座標を持たないノードは飛ばす"""
+        nodes = self.nodes
+        coords = []
+        for ref in way.refs:
+            i = nodes.index.get(ref)
+            if i is not None and nodes.has_coords(i):
+                coords.append((nodes.x[i], nodes.y[i], nodes.z[i]))
+        return coords
+
+    # --- リレーション ---
+    def relation(self, i):
+        rels = self.relations
+        strings = self.strings.strings
+        start, end = rels.offsets[i], rels.offsets[i + 1]
+        members = [
+            Member(strings[rels.member_types[j]], rels.member_refs[j], strings[rels.member_roles[j]])
+            for j in range(start, end)
+        ]
+        return Relation(rels.ids[i], members, self.tags.sets[rels.tag_ids[i]])
+
+    def relation_by_id(self, rel_id):
+        i = self.relations.lookup(rel_id)
+        if i is None:
+            return None
+        return self.relation(i)
+
+    def iter_relations(self):
+        for i in range(len(self.relations)):
+            yield self.relation(i)
+
+    def max_id(self):
+        """node / way / relation を通した最大ID"""
+        return max([0] + [max(s.ids) for s in (self.nodes, self.ways, self.relations) if len(s)])
+
+
+def _parse_coord(value):
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def _add_node(data, elem):
+    coords = [math.nan, math.nan, math.nan]
+    items = []
+    for child in elem:
+        if child.tag != "tag":
+            continue
+        k = child.get("k")
+        v = child.get("v")
+        if k in COORD_KEYS:
+            value = _parse_coord(v)
+            if value is not None:
+                coords[COORD_KEYS.index(k)] = value
+                continue
+        # 数値として読めない座標タグはそのままタグとして残す
+        items.append((k, v))
+    data.nodes.add(int(elem.get("id")), coords[0], coords[1], coords[2], data.tags.intern(items))
+
+
+def _add_way(data, elem):
+    refs = []
+    items = []
+    for child in elem:
+        if child.tag == "nd":
+            refs.append(int(child.get("ref")))
+        elif child.tag == "tag":
+            items.append((child.get("k"), child.get("v")))
+    data.ways.add(int(elem.get("id")), refs, data.tags.intern(items))
+
+
+def _add_relation(data, elem):
+    strings = data.strings
+    types = []
+    refs = []
+    roles = []
+    items = []
+    for child in elem:
+        if child.tag == "member":
+            types.append(strings.intern(child.get("type")))
+            refs.append(int(child.get("ref")))
+            roles.append(strings.intern(child.get("role", "")))
+        elif child.tag == "tag":
+            items.append((child.get("k"), child.get("v")))
+    data.relations.add(int(elem.get("id")), types, refs, roles, data.tags.intern(items))
+
+
+_HANDLERS = {"node": _add_node, "way": _add_way, "relation": _add_relation}
+_CHILD_TAGS = {"tag", "nd", "member"}
+
+
+def parse_osm(path):
+    """
+    osmファイルをiterparseで逐次読み込み、OSMDataを返す。
+    要素は処理した直後に破棄するため、メモリ使用量はXMLのDOMではなく
+    ジオメトリの量に比例する。
+    """
+    with get_profiler().phase("parse_osm") as phase:
+        data = OSMData(path)
+        context = ET.iterparse(path, events=("start", "end"))
+        _, root = next(context)
+        data.root_attrib = dict(root.attrib)
+
+        for event, elem in context:
+            if event == "start":
+                continue
+            handler = _HANDLERS.get(elem.tag)
+            if handler is not None:
+                handler(data, elem)
+            elif elem.tag in _CHILD_TAGS or elem is root:
+                continue
+            else:
+                data.meta.append((elem.tag, dict(elem.attrib)))
+            # 処理済みの要素をルートから切り離して解放する
+            root.clear()
+        phase.count(bytes=os.path.getsize(path))
+
+    return data
+
+
+def load_osm(path, use_snapshot=None):
+    """
+    osmファイルを読み込みOSMDataを返す。
+    スナップショットが有効な場合はキャッシュ済みのスナップショットをmmapで開き、
+    存在しない・古い場合はparse_osmで読み込んでスナップショットを作り直す。
+    use_snapshotを省略した場合は環境変数 MAP_UTILS_SNAPSHOT（"0"で無効）に従う。
+    """
+    from .snapshot import load_with_snapshot, snapshot_enabled
+
+    if use_snapshot is None:
+        use_snapshot = snapshot_enabled()
+    with get_profiler().phase("load_osm") as phase:
+        osm = load_with_snapshot(path) if use_snapshot else parse_osm(path)
+        phase.count(nodes=len(osm.nodes), ways=len(osm.ways), relations=len(osm.relations))
+    return osm
@@ -0,0 +1,262 @@
+import re
+import xml.etree.ElementTree as ET
+from xml.sax.saxutils import escape
+
+from .profiler import get_profiler
+
+KINDS = ("node", "way", "relation")
+
+_CHUNK_SIZE = 1 << 20
+_ELEMENT_RE = re.compile(rb"<(node|way|relation)[\s/>]")
+# 属性値の中の '>' を読み飛ばして開始タグの終わりまでを取る
+_TAG_RE = re.compile(rb"<(?:[^>\"']|\"[^\"]*\"|'[^']*')*>")
+_ID_RE = re.compile(rb"\sid\s*=\s*([\"'])(.*?)\1")
+
+
+class OSMPatch:
+    """
+    osmファイルに対する変更（要素の追加・削除・変更）をまとめたもの。
+    write_patched で元ファイルを先頭から流しながら変更のある要素だけを差し替える。
+    """
+
+    def __init__(self):
+        self.removed = set()
+        self.modified = {}
+        self.added = {kind: [] for kind in KINDS}
+
+    def __bool__(self):
+        return bool(self.removed or self.modified or any(self.added.values()))
+
+    def remove(self, kind, elem_id):
+        self.removed.add((kind, int(elem_id)))
+
+    def modify(self, kind, elem_id, func):
+        """
+        要素を変更する。書き出し時に元の要素を ET.Element として func に渡すので、
+        func はその要素を直接書き換える。同じ要素に複数回指定した場合は順に適用する。
+        """
+        self.modified.setdefault((kind, int(elem_id)), []).append(func)
+
+    def add(self, elem):
+        """ET.Element を追加する。同じ種類の要素の末尾に書き出される"""
+        self.added[elem.tag].append(elem)
+
+
+def set_nd_refs(way_elem, refs):
+    """ウェイのnd要素を refs に置き換える。ndの位置（tagより前など）は保持する"""
+    nds = way_elem.findall("nd")
+    position = list(way_elem).index(nds[0]) if nds else 0
+    for nd in nds:
+        way_elem.remove(nd)
+    for offset, ref in enumerate(refs):
+        way_elem.insert(position + offset, ET.Element("nd", ref=str(ref)))
+
+
+def set_members(rel_elem, members):
+    """リレーションのmember要素を members（(type, ref, role) の並び）に置き換える。位置は保持する"""
+    old = rel_elem.findall("member")
+    position = list(rel_elem).index(old[0]) if old else 0
+    for member in old:
+        rel_elem.remove(member)
+    for offset, (member_type, ref, role) in enumerate(members):
+        rel_elem.insert(position + offset, ET.Element("member", type=member_type, ref=str(ref), role=role))
+
+
+def add_member(rel_elem, member_type, ref, role):
+    """リレーションの最後のmemberの直後にmemberを追加する"""
+    children = list(rel_elem)
+    members = [i for i, child in enumerate(children) if child.tag == "member"]
+    position = members[-1] + 1 if members else 0
+    rel_elem.insert(position, ET.Element("member", type=member_type, ref=str(ref), role=role))
+
+
+def _format_attrib(attrib):
+    return "".join(f' {k}="{escape(str(v), {chr(34): "&quot;", chr(10): "&#10;"})}"' for k, v in attrib.items())
+
+
+def format_element(elem, indent="  "):
+    """
+    要素をVMBの出力と同じ体裁（子要素は1段深いインデント、空要素は "/>"）で文字列にする。
+    先頭のインデントは含まない。
+    """
+    start = f"<{elem.tag}{_format_attrib(elem.attrib)}"
+    children = list(elem)
+    if not children:
+        return start + "/>"
+    lines = [start + ">"]
+    for child in children:
+        lines.append(f"{indent}{indent}<{child.tag}{_format_attrib(child.attrib)}/>")
+    lines.append(f"{indent}</{elem.tag}>")
+    return "\n".join(lines)
+
+
+class _Reader:
+    """
+    元ファイルをチャンクで読み、必要に応じてバッファを継ぎ足す。
+    位置はすべてファイル先頭からの絶対位置で扱う。
+    変更のない範囲は copy_start から溜めておき、まとめて書き出す。
+    """
+
+    def __init__(self, f, out):
+        self.f = f
+        self.out = out
+        self.buf = b""
+        self.base = 0
+        self.copy_start = 0
+        self.eof = False
+
+    def copy_until(self, end):
+        """copy_start から end までの元のバイト列を書き出す"""
+        if self.copy_start < end:
+            self.out.write(self.buf[self.copy_start - self.base:end - self.base])
+        self.copy_start = end
+
+    def skip_to(self, end):
+        """end までを書き出さずに読み飛ばす"""
+        self.copy_start = end
+
+    def _fill(self, keep_from):
+        chunk = self.f.read(_CHUNK_SIZE)
+        if not chunk:
+            self.eof = True
+            return
+        # keep_from より前は不要になるので、溜めていた範囲を書き出してから捨てる
+        keep_from = min(keep_from, self.copy_start)
+        self.buf = self.buf[keep_from - self.base:] + chunk
+        self.base = keep_from
+
+    def find(self, needle, start, keep_from):
+        while True:
+            i = self.buf.find(needle, start - self.base)
+            if i != -1:
+                return self.base + i
+            if self.eof:
+                return -1
+            self.copy_until(keep_from)
+            self._fill(keep_from)
+
+    def match(self, regex, start, keep_from):
+        """regex が start で一致した場合は一致の終わりの位置、一致しない場合はNone"""
+        while True:
+            m = regex.match(self.buf, start - self.base)
+            if m is not None:
+                return self.base + m.end()
+            if self.eof:
+                return None
+            self.copy_until(keep_from)
+            self._fill(keep_from)
+
+    def ensure(self, end, keep_from):
+        while self.base + len(self.buf) < end and not self.eof:
+            self.copy_until(keep_from)
+            self._fill(keep_from)
+
+    def startswith(self, prefix, start):
+        return self.buf.startswith(prefix, start - self.base)
+
+    def slice(self, start, end):
+        return self.buf[start - self.base:end - self.base]
+
+    def end(self):
+        return self.base + len(self.buf)
+
+
+def write_patched(source, output, patch):
+    """
+    source を先頭から流しながら output に書き出す。
+    変更のない部分は元のバイト列のまま書き出し、patch で削除・変更された要素だけを
+    差し替え、追加された要素は同じ種類の要素の末尾に挿入する。
+    要素の前の空白（改行とインデント）はその要素に属するものとして扱う。
+    戻り値は実際に適用した削除・変更・追加の件数と、削除した要素のバイト数（removed_bytes、前の空白を含む）。
+    """
+    with get_profiler().phase("write_patched") as phase:
+        counts = _write_patched(source, output, patch)
+        phase.count(removed=counts["removed"], modified=counts["modified"], added=counts["added"])
+    return counts
+
+
+def _write_patched(source, output, patch):
+    counts = {"removed": 0, "modified": 0, "added": 0, "removed_bytes": 0}
+    pending = [kind for kind in KINDS if patch.added[kind]]
+    changed_kinds = {kind.encode() for kind, _ in patch.removed | set(patch.modified)}
+    last_ws = b"\n  "
+
+    with open(source, "rb") as f, open(output, "wb") as out:
+        reader = _Reader(f, out)
+
+        def flush_added(upto):
+            # upto より前の種類の追加要素を書き出す（upto が None なら残りすべて）
+            indent = last_ws.rsplit(b"\n", 1)[-1].decode()
+            while pending and (upto is None or KINDS.index(pending[0]) < KINDS.index(upto)):
+                reader.copy_until(ws_start)
+                for elem in patch.added[pending.pop(0)]:
+                    out.write(last_ws + format_element(elem, indent).encode("utf-8"))
+                    counts["added"] += 1
+
+        ws_start = 0
+        while True:
+            lt = reader.find(b"<", ws_start, ws_start)
+            if lt == -1:
+                flush_added(None)
+                break
+
+            reader.ensure(lt + 16, ws_start)
+            if reader.startswith(b"<!--", lt):
+                end = reader.find(b"-->", lt, ws_start)
+                ws_start = reader.end() if end == -1 else end + 3
+                continue
+
+            if reader.startswith(b"</osm", lt):
+                flush_added(None)
+
+            element = _ELEMENT_RE.match(reader.buf, lt - reader.base)
+            gt = reader.match(_TAG_RE, lt, ws_start)
+            if gt is None:
+                ws_start = reader.end()
+                break
+
+            if element is None:
+                # osm・MetaInfo・XML宣言などはそのまま書き出す
+                ws_start = gt
+                continue
+
+            kind = element.group(1)
+            if pending:
+                flush_added(kind.decode())
+            if reader.slice(gt - 2, gt) == b"/>":
+                end = gt
+            else:
+                close = reader.find(b"</" + kind, gt, ws_start)
+                end = reader.find(b">", close, ws_start) + 1
+
+            if pending:
+                ws = reader.slice(ws_start, lt)
+                if b"\n" in ws:
+                    last_ws = ws
+
+            key = None
+            if kind in changed_kinds:
+                id_match = _ID_RE.search(reader.slice(lt, gt))
+                if id_match:
+                    key = (kind.decode(), int(id_match.group(2)))
+
+            if key in patch.removed:
+                reader.copy_until(ws_start)
+                reader.skip_to(end)
+                counts["removed"] += 1
+                counts["removed_bytes"] += end - ws_start
+            elif key in patch.modified:
+                ws = reader.slice(ws_start, lt)
+                elem = ET.fromstring(reader.slice(lt, end))
+                for func in patch.modified[key]:
+                    func(elem)
+                indent = ws.rsplit(b"\n", 1)[-1].decode()
+                reader.copy_until(ws_start)
+                out.write(ws + format_element(elem, indent).encode("utf-8"))
+                reader.skip_to(end)
+                counts["modified"] += 1
+            ws_start = end
+
+        reader.copy_until(reader.end())
+
+    return counts
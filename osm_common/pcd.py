@@ -0,0 +1,516 @@
+import os
+import re
+import shutil
+import struct
+import tempfile
+
+import numpy as np
+
+try:
+    import lzf  # python-lzf（インストールされていれば圧縮に利用する）
+except ImportError:
+    lzf = None
+
+DATA_FORMATS = ("ascii", "binary", "binary_compressed")
+
+# ascii で一度に書式化する行数
+ASCII_CHUNK_ROWS = 65536
+# PCDWriter が書き出すまでに溜める点数の既定値
+DEFAULT_BUFFER_POINTS = 1 << 20
+# 点数が決まる前に書き出すヘッダの WIDTH・POINTS の桁数（uint32 の最大値の桁数）
+_COUNT_WIDTH = 10
+
+# PCD の TYPE・SIZE に対応する numpy の型
+_PCD_TYPES = {
+    ("F", 4): "<f4", ("F", 8): "<f8",
+    ("I", 1): "i1", ("I", 2): "<i2", ("I", 4): "<i4", ("I", 8): "<i8",
+    ("U", 1): "u1", ("U", 2): "<u2", ("U", 4): "<u4", ("U", 8): "<u8",
+}
+# タイルに分けた点群のメタデータのファイル名
+METADATA_FILENAME = "pointcloud_map_metadata.yaml"
+
+# LZF の制約（liblzf と同じ）
+_LZF_MAX_LITERAL = 32
+_LZF_MAX_OFFSET = 1 << 13
+_LZF_MAX_MATCH = 264
+
+
+def format_header(fields, num_points, data_format, pad=False):
+    """
+    PCD v0.7 のヘッダ。fields はフィールド名のリストで、すべて4バイトのfloat（TYPE F）とする。
+    pad が真の場合は後から点数を書き換えられるよう WIDTH・POINTS を空白で固定幅にする。
+    """
+    if data_format not in DATA_FORMATS:
+        raise ValueError(f"Unknown PCD data format: {data_format}")
+    n = len(fields)
+    count = f"{num_points:<{_COUNT_WIDTH}}" if pad else str(num_points)
+    return (
+        "# .PCD v0.7 - Point Cloud Data file format\n"
+        "VERSION 0.7\n"
+        f"FIELDS {' '.join(fields)}\n"
+        f"SIZE {' '.join(['4'] * n)}\n"
+        f"TYPE {' '.join(['F'] * n)}\n"
+        f"COUNT {' '.join(['1'] * n)}\n"
+        f"WIDTH {count}\n"
+        "HEIGHT 1\n"
+        "VIEWPOINT 0 0 0 1 0 0 0\n"
+        f"POINTS {count}\n"
+        f"DATA {data_format}\n"
+    )
+
+
+def write_ascii_points(f, points):
+    """(N, k) の float32 配列をテキストで書き出す。float32 の値を復元できる9桁で出力する"""
+    if len(points) == 0:
+        return
+    row = " ".join(["%.9g"] * points.shape[1]) + "\n"
+    for start in range(0, len(points), ASCII_CHUNK_ROWS):
+        chunk = points[start:start + ASCII_CHUNK_ROWS]
+        f.write(((row * len(chunk)) % tuple(chunk.ravel().tolist())).encode("ascii"))
+
+
+class PCDWriter:
+    """
+    点を少しずつ受け取りながらPCDファイルに書き出す。
+    ヘッダは点数を仮の値（固定幅）で先に書き出し、close で WIDTH・POINTS を書き換える。
+    受け取った点は buffer_points 点までまとめてから書き出すため、保持する点はその程度に収まる。
+    binary_compressed はフィールドごとに一時ファイルへ書き出しておき、close でブロックごとに
+    LZFで圧縮する（独立に圧縮したブロックを連結したものも1つのLZFのデータとして展開できる）。
+    """
+
+    def __init__(self, path, fields, data_format="ascii", buffer_points=DEFAULT_BUFFER_POINTS, num_points=None):
+        if data_format not in DATA_FORMATS:
+            raise ValueError(f"Unknown PCD data format: {data_format}")
+        self.path = path
+        self.fields = list(fields)
+        self.data_format = data_format
+        self.buffer_points = max(1, int(buffer_points))
+        self.count = 0
+        self._expected = num_points
+        self._buffer = []
+        self._buffered = 0
+        self._f = open(path, "wb")
+        header = format_header(self.fields, num_points or 0, data_format, pad=num_points is None)
+        self._f.write(header.encode("ascii"))
+
+        self._tmpdir = None
+        self._columns = None
+        if data_format == "binary_compressed":
+            # 大きな点群でも/tmpを使い切らないよう出力先と同じディレクトリに置く
+            self._tmpdir = tempfile.TemporaryDirectory(prefix=".pcd_", dir=os.path.dirname(os.path.abspath(path)))
+            self._columns = [
+                open(os.path.join(self._tmpdir.name, f"{i}.bin"), "w+b") for i in range(len(self.fields))
+            ]
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.close()
+        else:
+            self._cleanup()
+
+    def write(self, points):
+        """(N, len(fields)) の配列を追加する"""
+        points = np.asarray(points, dtype="<f4").reshape(-1, len(self.fields))
+        if len(points) == 0:
+            return
+        self._buffer.append(points)
+        self._buffered += len(points)
+        self.count += len(points)
+        if self._buffered >= self.buffer_points:
+            self.flush()
+
+    def write_encoded(self, src, count):
+        """
+        この形式（ascii・binary）で書き出し済みの点 count 個のデータを src（ファイルオブジェクト）から
+        そのまま追加する。別のプロセスで生成・書式化した点を連結する場合に使う。
+        """
+        if self.data_format == "binary_compressed":
+            raise ValueError("write_encoded is not supported for binary_compressed")
+        self.flush()
+        shutil.copyfileobj(src, self._f, 1 << 20)
+        self.count += count
+
+    def flush(self):
+        if not self._buffer:
+            return
+        points = self._buffer[0] if len(self._buffer) == 1 else np.concatenate(self._buffer)
+        self._buffer = []
+        self._buffered = 0
+        if self.data_format != "binary_compressed":
+            encode_points(self._f, points, self.data_format)
+        else:
+            for k, column in enumerate(self._columns):
+                column.write(np.ascontiguousarray(points[:, k]).tobytes())
+
+    def close(self):
+        if self._f is None:
+            return
+        self.flush()
+        if self._expected is not None and self._expected != self.count:
+            raise ValueError(f"Expected {self._expected} points, got {self.count}")
+        if self.data_format == "binary_compressed":
+            self._write_compressed()
+        if self._expected is None:
+            # 仮の値で書き出した点数を書き換える
+            self._f.seek(0)
+            self._f.write(format_header(self.fields, self.count, self.data_format, pad=True).encode("ascii"))
+        self._f.close()
+        self._f = None
+        self._cleanup()
+
+    def _write_compressed(self):
+        uncompressed = self.count * 4 * len(self.fields)
+        if uncompressed > 0xFFFFFFFF:
+            raise ValueError("binary_compressed PCD data must be smaller than 4 GiB")
+        sizes_at = self._f.tell()
+        self._f.write(struct.pack("<II", 0, uncompressed))
+        compressed = 0
+        block = max(1 << 16, self.buffer_points * 4)
+        for column in self._columns:
+            column.seek(0)
+            while True:
+                data = column.read(block)
+                if not data:
+                    break
+                chunk = lzf_compress(data)
+                self._f.write(chunk)
+                compressed += len(chunk)
+        self._f.seek(sizes_at)
+        self._f.write(struct.pack("<I", compressed))
+        self._f.seek(0, os.SEEK_END)
+
+    def _cleanup(self):
+        if self._columns is not None:
+            for column in self._columns:
+                column.close()
+            self._columns = None
+        if self._tmpdir is not None:
+            self._tmpdir.cleanup()
+            self._tmpdir = None
+        if self._f is not None:
+            self._f.close()
+            self._f = None
+
+
+class TileWriter:
+    """
+    点をXY平面の一辺 tile_size（x・y で異なる場合は (x, y)）の格子で分け、
+    タイルごとのPCDファイル（ascii・binary）に書き出す。
+    タイルのファイルは directory に prefix_<x番号>_<y番号>.pcd の名前で作成し、close で
+    Autowareの pointcloud_map_loader が読み込むメタデータ（各ファイルの x・y の最小値）を書き出す。
+    受け取った点はタイルごとに溜めておき、合計が buffer_points 点に達したら各ファイルに追記する
+    （同時に開くファイルは1つだけなので、タイルが多くてもファイル数の上限に当たらない）。
+    """
+
+    def __init__(self, directory, fields, tile_size, data_format="binary", buffer_points=DEFAULT_BUFFER_POINTS, prefix=None):
+        resolution = tuple(np.broadcast_to(np.asarray(tile_size, dtype=np.float64), (2,)).tolist())
+        if min(resolution) <= 0:
+            raise ValueError("Tile size must be a positive value.")
+        if data_format not in ("ascii", "binary"):
+            raise ValueError(f"Unsupported PCD data format for tiles: {data_format}")
+        self.path = directory
+        self.fields = list(fields)
+        self.tile_size = tile_size
+        self.resolution = resolution
+        self.data_format = data_format
+        self.buffer_points = max(1, int(buffer_points))
+        self.prefix = prefix or os.path.basename(os.path.normpath(directory))
+        self.count = 0
+        # タイル番号 (ix, iy) -> 点数
+        self.tiles = {}
+        self._buffer = {}
+        self._buffered = 0
+        self._closed = False
+        os.makedirs(directory, exist_ok=True)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.close()
+
+    def tile_path(self, key):
+        return os.path.join(self.path, f"{self.prefix}_{key[0]}_{key[1]}.pcd")
+
+    def write(self, points):
+        """(N, len(fields)) の配列を追加する。各タイルの点は受け取った順に並ぶ"""
+        points = np.asarray(points, dtype="<f4").reshape(-1, len(self.fields))
+        if len(points) == 0:
+            return
+        indices = np.floor(points[:, :2].astype(np.float64) / self.resolution).astype(np.int64)
+        keys, inverse = np.unique(indices, axis=0, return_inverse=True)
+        inverse = inverse.reshape(-1)
+        order = np.argsort(inverse, kind="stable")
+        bounds = np.searchsorted(inverse[order], np.arange(len(keys) + 1))
+        for k, (ix, iy) in enumerate(keys.tolist()):
+            self._buffer.setdefault((ix, iy), []).append(points[order[bounds[k]:bounds[k + 1]]])
+        self._buffered += len(points)
+        self.count += len(points)
+        if self._buffered >= self.buffer_points:
+            self.flush()
+
+    def flush(self):
+        for key, chunks in self._buffer.items():
+            path = self.tile_path(key)
+            if key not in self.tiles:
+                # 点数は close で書き換える
+                with open(path, "wb") as f:
+                    f.write(format_header(self.fields, 0, self.data_format, pad=True).encode("ascii"))
+                self.tiles[key] = 0
+            with open(path, "ab") as f:
+                for points in chunks:
+                    encode_points(f, points, self.data_format)
+                    self.tiles[key] += len(points)
+        self._buffer = {}
+        self._buffered = 0
+
+    def close(self):
+        if self._closed:
+            return
+        self.flush()
+        for key, count in self.tiles.items():
+            with open(self.tile_path(key), "r+b") as f:
+                f.write(format_header(self.fields, count, self.data_format, pad=True).encode("ascii"))
+        self.write_metadata()
+        self._closed = True
+
+    @property
+    def metadata_path(self):
+        return os.path.join(self.path, METADATA_FILENAME)
+
+    def write_metadata(self):
+        """pointcloud_map_metadata.yaml（x_resolution・y_resolution と各ファイルの [x_min, y_min]）を書き出す"""
+        x_resolution, y_resolution = self.resolution
+        lines = [f"x_resolution: {x_resolution}", f"y_resolution: {y_resolution}"]
+        for key in sorted(self.tiles):
+            x_min, y_min = key[0] * x_resolution, key[1] * y_resolution
+            lines.append(f"{os.path.basename(self.tile_path(key))}: [{x_min:.15g}, {y_min:.15g}]")
+        with open(self.metadata_path, "w", encoding="utf-8") as f:
+            f.write("\n".join(lines) + "\n")
+
+
+def read_tile_metadata(path):
+    """
+    pointcloud_map_metadata.yaml を読み、(x_resolution, y_resolution, {ファイル名: (x_min, y_min)}) を返す。
+    TileWriter・Autowareの pointcloud_divider が書き出す形式（1行に1項目）だけを扱う。
+    """
+    resolution = {}
+    tiles = {}
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            line = line.split("#", 1)[0].strip()
+            if not line:
+                continue
+            key, _, rest = line.rpartition(":")
+            key, rest = key.strip().strip("'\""), rest.strip()
+            if key in ("x_resolution", "y_resolution"):
+                resolution[key] = float(rest)
+                continue
+            match = re.fullmatch(r"\[\s*([-+0-9.eE]+)\s*,\s*([-+0-9.eE]+)\s*\]", rest)
+            if match is None:
+                raise ValueError(f"Invalid metadata line: {line}")
+            tiles[key] = (float(match.group(1)), float(match.group(2)))
+    if len(resolution) != 2:
+        raise ValueError(f"x_resolution and y_resolution are required: {path}")
+    return resolution["x_resolution"], resolution["y_resolution"], tiles
+
+
+class PCDHeader:
+    """PCDファイルのヘッダ。data_offset はデータ部の先頭のバイト位置"""
+
+    def __init__(self, fields, sizes, types, counts, num_points, data_format, data_offset):
+        self.fields = fields
+        self.sizes = sizes
+        self.types = types
+        self.counts = counts
+        self.num_points = num_points
+        self.data_format = data_format
+        self.data_offset = data_offset
+
+    @property
+    def dtype(self):
+        """1点分のデータの構造化型（binary のデータ部の1行）"""
+        items = []
+        for name, size, type_, count in zip(self.fields, self.sizes, self.types, self.counts):
+            base = _PCD_TYPES.get((type_, size))
+            if base is None:
+                raise ValueError(f"Unsupported PCD field type: {name} TYPE {type_} SIZE {size}")
+            items.append((name, base) if count == 1 else (name, base, (count,)))
+        return np.dtype(items)
+
+    def is_float32(self):
+        """すべてのフィールドが COUNT 1 の float32（PCDWriter で書き出せる形式）か"""
+        return all(t == "F" and s == 4 and c == 1 for s, t, c in zip(self.sizes, self.types, self.counts))
+
+
+def read_pcd_header(path):
+    with open(path, "rb") as f:
+        values = {}
+        while True:
+            line = f.readline()
+            if not line:
+                raise ValueError(f"PCD header has no DATA line: {path}")
+            text = line.decode("ascii", "replace").strip()
+            if not text or text.startswith("#"):
+                continue
+            key, _, rest = text.partition(" ")
+            values[key.upper()] = rest.split()
+            if key.upper() == "DATA":
+                data_offset = f.tell()
+                break
+
+    if "FIELDS" not in values:
+        raise ValueError(f"PCD header has no FIELDS line: {path}")
+    fields = values["FIELDS"]
+    n = len(fields)
+    sizes = [int(v) for v in values.get("SIZE", ["4"] * n)]
+    types = values.get("TYPE", ["F"] * n)
+    counts = [int(v) for v in values.get("COUNT", ["1"] * n)]
+    if "POINTS" in values:
+        num_points = int(values["POINTS"][0])
+    else:
+        num_points = int(values["WIDTH"][0]) * int(values.get("HEIGHT", ["1"])[0])
+    return PCDHeader(fields, sizes, types, counts, num_points, values["DATA"][0], data_offset)
+
+
+def map_pcd(path):
+    """
+    binary のPCDファイルのデータ部をメモリマップした構造化配列として返す（(PCDHeader, 配列)）。
+    ファイルは読み込まれず、配列の一部を参照したときにその範囲だけが読まれる。
+    """
+    header = read_pcd_header(path)
+    if header.data_format != "binary":
+        raise ValueError(f"Only binary PCD can be memory-mapped: {path} is {header.data_format}")
+    dtype = header.dtype
+    if os.path.getsize(path) < header.data_offset + header.num_points * dtype.itemsize:
+        raise ValueError(f"PCD data is shorter than {header.num_points} points: {path}")
+    if header.num_points == 0:
+        return header, np.empty(0, dtype=dtype)
+    return header, np.memmap(path, dtype=dtype, mode="r", offset=header.data_offset, shape=(header.num_points,))
+
+
+def encode_points(f, points, data_format):
+    """points を data_format（ascii・binary）のデータ部の形式で f に書き出す"""
+    if data_format == "ascii":
+        write_ascii_points(f, points)
+    else:
+        f.write(np.ascontiguousarray(points, dtype="<f4").tobytes())
+
+
+def write_pcd(path, points, fields, data_format="ascii"):
+    """points（(N, len(fields)) の配列）を float32 のPCDファイルとして書き出す"""
+    points = np.asarray(points, dtype="<f4").reshape(-1, len(fields))
+    with PCDWriter(path, fields, data_format, buffer_points=max(1, len(points)), num_points=len(points)) as writer:
+        writer.write(points)
+
+
+def lzf_compress(data):
+    """
+    data を liblzf と同じ形式で圧縮する。python-lzf があればそれを使い、
+    なければ同じアルゴリズムのPythonの実装（低速）を使う。
+    """
+    data = bytes(data)
+    if not data:
+        return b""
+    if lzf is not None:
+        compressed = lzf.compress(data)
+        # 圧縮で小さくならない場合は None が返るので、リテラルだけで表す
+        if compressed is not None:
+            return compressed
+        return _lzf_literals(data)
+    return _lzf_compress(data)
+
+
+def _lzf_literals(data):
+    out = bytearray()
+    for start in range(0, len(data), _LZF_MAX_LITERAL):
+        chunk = data[start:start + _LZF_MAX_LITERAL]
+        out.append(len(chunk) - 1)
+        out += chunk
+    return bytes(out)
+
+
+def _lzf_compress(data):
+    n = len(data)
+    out = bytearray()
+    htab = {}
+    lit_start = 0
+    i = 0
+    while i < n - 2:
+        key = data[i:i + 3]
+        ref = htab.get(key)
+        htab[key] = i
+        if ref is None or i - ref > _LZF_MAX_OFFSET:
+            i += 1
+            continue
+
+        # 一致の長さを伸ばす（参照範囲が現在位置と重なってもよい）
+        max_len = min(_LZF_MAX_MATCH, n - i)
+        length = 3
+        while length < max_len and data[ref + length] == data[i + length]:
+            length += 1
+
+        out += _lzf_literals(data[lit_start:i])
+        off = i - ref - 1
+        code = length - 2
+        if code < 7:
+            out.append((code << 5) | (off >> 8))
+        else:
+            out.append((7 << 5) | (off >> 8))
+            out.append(code - 7)
+        out.append(off & 0xFF)
+
+        # 一致の最後の位置も次の検索に使えるようにする
+        end = i + length
+        if end < n - 2:
+            htab[data[end - 1:end + 2]] = end - 1
+        i = end
+        lit_start = i
+
+    out += _lzf_literals(data[lit_start:])
+    return bytes(out)
+
+
+def lzf_decompress(data, size):
+    """lzf_compress の逆変換。size は展開後のバイト数"""
+    if lzf is not None and size > 0:
+        try:
+            out = lzf.decompress(bytes(data), size)
+        except ValueError as e:
+            raise ValueError(f"Invalid LZF data: {e}") from e
+        # python-lzf は足りない場合も展開できた分だけを返し、size を超える場合は None を返す
+        if out is None or len(out) != size:
+            raise ValueError(f"Invalid LZF data: expected {size} bytes, got {'more' if out is None else len(out)}")
+        return out
+    out = bytearray()
+    i = 0
+    n = len(data)
+    while i < n:
+        ctrl = data[i]
+        i += 1
+        if ctrl < 32:
+            length = ctrl + 1
+            out += data[i:i + length]
+            i += length
+            continue
+        length = ctrl >> 5
+        if length == 7:
+            length += data[i]
+            i += 1
+        ref = len(out) - ((ctrl & 0x1F) << 8) - data[i] - 1
+        i += 1
+        length += 2
+        if ref < 0:
+            raise ValueError("Invalid LZF data: back reference before start")
+        if ref + length <= len(out):
+            out += out[ref:ref + length]
+        else:
+            for k in range(length):
+                out.append(out[ref + k])
+    if len(out) != size:
+        raise ValueError(f"Invalid LZF data: expected {size} bytes, got {len(out)}")
+    return bytes(out)
@@ -0,0 +1,190 @@
+import atexit
+import json
+import os
+import sys
+import time
+from contextlib import contextmanager
+from datetime import datetime, timezone
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+PROFILE_ENV = "MAP_UTILS_PROFILE"
+PROFILE_JSON_ENV = "MAP_UTILS_PROFILE_JSON"
+
+
+def peak_rss_mb():
+    """プロセス開始からのピークRSS[MB]。取得できない環境ではNone"""
+    if resource is None:
+        return None
+    maxrss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss はLinuxではKB、macOSではバイト単位
+    if sys.platform == "darwin":
+        return maxrss / (1024 * 1024)
+    return maxrss / 1024
+
+
+class Phase:
+    """1つのフェーズの計測結果"""
+
+    def __init__(self, name, depth):
+        self.name = name
+        self.depth = depth
+        self.wall = 0.0
+        self.cpu = 0.0
+        self.peak_rss_mb = None
+        self.counts = {}
+
+    def count(self, **counts):
+        """要素数などをフェーズに記録する。同じキーは加算する"""
+        for key, value in counts.items():
+            self.counts[key] = self.counts.get(key, 0) + value
+
+    def to_dict(self):
+        return {
+            "name": self.name,
+            "depth": self.depth,
+            "wall": self.wall,
+            "cpu": self.cpu,
+            "peak_rss_mb": self.peak_rss_mb,
+            "counts": self.counts,
+        }
+
+
+class _NullPhase:
+    def count(self, **counts):
+        pass
+
+
+_NULL_PHASE = _NullPhase()
+
+
+class Profiler:
+    """
+    フェーズごとの実行時間・CPU時間・ピークRSS・要素数を記録する。
+    無効の場合は phase・count は何もしない。
+    """
+
+    def __init__(self, tool="", enabled=False, json_path=None):
+        self.tool = tool
+        self.enabled = enabled
+        self.json_path = json_path
+        self.phases = []
+        self._depth = 0
+        self._started = datetime.now(timezone.utc)
+        self._wall_start = time.perf_counter()
+        self._cpu_start = time.process_time()
+        self._reported = False
+
+    @contextmanager
+    def phase(self, name):
+        """with ブロックの処理を name のフェーズとして計測する。入れ子にできる"""
+        if not self.enabled:
+            yield _NULL_PHASE
+            return
+        phase = Phase(name, self._depth)
+        self.phases.append(phase)
+        self._depth += 1
+        wall_start = time.perf_counter()
+        cpu_start = time.process_time()
+        try:
+            yield phase
+        finally:
+            phase.wall = time.perf_counter() - wall_start
+            phase.cpu = time.process_time() - cpu_start
+            phase.peak_rss_mb = peak_rss_mb()
+            self._depth -= 1
+
+    def to_dict(self):
+        return {
+            "tool": self.tool,
+            "argv": sys.argv[1:],
+            "started": self._started.isoformat(),
+            "phases": [phase.to_dict() for phase in self.phases],
+            "total": {
+                "wall": time.perf_counter() - self._wall_start,
+                "cpu": time.process_time() - self._cpu_start,
+                "peak_rss_mb": peak_rss_mb(),
+            },
+        }
+
+    def lines(self):
+        data = self.to_dict()
+        rows = [(("  " * p["depth"]) + p["name"], p) for p in data["phases"]]
+        rows.append(("total", dict(data["total"], counts={})))
+        width = max(len(label) for label, _ in rows + [("phase", None)])
+        lines = [
+            f"=== profile: {self.tool} ===",
+            f"{'phase':<{width}} {'wall[s]':>9} {'cpu[s]':>9} {'peak RSS[MB]':>13}  counts",
+        ]
+        for label, p in rows:
+            rss = "-" if p["peak_rss_mb"] is None else f"{p['peak_rss_mb']:.1f}"
+            counts = ", ".join(f"{k}={v}" for k, v in p["counts"].items())
+            lines.append(f"{label:<{width}} {p['wall']:>9.3f} {p['cpu']:>9.3f} {rss:>13}  {counts}".rstrip())
+        return lines
+
+    def report(self, stream=None):
+        """
+        計測結果を stream（省略時は標準エラー出力）に表示し、json_path が指定されていれば
+        JSONとして保存する。json_path が .jsonl の場合は1行ずつ追記する。
+        """
+        if not self.enabled or self._reported:
+            return
+        self._reported = True
+        stream = stream or sys.stderr
+        for line in self.lines():
+            print(line, file=stream)
+
+        if self.json_path:
+            data = self.to_dict()
+            if self.json_path.endswith(".jsonl"):
+                with open(self.json_path, "a", encoding="utf-8") as f:
+                    f.write(json.dumps(data, ensure_ascii=False) + "\n")
+            else:
+                with open(self.json_path, "w", encoding="utf-8") as f:
+                    json.dump(data, f, ensure_ascii=False, indent=2)
+
+
+_profiler = Profiler()
+
+
+def get_profiler():
+    """init_profiler で設定したProfiler（未設定の場合は無効のProfiler）を返す"""
+    return _profiler
+
+
+def init_profiler(tool, argv=None):
+    """
+    計測を設定する。argv（省略時は sys.argv）から --profile・--profile-json PATH を
+    取り除いて解釈するため、引数の解析より前に呼び出す。
+    環境変数 MAP_UTILS_PROFILE=1・MAP_UTILS_PROFILE_JSON=PATH でも有効にできる。
+    有効な場合は終了時に結果を表示する。
+    """
+    global _profiler
+    if argv is None:
+        argv = sys.argv
+
+    enabled = os.environ.get(PROFILE_ENV, "0") not in ("", "0")
+    json_path = os.environ.get(PROFILE_JSON_ENV) or None
+
+    remaining = [argv[0]] if argv else []
+    args = iter(argv[1:])
+    for arg in args:
+        if arg == "--profile":
+            enabled = True
+        elif arg == "--profile-json":
+            json_path = next(args, None)
+        elif arg.startswith("--profile-json="):
+            json_path = arg.split("=", 1)[1]
+        else:
+            remaining.append(arg)
+    argv[:] = remaining
+
+    if json_path:
+        enabled = True
+    _profiler = Profiler(tool, enabled, json_path)
+    if enabled:
+        atexit.register(_profiler.report)
+    return _profiler
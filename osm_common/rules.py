@@ -0,0 +1,217 @@
+import math
+
+from .osm_loader import COORD_KEYS
+from .validator import Rule
+
+
+class CrosswalkRegulatoryRule(Rule):
+    """regulatory_element から一度も参照されていない crosswalk lanelet を探す"""
+
+    name = "check_crosswalk_regulatory"
+
+    def __init__(self):
+        self.lanelet_crosswalk_ids = set()
+        self.referenced_ids = set()
+        self.unreferenced_ids = set()
+
+    def visit_relation(self, osm, i, relation):
+        tags = relation.tags
+        if tags.get("type") == "lanelet" and tags.get("subtype") == "crosswalk":
+            self.lanelet_crosswalk_ids.add(relation.id)
+        elif tags.get("type") == "regulatory_element" and tags.get("subtype") == "crosswalk":
+            for member in relation.members:
+                if member.type == "relation" and member.role == "refers":
+                    self.referenced_ids.add(member.ref)
+
+    def finish(self, osm):
+        self.unreferenced_ids = self.lanelet_crosswalk_ids - self.referenced_ids
+
+    def report(self):
+        if not self.unreferenced_ids:
+            return ["すべての crosswalk lanelet は regulatory_element から参照されています。"]
+        return ["一度も参照されていない crosswalk lanelet relation の ID:"] + [
+            str(rid) for rid in sorted(self.unreferenced_ids)
+        ]
+
+    def count(self):
+        return len(self.unreferenced_ids)
+
+
+class SignalConfigRule(Rule):
+    """cp.signal_id と traffic_light の regulatory_element の対応を検査する"""
+
+    name = "check_signal_config"
+
+    def __init__(self):
+        self.traffic_light_ids = set()
+        self.referenced_signal_ids = set()
+        self.unused_ids = []
+        self.invalid_signal_ids = []
+
+    def visit_relation(self, osm, i, relation):
+        tags = relation.tags
+        if tags.get("type") == "regulatory_element" and tags.get("subtype") == "traffic_light":
+            self.traffic_light_ids.add(str(relation.id))
+        # 同じキーが複数ある場合も拾うため、インターン前のタグの並びを見る
+        for k, v in osm.tags.items[osm.relations.tag_ids[i]]:
+            if k == "cp.signal_id":
+                self.referenced_signal_ids.add(v)
+
+    def finish(self, osm):
+        # traffic_light_ids に含まれない cp.signal_id
+        self.invalid_signal_ids = sorted(
+            [sid for sid in self.referenced_signal_ids if sid not in self.traffic_light_ids],
+            key=lambda x: int(x)
+        )
+        # 未使用の traffic_light relation ID
+        self.unused_ids = sorted(
+            [rid for rid in self.traffic_light_ids if rid not in self.referenced_signal_ids],
+            key=lambda x: int(x)
+        )
+
+    def report(self):
+        lines = []
+        if self.unused_ids:
+            lines.append("Unused traffic light relation IDs:")
+            lines.extend(self.unused_ids)
+        else:
+            lines.append("すべてのtraffic_light relationはcp.signal_idとして参照されています。")
+
+        lines.append("")
+
+        if self.invalid_signal_ids:
+            lines.append("cp.signal_idに指定されているが、対応するtraffic_light relationが存在しないID:")
+            lines.extend(self.invalid_signal_ids)
+        else:
+            lines.append("cp.signal_idに存在しないtraffic_light relationの参照はありません。")
+        return lines
+
+    def count(self):
+        return len(self.unused_ids) + len(self.invalid_signal_ids)
+
+
+def load_exclusion_list(filepath):
+    """除外リストファイルを読み込んでセットとして返す"""
+    try:
+        with open(filepath, 'r', encoding='utf-8') as f:
+            return set(line.strip() for line in f if line.strip())
+    except FileNotFoundError:
+        print(f"Warning: Exclusion file '{filepath}' not found. Ignoring.")
+        return set()
+
+
+def is_numeric(value):
+    """数値データかどうかを判定する"""
+    try:
+        float(value)
+        return True
+    except ValueError:
+        return False
+
+
+class KvTypoRule(Rule):
+    """タグの key と非数値の value を一覧にする"""
+
+    name = "check_kvtypo"
+
+    def __init__(self, exclude_keys=None, exclude_values=None):
+        self.exclude_keys = exclude_keys or set()
+        self.exclude_values = exclude_values or set()
+        self.keys = set()
+        self.values = set()
+
+    def finish(self, osm):
+        # 座標タグは配列に格納されているので、値を持つノードがあればkeyとして扱う
+        # （座標の値は数値なのでvalueには含めない）
+        for key, column in zip(COORD_KEYS, (osm.nodes.x, osm.nodes.y, osm.nodes.z)):
+            if key not in self.exclude_keys and any(not math.isnan(v) for v in column):
+                self.keys.add(key)
+
+        # タグ集合はインターンされているので、重複のない集合だけを走査すればよい
+        for items in osm.tags.items:
+            for key, value in items:
+                if key and key not in self.exclude_keys:
+                    self.keys.add(key)
+                if value and not is_numeric(value) and value not in self.exclude_values:
+                    self.values.add(value)
+
+    def report(self):
+        lines = ["Keys:"]
+        lines.extend(f"  {key}" for key in sorted(self.keys))
+        lines.append("")
+        lines.append("Values:")
+        lines.extend(f"  {value}" for value in sorted(self.values))
+        return lines
+
+    def count(self):
+        return len(self.keys) + len(self.values)
+
+
+class RelationNodeCountRule(Rule):
+    """lanelet の左右の way のノード数が異なるものを探す"""
+
+    name = "osm_relation_checker"
+
+    def __init__(self):
+        self.differences = []
+
+    @staticmethod
+    def count_way_nodes(osm, way_id):
+        i = osm.ways.lookup(way_id)
+        if i is None:
+            return 0
+        return osm.ways.offsets[i + 1] - osm.ways.offsets[i]
+
+    def visit_relation(self, osm, i, relation):
+        members = {m.role: m.ref for m in relation.members if m.role in ["left", "right"]}
+        if "left" in members and "right" in members:
+            left_count = self.count_way_nodes(osm, members["left"])
+            right_count = self.count_way_nodes(osm, members["right"])
+            if left_count != right_count:
+                self.differences.append((relation.id, left_count, right_count))
+
+    def report(self):
+        if not self.differences:
+            return ["No relations found with differing left and right node counts."]
+        return [
+            f"Relation ID: {rid}, Left nodes: {left}, Right nodes: {right}"
+            for rid, left, right in self.differences
+        ]
+
+    def count(self):
+        return len(self.differences)
+
+
+class SpeedLimitRule(Rule):
+    """speed_limit が範囲内の road lanelet（turn_direction なし）を探す"""
+
+    name = "find_lanelet_speed_limit"
+
+    def __init__(self, lower=10, upper=10):
+        self.lower = lower
+        self.upper = upper
+        self.result_ids = []
+
+    def visit_relation(self, osm, i, relation):
+        tags = relation.tags
+
+        # type=lanelet, subtype=road, and no turn_direction tag
+        if (
+            tags.get("type") == "lanelet" and
+            tags.get("subtype") == "road" and
+            "turn_direction" not in tags
+        ):
+            speed_limit = tags.get("speed_limit")
+            if speed_limit is not None:
+                try:
+                    speed = float(speed_limit)
+                except ValueError:
+                    return  # skip if speed_limit is not a valid float
+                if self.lower <= speed <= self.upper:
+                    self.result_ids.append(relation.id)
+
+    def report(self):
+        return [str(rid) for rid in self.result_ids]
+
+    def count(self):
+        return len(self.result_ids)
@@ -0,0 +1,216 @@
+import hashlib
+import json
+import mmap
+import os
+import struct
+import sys
+import tempfile
+
+from .osm_loader import OSMData, parse_osm
+from .profiler import get_profiler
+
+# スナップショットのファイル形式
+#   ヘッダ: magic, version, バイトオーダー, 元ファイルのサイズ・mtime・sha256, セクション数
+#   セクション表: 名前, 配列の型コード, オフセット, バイト長
+#   本体: 8バイト境界に揃えた配列の生データと、文字列・タグを格納したJSON
+MAGIC = b"MAPUSNAP"
+VERSION = 1
+_HEADER = struct.Struct("<8sIIqq32sI")
+_SECTION = struct.Struct("<16s8sqq")
+_ALIGN = 8
+
+# (セクション名, ストア名, 属性名)
+_ARRAYS = [
+    ("node_ids", "nodes", "ids"),
+    ("node_x", "nodes", "x"),
+    ("node_y", "nodes", "y"),
+    ("node_z", "nodes", "z"),
+    ("node_tag_ids", "nodes", "tag_ids"),
+    ("way_ids", "ways", "ids"),
+    ("way_offsets", "ways", "offsets"),
+    ("way_refs", "ways", "refs"),
+    ("way_tag_ids", "ways", "tag_ids"),
+    ("rel_ids", "relations", "ids"),
+    ("rel_offsets", "relations", "offsets"),
+    ("rel_member_types", "relations", "member_types"),
+    ("rel_member_refs", "relations", "member_refs"),
+    ("rel_member_roles", "relations", "member_roles"),
+    ("rel_tag_ids", "relations", "tag_ids"),
+]
+_BLOB = "blob"
+
+
+class SnapshotError(Exception):
+    pass
+
+
+def snapshot_enabled():
+    return os.environ.get("MAP_UTILS_SNAPSHOT", "1") != "0"
+
+
+def cache_dir():
+    """スナップショットの保存先。環境変数 MAP_UTILS_CACHE_DIR で変更できる"""
+    return os.environ.get("MAP_UTILS_CACHE_DIR") or os.path.join(os.path.expanduser("~"), ".cache", "map_utils")
+
+
+def snapshot_path(source, directory=None):
+    """元ファイルの絶対パスごとに一意なスナップショットのパスを返す"""
+    source = os.path.abspath(source)
+    key = hashlib.sha1(source.encode("utf-8")).hexdigest()[:16]
+    return os.path.join(directory or cache_dir(), f"{os.path.basename(source)}.{key}.snap")
+
+
+def file_sha256(path):
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            h.update(chunk)
+    return h.digest()
+
+
+def _byteorder_flag():
+    return 1 if sys.byteorder == "little" else 0
+
+
+def _pad(f):
+    remainder = f.tell() % _ALIGN
+    if remainder:
+        f.write(b"\0" * (_ALIGN - remainder))
+
+
+def write_snapshot(osm, snap_path, source_stat, source_hash):
+    """OSMData をスナップショットとして書き出す。書き込みは一時ファイル経由で置き換える"""
+    blob = json.dumps({
+        "path": osm.path,
+        "root_attrib": osm.root_attrib,
+        "meta": osm.meta,
+        "strings": osm.strings.strings,
+        "tags": osm.tags.items[1:],
+    }, ensure_ascii=False).encode("utf-8")
+
+    sections = [(name, getattr(getattr(osm, store), attr)) for name, store, attr in _ARRAYS]
+    header_size = _HEADER.size + _SECTION.size * (len(sections) + 1)
+
+    directory = os.path.dirname(snap_path)
+    os.makedirs(directory, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=directory, suffix=".tmp")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(b"\0" * header_size)
+            table = []
+            for name, values in sections:
+                _pad(f)
+                offset = f.tell()
+                f.write(memoryview(values).cast("B"))
+                table.append((name, values.typecode, offset, f.tell() - offset))
+            _pad(f)
+            table.append((_BLOB, "B", f.tell(), len(blob)))
+            f.write(blob)
+
+            f.seek(0)
+            f.write(_HEADER.pack(
+                MAGIC, VERSION, _byteorder_flag(), source_stat.st_size,
+                source_stat.st_mtime_ns, source_hash, len(table),
+            ))
+            for name, typecode, offset, length in table:
+                f.write(_SECTION.pack(name.encode(), typecode.encode(), offset, length))
+        os.replace(tmp_path, snap_path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+
+def _read_header(mm):
+    if len(mm) < _HEADER.size:
+        raise SnapshotError("snapshot is truncated")
+    magic, version, byteorder, size, mtime_ns, source_hash, count = _HEADER.unpack_from(mm, 0)
+    if magic != MAGIC or version != VERSION or byteorder != _byteorder_flag():
+        raise SnapshotError("incompatible snapshot")
+    sections = {}
+    for n in range(count):
+        name, typecode, offset, length = _SECTION.unpack_from(mm, _HEADER.size + n * _SECTION.size)
+        sections[name.rstrip(b"\0").decode()] = (typecode.rstrip(b"\0").decode(), offset, length)
+    return size, mtime_ns, source_hash, sections
+
+
+def read_snapshot(snap_path):
+    """スナップショットをmmapで開き、配列をmemoryviewとして参照するOSMDataを返す"""
+    with open(snap_path, "rb") as f:
+        mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    _, _, _, sections = _read_header(mm)
+    view = memoryview(mm)
+
+    typecode, offset, length = sections[_BLOB]
+    blob = json.loads(bytes(view[offset:offset + length]).decode("utf-8"))
+
+    osm = OSMData(blob["path"])
+    osm.root_attrib = blob["root_attrib"]
+    osm.meta = [tuple(m) for m in blob["meta"]]
+    for s in blob["strings"]:
+        osm.strings.intern(s)
+    for items in blob["tags"]:
+        osm.tags.intern(tuple(map(tuple, items)))
+
+    for name, store, attr in _ARRAYS:
+        typecode, offset, length = sections[name]
+        setattr(getattr(osm, store), attr, view[offset:offset + length].cast(typecode))
+    for store in (osm.nodes, osm.ways, osm.relations):
+        store._index = None
+    # memoryviewが参照している間mmapを保持する
+    osm.mmap = mm
+    return osm
+
+
+def _is_fresh(snap_path, source, st):
+    """
+    スナップショットが元ファイルに対応しているか判定する。
+    サイズとmtimeが一致すれば有効とし、mtimeだけが異なる場合は
+    sha256を比較して一致すればヘッダのmtimeを更新する。
+    """
+    try:
+        with open(snap_path, "rb") as f:
+            header = f.read(_HEADER.size)
+        magic, version, byteorder, size, mtime_ns, source_hash, count = _HEADER.unpack(header)
+    except (OSError, struct.error):
+        return False
+    if magic != MAGIC or version != VERSION or byteorder != _byteorder_flag() or size != st.st_size:
+        return False
+    if mtime_ns == st.st_mtime_ns:
+        return True
+    if file_sha256(source) != source_hash:
+        return False
+    try:
+        with open(snap_path, "r+b") as f:
+            f.write(_HEADER.pack(magic, version, byteorder, size, st.st_mtime_ns, source_hash, count))
+    except OSError:
+        pass
+    return True
+
+
+def load_with_snapshot(path, directory=None):
+    """
+    スナップショットがあればmmapで読み込み、無い・古い場合はosmファイルを
+    読み込み直してスナップショットを作成する。
+    キャッシュに書き込めない場合はosmファイルを読み込んだ結果をそのまま返す。
+    """
+    st = os.stat(path)
+    snap_path = snapshot_path(path, directory)
+    profiler = get_profiler()
+    if _is_fresh(snap_path, path, st):
+        try:
+            with profiler.phase("read_snapshot"):
+                osm = read_snapshot(snap_path)
+            osm.path = path
+            return osm
+        except (OSError, ValueError, KeyError, SnapshotError):
+            pass
+
+    source_hash = file_sha256(path)
+    osm = parse_osm(path)
+    try:
+        with profiler.phase("write_snapshot"):
+            write_snapshot(osm, snap_path, st, source_hash)
+    except OSError as e:
+        print(f"Warning: could not write snapshot '{snap_path}': {e}", file=sys.stderr)
+    return osm
@@ -0,0 +1,105 @@
+import time
+
+from .osm_loader import load_osm
+from .profiler import get_profiler
+
+
+class Rule:
+    """
+    検証ルールの基底クラス。
+    エンジンが地図を1回走査する間に visit_way / visit_relation が呼ばれ、
+    走査後に finish が呼ばれる。結果は report が返す行のリストとして出力する。
+    """
+
+    name = "rule"
+
+    def visit_way(self, osm, i, way):
+        pass
+
+    def visit_relation(self, osm, i, relation):
+        pass
+
+    def finish(self, osm):
+        pass
+
+    def report(self):
+        return []
+
+    def count(self):
+        """report で報告した件数（複数ファイルの結果の集計に使う）"""
+        return 0
+
+
+def _overrides(rule, method):
+    return getattr(type(rule), method) is not getattr(Rule, method)
+
+
+class ValidationReport:
+    """run_rules の結果。ルールごとの出力と処理時間を保持する"""
+
+    def __init__(self, path, load_seconds):
+        self.path = path
+        self.load_seconds = load_seconds
+        self.rules = []
+        self.seconds = {}
+
+    def lines(self):
+        lines = []
+        for rule in self.rules:
+            lines.append(f"=== {rule.name} ===")
+            lines.extend(rule.report())
+            lines.append("")
+        lines.append("=== timing ===")
+        lines.append(f"load_osm: {self.load_seconds:.3f} s")
+        for rule in self.rules:
+            lines.append(f"{rule.name}: {self.seconds[rule.name]:.3f} s")
+        return lines
+
+
+def run_rules(osm, rules):
+    """
+    rules を1回の走査でまとめて実行する。
+    osm にはファイルパスか load_osm 済みの OSMData を渡す。
+    """
+    load_seconds = 0.0
+    if isinstance(osm, str):
+        start = time.perf_counter()
+        osm = load_osm(osm)
+        load_seconds = time.perf_counter() - start
+
+    with get_profiler().phase("run_rules") as phase:
+        report = _run_rules(osm, rules, load_seconds)
+        phase.count(rules=len(report.rules), ways=len(osm.ways), relations=len(osm.relations))
+    return report
+
+
+def _run_rules(osm, rules, load_seconds):
+    report = ValidationReport(osm.path, load_seconds)
+    report.rules = list(rules)
+    seconds = {rule.name: 0.0 for rule in rules}
+
+    way_rules = [rule for rule in rules if _overrides(rule, "visit_way")]
+    if way_rules:
+        for i in range(len(osm.ways)):
+            way = osm.way(i)
+            for rule in way_rules:
+                start = time.perf_counter()
+                rule.visit_way(osm, i, way)
+                seconds[rule.name] += time.perf_counter() - start
+
+    relation_rules = [rule for rule in rules if _overrides(rule, "visit_relation")]
+    if relation_rules:
+        for i in range(len(osm.relations)):
+            relation = osm.relation(i)
+            for rule in relation_rules:
+                start = time.perf_counter()
+                rule.visit_relation(osm, i, relation)
+                seconds[rule.name] += time.perf_counter() - start
+
+    for rule in rules:
+        start = time.perf_counter()
+        rule.finish(osm)
+        seconds[rule.name] += time.perf_counter() - start
+
+    report.seconds = seconds
+    return report
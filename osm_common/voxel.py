@@ -0,0 +1,140 @@
+import numpy as np
+
+_EMPTY = -1
+_MAX_LOAD = 0.5
+_INDEX_LIMIT = 2 ** 31 - 1
+# 表の1スロットあたりのバイト数（キー int32×3・使用中フラグ・取り合い用 int64）
+SLOT_BYTES = 3 * 4 + 1 + 8
+
+
+class VoxelMemoryError(MemoryError):
+    """ボクセルの表が指定したメモリの上限を超える"""
+
+
+def voxel_indices(points, size):
+    """点 (N, 3以上) を含むボクセルの整数座標 (N, 3)"""
+    indices = np.floor(np.asarray(points)[:, :3] / size)
+    if len(indices) and np.abs(indices).max() >= _INDEX_LIMIT:
+        raise ValueError("Voxel size is too small for the coordinate range.")
+    return indices.astype(np.int32)
+
+
+class VoxelGrid:
+    """
+    ボクセルの整数座標の集合。開番地法のハッシュ表を配列で持ち、点の配列をまとめて追加する。
+    追加にかかる時間は点の数に比例する（表の拡張時の再配置を含めても平均して線形）。
+    max_bytes を指定した場合、表（拡張時は拡張前のキーを含む）がそれを超えるときは VoxelMemoryError を送出する。
+    """
+
+    def __init__(self, capacity=1 << 16, max_bytes=None):
+        self.size = 0
+        self.max_bytes = max_bytes
+        self._allocate(min(capacity, self._max_capacity()) if max_bytes is not None else capacity)
+
+    def _max_capacity(self):
+        # 表の大きさは2の冪に切り上げるため、max_bytes に収まる最大の2の冪
+        return 1 << max(4, int(self.max_bytes // SLOT_BYTES).bit_length() - 1)
+
+    def _allocate(self, capacity):
+        capacity = 1 << max(4, int(capacity - 1).bit_length())
+        self.capacity = capacity
+        self.keys = np.empty((capacity, 3), dtype=np.int32)
+        self.used = np.zeros(capacity, dtype=bool)
+        # 同じスロットを取り合った場合に先の点を選ぶための作業領域
+        self._claim = np.full(capacity, _EMPTY, dtype=np.int64)
+
+    def _hash(self, keys):
+        k = keys.astype(np.uint64)
+        h = (k[:, 0] * np.uint64(73856093)) ^ (k[:, 1] * np.uint64(19349663)) ^ (k[:, 2] * np.uint64(83492791))
+        h ^= h >> np.uint64(29)
+        h *= np.uint64(0xBF58476D1CE4E5B9)
+        h ^= h >> np.uint64(32)
+        return (h & np.uint64(self.capacity - 1)).astype(np.int64)
+
+    def _grow(self, required):
+        old_keys = self.keys[self.used]
+        capacity = self.capacity
+        while required > capacity * _MAX_LOAD:
+            capacity *= 2
+        if self.max_bytes is not None:
+            needed = capacity * SLOT_BYTES + old_keys.nbytes
+            if needed > self.max_bytes:
+                raise VoxelMemoryError(
+                    f"The voxel table for up to {required} voxels needs {needed / 2 ** 20:.0f} MB, "
+                    f"more than the limit of {self.max_bytes / 2 ** 20:.0f} MB."
+                )
+        self._allocate(capacity)
+        self.size = 0
+        if len(old_keys):
+            self.add(old_keys)
+
+    def add(self, keys):
+        """
+        keys (N, 3) を追加し、新たに追加されたものを真とする配列を返す。
+        keys の中で重複する場合は最初のものだけが真になる。
+        """
+        keys = np.asarray(keys, dtype=np.int32).reshape(-1, 3)
+        n = len(keys)
+        if (self.size + n) > self.capacity * _MAX_LOAD:
+            self._grow(self.size + n)
+
+        mask = self.capacity - 1
+        slots = self._hash(keys)
+        added = np.zeros(n, dtype=bool)
+        pending = np.arange(n)
+        while pending.size:
+            s = slots[pending]
+            used = self.used[s]
+            same = used & (self.keys[s] == keys[pending]).all(axis=1)
+
+            # 空いているスロットは番号の小さい点が取る（代入は後のものが残るので逆順に代入する）
+            free = ~used
+            candidates = pending[free]
+            candidate_slots = s[free]
+            self._claim[candidate_slots[::-1]] = candidates[::-1]
+            won = self._claim[candidate_slots] == candidates
+            self._claim[candidate_slots] = _EMPTY
+            winners = candidates[won]
+            winner_slots = candidate_slots[won]
+            self.used[winner_slots] = True
+            self.keys[winner_slots] = keys[winners]
+            added[winners] = True
+            self.size += len(winners)
+
+            # 別のキーが入っているスロットは次のスロットを調べ、取り合いに負けた点は同じスロットを調べ直す
+            collided = pending[used & ~same]
+            slots[collided] = (slots[collided] + 1) & mask
+            pending = np.sort(np.concatenate([collided, candidates[~won]]))
+        return added
+
+
+class VoxelFilter:
+    """
+    writer に渡す点を、すでに点のあるボクセルに入るものを除いてから渡す。
+    各ボクセルには最初に現れた点が残る（位置はボクセルの中心に寄せない）。
+    max_bytes はボクセルの表のメモリの上限（VoxelGrid を参照）。
+    """
+
+    def __init__(self, writer, size, max_bytes=None):
+        if size <= 0:
+            raise ValueError("Voxel size must be a positive value.")
+        self.writer = writer
+        self.size = size
+        self.grid = VoxelGrid(max_bytes=max_bytes)
+        self.received = 0
+        self.kept = 0
+
+    @property
+    def path(self):
+        return self.writer.path
+
+    def write(self, points):
+        if len(points) == 0:
+            return
+        added = self.grid.add(voxel_indices(points, self.size))
+        self.received += len(points)
+        self.kept += int(added.sum())
+        self.writer.write(points[added])
+
+    def close(self):
+        self.writer.close()
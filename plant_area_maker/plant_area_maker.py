@@ -1,8 +1,35 @@
-import xml.etree.ElementTree as ET
 import numpy as np
+import abc
 import os
+import sys
 import argparse
+import shutil
 import struct
+import tempfile
+import zlib
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from osm_common.map_index import MapIndex
+from osm_common.pcd import (
+    DATA_FORMATS, METADATA_FILENAME, PCDWriter, TileWriter, encode_points, map_pcd, read_pcd_header, read_tile_metadata,
+)
+from osm_common.profiler import get_profiler, init_profiler
+from osm_common.voxel import VoxelFilter, VoxelMemoryError
+
+# Approximate bytes held per generated point (float64 intermediates, float32 output and write buffer)
+BYTES_PER_POINT = 144
+# volume: fill the whole volume up to height, shell: only the top face and the side walls
+FILL_MODES = ("volume", "shell")
+# uniform: points on the step grid, jitter: each rung point moved randomly within its grid cell
+SAMPLING_MODES = ("uniform", "jitter")
+# Bisection iterations when choosing a per-relation step under a point budget
+PLAN_STEP_ITERATIONS = 30
+# append: keep every point of the base map, replace: drop the base points inside the plant areas
+MERGE_MODES = ("append", "replace")
+# Points per parallel task when no memory ceiling is given
+DEFAULT_TASK_POINTS = 1 << 20
 
 # Function to generate unique output filename
 def generate_output_filename(input_file, suffix="plant", extension=".pcd"):
@@ -16,21 +43,16 @@ def generate_output_filename(input_file, suffix="plant", extension=".pcd"):
 
     return output_file
 
-# Function to calculate the plane normal vector from 4 points
-def calculate_plane_normal(points):
-    if len(points) != 4:
-        raise ValueError("Exactly 4 points are required to calculate the plane normal.")
+# Function to fit the plane z = a * x + b * y + c to 3 or more points (least squares)
+def fit_plane(points):
+    if len(points) < 3:
+        raise ValueError("At least 3 points are required to calculate the plane.")
 
     x_coords, y_coords, z_coords = zip(*points)
 
-    P = np.array([
-        [x_coords[0], y_coords[0], 1],
-        [x_coords[1], y_coords[1], 1],
-        [x_coords[2], y_coords[2], 1],
-        [x_coords[3], y_coords[3], 1]
-    ])
+    P = np.column_stack([x_coords, y_coords, np.ones(len(x_coords))])
 
-    Z = np.array(z_coords).reshape(4, 1)
+    Z = np.array(z_coords).reshape(-1, 1)
 
     P_T = P.T
     try:
@@ -38,7 +60,11 @@ def calculate_plane_normal(points):
     except np.linalg.LinAlgError:
         raise ValueError("Matrix is singular or nearly singular. Cannot compute the plane.")
 
-    a, b, c = plane_params.flatten()
+    return plane_params.flatten()
+
+# Function to calculate the plane normal vector from 3 or more points
+def calculate_plane_normal(points):
+    a, b, c = fit_plane(points)
     normal_vector = np.array([a, b, -1])
     normal_vector /= np.linalg.norm(normal_vector)
 
@@ -49,175 +75,828 @@ def rgb_to_float(r, g, b):
     rgb_int = (r << 16) | (g << 8) | b
     return struct.unpack('f', struct.pack('I', rgb_int))[0]
 
-# Function to fill the lane area
-def fill_lane_area(left_point1, left_point2, right_point1, right_point2, step, height=None, value=1.0):
-    if step <= 0:
-        raise ValueError("Step must be a positive value.")
-
-    def calculate_distance(p1, p2):
-        return np.linalg.norm(np.array(p2) - np.array(p1))
-
-    def calculate_num_points(p1, p2, step):
-        distance = calculate_distance(p1, p2)
-        return int(np.ceil(distance / step))
-
-    left_distance = calculate_distance(left_point1, left_point2)
-    right_distance = calculate_distance(right_point1, right_point2)
-
-    if left_distance >= right_distance:
-        long_line_points = [left_point1, left_point2]
-        short_line_points = [right_point1, right_point2]
-    else:
-        long_line_points = [right_point1, right_point2]
-        short_line_points = [left_point1, left_point2]
-
-    num_points_long = calculate_num_points(long_line_points[0], long_line_points[1], step)
-
-    long_line_points_generated = [tuple(np.array(long_line_points[0]) + i * (np.array(long_line_points[1]) - np.array(long_line_points[0])) / num_points_long) for i in range(num_points_long + 1)]
-    short_line_points_generated = [tuple(np.array(short_line_points[0]) + i * (np.array(short_line_points[1]) - np.array(short_line_points[0])) / num_points_long) for i in range(num_points_long + 1)]
-
-    filled_points = []
-    for p1, p2 in zip(long_line_points_generated, short_line_points_generated):
-        filled_points.extend(generate_line_points(p1, p2, step))
+# Interpolate points between starts[k] and ends[k] divided into counts[k] segments
+# (counts[k] + 1 points each, only the start point when counts[k] is 0)
+def interpolate_points(starts, ends, counts):
+    starts = np.asarray(starts, dtype=np.float64).reshape(-1, 3)
+    ends = np.asarray(ends, dtype=np.float64).reshape(-1, 3)
+    counts = np.asarray(counts, dtype=np.int64).reshape(-1)
 
-    filled_points.extend(long_line_points_generated)
-    filled_points.extend(short_line_points_generated)
+    sizes = counts + 1
+    owner = np.repeat(np.arange(len(counts)), sizes)
+    first = np.cumsum(sizes) - sizes
+    i = np.arange(owner.size) - first[owner]
+    divisor = np.maximum(counts, 1)[owner]
+    return starts[owner] + i[:, None] * (ends - starts)[owner] / divisor[:, None]
 
-    plane_normal = calculate_plane_normal([left_point1, left_point2, right_point1, right_point2])
+def calculate_num_points(distances, step):
+    return np.ceil(np.asarray(distances) / step).astype(np.int64)
 
-    if height is not None and height > 0:
-        filled_points_with_height = []
-        for point in filled_points:
-            direction = np.sign(plane_normal[2])
-            normal_adjusted = direction * plane_normal
+# Function to fill the lane area, returning an (N, 4) float32 array of x, y, z, value
+def fill_lane_area(left_point1, left_point2, right_point1, right_point2, step, height=None, value=1.0):
+    chunks = list(iter_lane_area(left_point1, left_point2, right_point1, right_point2, step, height, value))
+    if not chunks:
+        return np.empty((0, 4), dtype=np.float32)
+    return np.concatenate(chunks)
+
+# Same points as fill_lane_area in the same order, in chunks of about max_points
+def iter_lane_area(left_point1, left_point2, right_point1, right_point2, step, height=None, value=1.0, max_points=None, fill="volume", jitter=False):
+    area = LaneArea(left_point1, left_point2, right_point1, right_point2, step, height, fill, jitter)
+    return area.iter_points(value, max_points)
+
+class FillArea(abc.ABC):
+    """
+    Plan for filling an area. The points are the rung points (groups delimited by rung_ends) and the
+    boundary line points, each extruded up to height. With fill="shell" the rung points are placed only
+    at the top and the line points from the bottom to one layer below the top (the side walls).
+    A range of rungs can be generated on its own.
+    """
+
+    # Choose the extrusion offsets; corners are the vertices used for the plane normal
+    def _plan_layers(self, corners, step, height, fill):
+        if step <= 0:
+            raise ValueError("Step must be a positive value.")
+        if fill not in FILL_MODES:
+            raise ValueError(f"Unknown fill mode: {fill}")
+
+        self.offsets = None
+        self.normal_adjusted = None
+        if height is not None and height > 0:
+            plane_normal = calculate_plane_normal(corners)
+            self.normal_adjusted = np.sign(plane_normal[2]) * plane_normal
             num_height_steps = int(np.ceil(height / step))
-            for j in range(num_height_steps + 1):
-                offset = j * step
-                new_point = np.array(point) + offset * normal_adjusted
-                if offset >= height:
-                    new_point = np.array(point) + height * normal_adjusted
-                filled_points_with_height.append(tuple(new_point) + (value,))
-        return filled_points_with_height
-
-    return [point + (value,) for point in filled_points]
+            # The top layer is at height even if height is not a multiple of step
+            self.offsets = np.minimum(np.arange(num_height_steps + 1) * step, height)
+
+        # Offsets for the rung points and the line points (None: not extruded)
+        if fill == "volume":
+            self.rung_offsets = self.line_offsets = self.offsets
+        elif self.offsets is None:
+            # Without height the shell is the bottom face only (the line points are the rung ends)
+            self.rung_offsets = None
+            self.line_offsets = np.empty(0)
+        else:
+            self.rung_offsets = self.offsets[-1:]
+            self.line_offsets = self.offsets[:-1]
+        self.rung_layers = _layers(self.rung_offsets)
+        self.line_layers = _layers(self.line_offsets)
+
+    @property
+    def num_rungs(self):
+        return len(self.rung_ends)
+
+    # Number of points generated from rungs first..last-1 (and the line points if lines)
+    def num_points(self, first=0, last=None, lines=True):
+        last = self.num_rungs if last is None else last
+        count = int(self._rung_offset(last) - self._rung_offset(first)) * self.rung_layers
+        if lines:
+            count += sum(len(points) for points in self.line_points) * self.line_layers
+        return count
+
+    def _rung_offset(self, i):
+        return self.rung_ends[i - 1] if i > 0 else 0
+
+    # Yield the points of rungs first..last-1 (and the line points if lines) as (N, 4) float32
+    # arrays of about max_points each
+    def iter_points(self, value, max_points=None, first=0, last=None, lines=True):
+        last = self.num_rungs if last is None else last
+        # Base points (before extrusion) handled at a time
+        base_limit = None if max_points is None else max(1, max_points // max(1, self.rung_layers))
+
+        # Rungs are processed together, about base_limit points at a time
+        while first < last and self.rung_layers:
+            if base_limit is None:
+                end = last
+            else:
+                limit = self._rung_offset(first) + base_limit
+                end = min(last, max(first + 1, int(np.searchsorted(self.rung_ends, limit, side="right"))))
+            yield from self._extrude(self._rung_points(first, end), value, base_limit, self.rung_offsets)
+            first = end
+
+        if lines and self.line_layers:
+            base_limit = None if max_points is None else max(1, max_points // self.line_layers)
+            for points in self.line_points:
+                yield from self._extrude(points, value, base_limit, self.line_offsets)
+
+    # Points on rungs first..last-1 before extrusion
+    @abc.abstractmethod
+    def _rung_points(self, first, last):
+        pass
+
+    def _extrude(self, base_points, value, base_limit, offsets):
+        size = base_limit or max(1, len(base_points))
+        for start in range(0, len(base_points), size):
+            base = base_points[start:start + size]
+            if offsets is not None:
+                base = (base[:, None, :] + offsets[:, None] * self.normal_adjusted).reshape(-1, 3)
+            result = np.empty((len(base), 4), dtype=np.float32)
+            result[:, :3] = base
+            result[:, 3] = value
+            yield result
+
+class LaneArea(FillArea):
+    """
+    Plan for filling the area between 4 points. The longer line is divided by step, the shorter one
+    into as many segments, and each pair of points is joined by a rung. Points are ordered rung points,
+    longer line, shorter line. With jitter the rung points move randomly within their grid cell
+    (never outside the area); the offsets depend only on the 4 points and the point number, so they do
+    not change with the rung ranges or the number of workers.
+    """
+
+    def __init__(self, left_point1, left_point2, right_point1, right_point2, step, height=None, fill="volume", jitter=False):
+        self._plan_layers([left_point1, left_point2, right_point1, right_point2], step, height, fill)
+
+        left = np.array([left_point1, left_point2], dtype=np.float64)
+        right = np.array([right_point1, right_point2], dtype=np.float64)
+        left_distance = np.linalg.norm(left[1] - left[0])
+        right_distance = np.linalg.norm(right[1] - right[0])
+
+        if left_distance >= right_distance:
+            long_line, short_line, long_distance = left, right, left_distance
+        else:
+            long_line, short_line, long_distance = right, left, right_distance
+
+        # Divide the longer line by step and the shorter one into the same number of segments
+        num_points_long = int(calculate_num_points(long_distance, step))
+        self.long_line_points = interpolate_points(long_line[0], long_line[1], [num_points_long])
+        self.short_line_points = interpolate_points(short_line[0], short_line[1], [num_points_long])
+        self.line_points = [self.long_line_points, self.short_line_points]
+
+        # Number of segments on each rung
+        self.rung_counts = calculate_num_points(
+            np.linalg.norm(self.short_line_points - self.long_line_points, axis=1), step
+        )
+        self.rung_ends = np.cumsum(self.rung_counts + 1)
+        self.seed = zlib.crc32(left.tobytes() + right.tobytes()) if jitter else None
+
+    def _rung_points(self, first, last):
+        counts = self.rung_counts[first:last]
+        if self.seed is None:
+            return interpolate_points(self.long_line_points[first:last], self.short_line_points[first:last], counts)
+
+        # Move each point by up to half a cell along the lines and along its rung
+        index = np.arange(self._rung_offset(first), self._rung_offset(last))
+        owner = np.repeat(np.arange(first, last), counts + 1)
+        divisor = np.maximum(self.rung_counts[owner], 1)
+        along = np.clip(owner + _uniform(self.seed, 2 * index), 0, self.num_rungs - 1)
+        t = index - (self.rung_ends[owner] - self.rung_counts[owner] - 1)
+        t = np.where(self.rung_counts[owner] > 0, np.clip((t + _uniform(self.seed, 2 * index + 1)) / divisor, 0, 1), 0)
+
+        along = (along / max(self.num_rungs - 1, 1))[:, None]
+        long_points = self.long_line_points[0] + along * (self.long_line_points[-1] - self.long_line_points[0])
+        short_points = self.short_line_points[0] + along * (self.short_line_points[-1] - self.short_line_points[0])
+        return long_points + t[:, None] * (short_points - long_points)
+
+# Polygon plant area; outer and inner are lists of rings of (x, y, z) vertices without the closing
+# vertex, and inner rings are holes
+class PlantPolygon:
+    def __init__(self, outer, inner=()):
+        self.outer = [np.asarray(ring, dtype=np.float64).reshape(-1, 3) for ring in outer]
+        self.inner = [np.asarray(ring, dtype=np.float64).reshape(-1, 3) for ring in inner]
+
+    @property
+    def rings(self):
+        return self.outer + self.inner
+
+    # Area in the XY plane
+    def area(self):
+        return sum(abs(_signed_area(ring)) for ring in self.outer) - sum(abs(_signed_area(ring)) for ring in self.inner)
+
+class PolygonArea(FillArea):
+    """
+    Plan for filling a PlantPolygon. The step grid points inside the polygon (even-odd rule, so inner
+    rings are holes) are found per scanline row, and each row is a rung. The ring edges divided by
+    step are the line points, and z comes from the plane fitted to the vertices. With jitter the
+    points move along their row within their grid cell, clipped to the span.
+    """
+
+    def __init__(self, polygon, step, height=None, fill="volume", jitter=False):
+        vertices = np.concatenate(polygon.rings)
+        self._plan_layers(vertices, step, height, fill)
+        self.step = step
+        self.plane = fit_plane(vertices)
+
+        # Edges
+        starts = np.concatenate(polygon.rings)
+        ends = np.concatenate([np.roll(ring, -1, axis=0) for ring in polygon.rings])
+
+        # Boundary points (the end of each edge is the start of the next one)
+        counts = calculate_num_points(np.linalg.norm(ends - starts, axis=1), step)
+        points = interpolate_points(starts, ends, counts)
+        self.line_points = [np.delete(points, np.cumsum(counts + 1) - 1, axis=0)]
+
+        # Inside spans per grid row (y = row * step) and the grid columns from first_cols in each span
+        first_row = int(np.ceil(starts[:, 1].min() / step))
+        rows = np.arange(first_row, max(first_row, int(np.floor(starts[:, 1].max() / step)) + 1))
+        self.span_rows, self.span_starts, self.span_ends = _scanline_spans(starts, ends, rows, rows * step)
+        self.first_cols = np.ceil(self.span_starts / step).astype(np.int64)
+        self.span_counts = np.maximum(np.floor(self.span_ends / step).astype(np.int64) - self.first_cols + 1, 0)
+        row_sizes = np.bincount(self.span_rows - first_row, weights=self.span_counts, minlength=len(rows))
+        self.rung_ends = np.cumsum(row_sizes).astype(np.int64)
+        # Spans of row i are row_spans[i]..row_spans[i+1]-1
+        self.row_spans = np.searchsorted(self.span_rows, np.arange(first_row, first_row + len(rows) + 1))
+        self.seed = zlib.crc32(starts.tobytes()) if jitter else None
+
+    def _rung_points(self, first, last):
+        span_first, span_last = self.row_spans[first], self.row_spans[last]
+        counts = self.span_counts[span_first:span_last]
+        owner = np.repeat(np.arange(span_first, span_last), counts)
+        i = np.arange(owner.size) - (np.cumsum(counts) - counts)[owner - span_first]
+        x = (self.first_cols[owner] + i) * self.step
+        y = self.span_rows[owner] * self.step
+        if self.seed is not None:
+            index = np.arange(self._rung_offset(first), self._rung_offset(last))
+            x = np.clip(x + _uniform(self.seed, index) * self.step, self.span_starts[owner], self.span_ends[owner])
+        a, b, c = self.plane
+        return np.column_stack([x, y, a * x + b * y + c])
+
+class Footprint:
+    """
+    XY extent of the plant areas including the extruded points, from (shape, height) pairs.
+    Merged inside spans are kept per row of width resolution. Generated points also lie on the
+    boundary, so the areas are padded by half a resolution in x and y.
+    """
+
+    def __init__(self, shapes, resolution):
+        self.resolution = resolution
+        pad = resolution / 2
+        rows, starts, ends = [np.empty(0, dtype=np.int64)], [np.empty(0)], [np.empty(0)]
+        for shape, height in shapes:
+            rings = shape.rings if isinstance(shape, PlantPolygon) else [np.asarray(shape, dtype=np.float64)[[0, 1, 3, 2]]]
+            edge_starts, edge_ends, groups = _extruded_edges(rings, height)
+            y_min, y_max = edge_starts[:, 1].min(), edge_starts[:, 1].max()
+            shape_rows = np.arange(int(np.floor((y_min - pad) / resolution)), int(np.floor((y_max + pad) / resolution)) + 1)
+            # Inside x over a padded row: the spans at its lower and upper y plus the edge pieces within it
+            spans = [
+                _scanline_spans(edge_starts, edge_ends, shape_rows, shape_rows * resolution - pad, groups=groups),
+                _scanline_spans(edge_starts, edge_ends, shape_rows, (shape_rows + 1) * resolution + pad, groups=groups),
+                _edge_spans(edge_starts, edge_ends, resolution, pad),
+            ]
+            for span_rows, span_starts, span_ends in spans:
+                rows.append(span_rows)
+                starts.append(span_starts - pad)
+                ends.append(span_ends + pad)
+        rows, starts, ends = np.concatenate(rows), np.concatenate(starts), np.concatenate(ends)
+
+        if len(rows) == 0:
+            self.bounds = None
+            return
+        self.bounds = (starts.min(), rows.min() * resolution, ends.max(), (rows.max() + 1) * resolution)
+        # Merge overlapping spans keyed by row * width + x - x0
+        self.x0 = starts.min()
+        self.width = ends.max() - self.x0 + 1.0
+        keys_start = rows * self.width + (starts - self.x0)
+        keys_end = rows * self.width + (ends - self.x0)
+        order = np.argsort(keys_start, kind="stable")
+        keys_start, keys_end = keys_start[order], keys_end[order]
+        reach = np.maximum.accumulate(keys_end)
+        new = np.ones(len(keys_start), dtype=bool)
+        new[1:] = keys_start[1:] > reach[:-1]
+        group = np.cumsum(new) - 1
+        self.keys_start = keys_start[new]
+        self.keys_end = np.full(len(self.keys_start), -np.inf)
+        np.maximum.at(self.keys_end, group, keys_end)
+
+    # Whether (x_min, y_min, x_max, y_max) may overlap the footprint
+    def intersects(self, bounds):
+        if self.bounds is None:
+            return False
+        return not (bounds[2] < self.bounds[0] or bounds[0] > self.bounds[2] or bounds[3] < self.bounds[1] or bounds[1] > self.bounds[3])
+
+    # Mask of the points (N, 2 or more) inside the footprint
+    def contains(self, xy):
+        xy = np.asarray(xy, dtype=np.float64)
+        if self.bounds is None or len(xy) == 0:
+            return np.zeros(len(xy), dtype=bool)
+        x, y = xy[:, 0], xy[:, 1]
+        keys = np.floor(y / self.resolution) * self.width + (x - self.x0)
+        i = np.searchsorted(self.keys_start, keys, side="right") - 1
+        inside = (i >= 0) & (x >= self.x0) & (x - self.x0 < self.width)
+        return inside & (keys <= self.keys_end[np.maximum(i, 0)])
+
+def _extruded_edges(rings, height):
+    """
+    Edges (starts, ends) and group numbers outlining the XY extent of the rings extruded to height
+    along the normal as in FillArea: the base rings, the shifted rings and one parallelogram per edge.
+    Each group is filled with the even-odd rule on its own.
+    """
+    starts = np.concatenate(rings)
+    ends = np.concatenate([np.roll(ring, -1, axis=0) for ring in rings])
+    groups = np.zeros(len(starts), dtype=np.int64)
+    if height is None or height <= 0:
+        return starts, ends, groups
+    normal = calculate_plane_normal(starts)
+    shift = height * np.sign(normal[2]) * normal
+    if np.hypot(shift[0], shift[1]) == 0:
+        return starts, ends, groups
+    # Sides of the parallelograms (a, b, b + shift, a + shift)
+    sides = [(starts, ends), (ends, ends + shift), (ends + shift, starts + shift), (starts + shift, starts)]
+    edge_starts = [starts, starts + shift] + [side_start for side_start, _ in sides]
+    edge_ends = [ends, ends + shift] + [side_end for _, side_end in sides]
+    parallelograms = np.tile(np.arange(2, len(starts) + 2), 4)
+    return np.concatenate(edge_starts), np.concatenate(edge_ends), np.concatenate([groups, groups + 1, parallelograms])
+
+# (row, x min, x max) of each edge piece within row r padded by pad (y in r * resolution - pad .. (r + 1) * resolution + pad)
+def _edge_spans(starts, ends, resolution, pad):
+    y_low, y_high = np.minimum(starts[:, 1], ends[:, 1]), np.maximum(starts[:, 1], ends[:, 1])
+    first = np.ceil((y_low - pad) / resolution - 1).astype(np.int64)
+    last = np.floor((y_high + pad) / resolution).astype(np.int64)
+    counts = np.maximum(last - first + 1, 0)
+    owner = np.repeat(np.arange(len(starts)), counts)
+    rows = first[owner] + np.arange(owner.size) - (np.cumsum(counts) - counts)[owner]
+    low = np.maximum(y_low[owner], rows * resolution - pad)
+    high = np.minimum(y_high[owner], (rows + 1) * resolution + pad)
+    x0, y0 = starts[owner, 0], starts[owner, 1]
+    dx, dy = ends[owner, 0] - x0, ends[owner, 1] - y0
+    # A horizontal edge covers its whole x range
+    slope = np.divide(dx, dy, out=np.zeros_like(dx), where=dy != 0)
+    x_low = np.where(dy != 0, x0 + (low - y0) * slope, x0)
+    x_high = np.where(dy != 0, x0 + (high - y0) * slope, x0 + dx)
+    return rows, np.minimum(x_low, x_high), np.maximum(x_low, x_high)
+
+def _signed_area(ring):
+    x, y = ring[:, 0], ring[:, 1]
+    return (np.dot(x, np.roll(y, -1)) - np.dot(y, np.roll(x, -1))) / 2
+
+def _scanline_spans(starts, ends, rows, ys, max_cells=1 << 22, groups=None):
+    """
+    Inside spans (even-odd rule) of the edges starts[k]..ends[k] on each row rows[j] at y = ys[j], as
+    arrays (row, span start x, span end x) ordered by row and x. With groups (a number per edge) each
+    group is a separate region. Row/edge pairs are intersected about max_cells at a time.
+    """
+    x0, y0, x1, y1 = starts[:, 0], starts[:, 1], ends[:, 0], ends[:, 1]
+    span_rows, span_starts, span_ends = [np.empty(0, dtype=np.int64)], [np.empty(0)], [np.empty(0)]
+    chunk = max(1, max_cells // max(1, len(starts)))
+    for start in range(0, len(rows), chunk):
+        chunk_rows = rows[start:start + chunk]
+        y = ys[start:start + chunk, None]
+        # Edges with exactly one end at or below y cross the row (vertices count once, horizontal edges never)
+        j, k = np.nonzero((y0 <= y) != (y1 <= y))
+        x = x0[k] + (y[j, 0] - y0[k]) * (x1[k] - x0[k]) / (y1[k] - y0[k])
+        order = np.lexsort((x, j)) if groups is None else np.lexsort((x, groups[k], j))
+        j, x = j[order], x[order]
+        # Closed rings cross each row an even number of times; consecutive pairs are inside
+        span_rows.append(chunk_rows[j[0::2]])
+        span_starts.append(x[0::2])
+        span_ends.append(x[1::2])
+    return np.concatenate(span_rows), np.concatenate(span_starts), np.concatenate(span_ends)
+
+def _layers(offsets):
+    return 1 if offsets is None else len(offsets)
+
+# Uniform value in [-0.5, 0.5) from seed and index (splitmix64)
+def _uniform(seed, index):
+    x = np.asarray(index, dtype=np.uint64) * np.uint64(0x9E3779B97F4A7C15) + np.uint64(seed)
+    x = (x ^ (x >> np.uint64(30))) * np.uint64(0xBF58476D1CE4E5B9)
+    x = (x ^ (x >> np.uint64(27))) * np.uint64(0x94D049BB133111EB)
+    x ^= x >> np.uint64(31)
+    return (x >> np.uint64(11)).astype(np.float64) / float(1 << 53) - 0.5
 
 # Generate points along line
 def generate_line_points(point1, point2, step):
-    distance = np.linalg.norm(np.array(point2) - np.array(point1))
-    num_points = int(np.ceil(distance / step))
-    return [tuple(np.array(point1) + i * (np.array(point2) - np.array(point1)) / num_points) for i in range(num_points + 1)]
+    distance = np.linalg.norm(np.asarray(point2, dtype=np.float64) - np.asarray(point1, dtype=np.float64))
+    return interpolate_points(point1, point2, [calculate_num_points(distance, step)])
 
 # Parse XML file
-def process_xml(xml_file, step, value):
-    tree = ET.parse(xml_file)
-    root = tree.getroot()
-
-    all_filled_points = []
+def process_xml(xml_file, step, value, writer, max_points=None, jobs=1, fill="volume", jitter=False, density=None, point_budget=None):
+    index = load_plant_index(xml_file)
+    return fill_plants(index, step, value, writer, max_points, jobs, fill, jitter, density, point_budget)
+
+def load_plant_index(xml_file):
+    with get_profiler().phase("build_index") as phase:
+        index = MapIndex.from_file(xml_file)
+        phase.count(ways=len(index.ways), relations=len(index.relations))
+    return index
+
+# Fill the plant areas and write the points to writer, about max_points at a time (in worker
+# processes if jobs > 1, same order either way); returns the point count and the exclusion messages
+def fill_plants(index, step, value, writer, max_points=None, jobs=1, fill="volume", jitter=False, density=None, point_budget=None, warnings=None):
+    profiler = get_profiler()
     excluded_relations = []
-
-    for relation in root.findall("relation"):
-        subtype = relation.find("tag[@k='subtype']")
-        height_tag = relation.find("tag[@k='height']")
-
-        if subtype is None or height_tag is None:
-            continue
-
-        if subtype.attrib["v"] == "plant" and height_tag.attrib["v"].isdigit():
-            height = float(height_tag.attrib["v"])
-
-            left_way_ref = relation.find("member[@role='left']").attrib["ref"]
-            right_way_ref = relation.find("member[@role='right']").attrib["ref"]
-
-            left_way = get_way_by_ref(root, left_way_ref)
-            right_way = get_way_by_ref(root, right_way_ref)
-
-            if left_way is None or right_way is None:
-                excluded_relations.append(f"Relation {relation.attrib['id']} excluded: Invalid way references.")
+    num_points = 0
+
+    steps = None
+    if density is not None or point_budget is not None:
+        with profiler.phase("plan_steps") as phase:
+            steps = plan_steps(iter_plant_elements(index, []), step, fill, density, point_budget, warnings)
+            phase.count(elements=len(steps), coarsened=sum(1 for s in steps.values() if s > step))
+
+    with profiler.phase("fill_lane_area") as phase:
+        shapes = iter_plant_shapes(index, excluded_relations, step, steps)
+        if jobs > 1:
+            num_points = write_parallel(shapes, value, writer, max_points, jobs, fill, jitter)
+        else:
+            for shape, height, shape_step in shapes:
+                area = make_area(shape, shape_step, height, fill, jitter)
+                for filled_points in area.iter_points(value, max_points):
+                    writer.write(filled_points)
+                    num_points += len(filled_points)
+        phase.count(lanes=len(index.relations_by_subtype["plant"]), points=num_points)
+
+    if point_budget is not None and num_points > point_budget and warnings is not None:
+        warnings.append(f"{num_points} points exceed --max-points {point_budget}: the plant areas cannot fit even at their coarsest step.")
+    return num_points, excluded_relations
+
+# Yield (shape, height, step) for each area to fill; a shape is 4 points (left1, left2, right1, right2)
+# or a PlantPolygon, and elements in steps use their own step
+def iter_plant_shapes(index, excluded_relations, step, steps=None):
+    for key, shapes, height in iter_plant_elements(index, excluded_relations):
+        shape_step = steps.get(key, step) if steps else step
+        for shape in shapes:
+            yield shape, height, shape_step
+
+def iter_plant_elements(index, excluded_relations):
+    """
+    Yield (key, shapes, height) per plant element, key being ("relation", id) or ("way", id):
+    - subtype=plant lanelet: a 4-point shape per pair of nodes, or the polygon of the left way and
+      the reversed right way if their node counts differ
+    - subtype=plant multipolygon: the outer and inner ways joined into rings (inner rings are holes)
+    - subtype=plant way with area=yes: the way as a ring
+    Elements without a numeric height tag are skipped.
+    """
+    multipolygon_ways = set()
+    for relation in index.relations_by_subtype["plant"]:
+        if relation.tags.get("type") == "multipolygon":
+            multipolygon_ways.update(m.ref for m in relation.members if m.type == "way")
+            height = _plant_height(relation.tags)
+            if height is None:
                 continue
-
-            left_nodes = get_nodes_for_way(root, left_way)
-            right_nodes = get_nodes_for_way(root, right_way)
-
-            if len(left_nodes) != len(right_nodes):
-                excluded_relations.append(f"Relation {relation.attrib['id']} excluded: Left and right have different number of nodes.")
+            outer = _assemble_rings(index, [m.ref for m in relation.members if m.type == "way" and m.role == "outer"])
+            inner = _assemble_rings(index, [m.ref for m in relation.members if m.type == "way" and m.role == "inner"])
+            if outer is None or inner is None or not outer:
+                excluded_relations.append(f"Relation {relation.id} excluded: Rings are not closed.")
                 continue
+            polygon = _plant_polygon(outer, inner, f"Relation {relation.id}", excluded_relations)
+            if polygon is not None:
+                yield ("relation", relation.id), [polygon], height
+            continue
 
-            if len(left_nodes) < 2 or len(right_nodes) < 2:
-                excluded_relations.append(f"Relation {relation.attrib['id']} excluded: Insufficient nodes.")
-                continue
+        height = _plant_height(relation.tags)
+        if height is None:
+            continue
 
-            for i in range(len(left_nodes) - 1):
-                left_point1 = left_nodes[i]
-                left_point2 = left_nodes[i + 1]
-                right_point1 = right_nodes[i]
-                right_point2 = right_nodes[i + 1]
+        left_way_ref = index.member_ref(relation, "left")
+        right_way_ref = index.member_ref(relation, "right")
 
-                filled_points = fill_lane_area(left_point1, left_point2, right_point1, right_point2, step, height, value)
-                all_filled_points.extend(filled_points)
+        left_way = get_way_by_ref(index, left_way_ref)
+        right_way = get_way_by_ref(index, right_way_ref)
 
-    return all_filled_points, excluded_relations
+        if left_way is None or right_way is None:
+            excluded_relations.append(f"Relation {relation.id} excluded: Invalid way references.")
+            continue
 
-def get_way_by_ref(root, ref):
-    return next((way for way in root.findall("way") if way.attrib["id"] == ref), None)
+        left_nodes = get_nodes_for_way(index, left_way)
+        right_nodes = get_nodes_for_way(index, right_way)
 
-def get_nodes_for_way(root, way):
-    nodes = []
-    for nd in way.findall("nd"):
-        node_ref = nd.attrib["ref"]
-        node = get_node_by_ref(root, node_ref)
-        if node is not None:
-            x = float(node.find('tag[@k="local_x"]').attrib["v"])
-            y = float(node.find('tag[@k="local_y"]').attrib["v"])
-            z = float(node.find('tag[@k="ele"]').attrib["v"])
-            nodes.append((x, y, z))
-    return nodes
+        if len(left_nodes) < 2 or len(right_nodes) < 2:
+            excluded_relations.append(f"Relation {relation.id} excluded: Insufficient nodes.")
+            continue
 
-def get_node_by_ref(root, ref):
-    return next((node for node in root.findall("node") if node.attrib["id"] == ref), None)
+        if len(left_nodes) != len(right_nodes):
+            # Cannot be split into 4-point shapes, so fill the polygon enclosed by the two ways
+            polygon = _plant_polygon([left_nodes + right_nodes[::-1]], [], f"Relation {relation.id}", excluded_relations)
+            if polygon is not None:
+                yield ("relation", relation.id), [polygon], height
+            continue
 
-def write_pcd_file(points, output_file, use_rgb):
-    if use_rgb:
-        header = f"""# .PCD v0.7 - Point Cloud Data file format
-VERSION 0.7
-FIELDS x y z rgb
-SIZE 4 4 4 4
-TYPE F F F F
-COUNT 1 1 1 1
-WIDTH {len(points)}
-HEIGHT 1
-VIEWPOINT 0 0 0 1 0 0 0
-POINTS {len(points)}
-DATA ascii
-"""
-    else:
-        header = f"""# .PCD v0.7 - Point Cloud Data file format
-VERSION 0.7
-FIELDS x y z intensity
-SIZE 4 4 4 4
-TYPE F F F F
-COUNT 1 1 1 1
-WIDTH {len(points)}
-HEIGHT 1
-VIEWPOINT 0 0 0 1 0 0 0
-POINTS {len(points)}
-DATA ascii
-"""
-
-    with open(output_file, "w") as f:
-        f.write(header)
-        for point in points:
-            f.write(f"{point[0]} {point[1]} {point[2]} {point[3]}\n")
+        quads = [
+            (left_nodes[i], left_nodes[i + 1], right_nodes[i], right_nodes[i + 1])
+            for i in range(len(left_nodes) - 1)
+        ]
+        yield ("relation", relation.id), quads, height
+
+    for way in index.ways.values():
+        if way.tags.get("subtype") != "plant" or way.tags.get("area") != "yes" or way.id in multipolygon_ways:
+            continue
+        height = _plant_height(way.tags)
+        if height is None:
+            continue
+        polygon = _plant_polygon([get_nodes_for_way(index, way)], [], f"Way {way.id}", excluded_relations)
+        if polygon is not None:
+            yield ("way", way.id), [polygon], height
+
+def _plant_height(tags):
+    height_value = tags.get("height")
+    if height_value is None or not height_value.isdigit():
+        return None
+    return float(height_value)
+
+# Join ways into closed rings of coordinates, or None if they do not close
+def _assemble_rings(index, way_refs):
+    lines = []
+    for ref in way_refs:
+        way = get_way_by_ref(index, ref)
+        if way is None:
+            return None
+        lines.append(get_nodes_for_way(index, way))
+
+    rings = []
+    while lines:
+        ring = list(lines.pop(0))
+        # Append ways sharing the end point (reversed if needed) until the ring closes
+        while len(ring) < 2 or ring[0] != ring[-1]:
+            for i, line in enumerate(lines):
+                if line and line[0] == ring[-1]:
+                    ring.extend(line[1:])
+                elif line and line[-1] == ring[-1]:
+                    ring.extend(line[-2::-1])
+                else:
+                    continue
+                del lines[i]
+                break
+            else:
+                return None
+        rings.append(ring)
+    return rings
+
+# Build a PlantPolygon from rings, or add a message and return None if it is not a valid polygon
+def _plant_polygon(outer, inner, name, excluded_relations):
+    rings = []
+    for ring in outer + inner:
+        # Drop the closing vertex of a closed way
+        if len(ring) > 1 and ring[0] == ring[-1]:
+            ring = ring[:-1]
+        if len(set(ring)) < 3:
+            excluded_relations.append(f"{name} excluded: Insufficient nodes.")
+            return None
+        rings.append(ring)
+    try:
+        fit_plane([point for ring in rings for point in ring])
+    except ValueError:
+        excluded_relations.append(f"{name} excluded: Cannot compute the plane.")
+        return None
+    return PlantPolygon(rings[:len(outer)], rings[len(outer):])
+
+# Fill plan for a shape (4 points or a PlantPolygon)
+def make_area(shape, step, height=None, fill="volume", jitter=False):
+    if isinstance(shape, PlantPolygon):
+        return PolygonArea(shape, step, height, fill, jitter)
+    return LaneArea(*shape, step, height, fill, jitter)
+
+# Area of a shape in the XY plane
+def shape_area(shape):
+    if isinstance(shape, PlantPolygon):
+        return shape.area()
+    x, y = np.asarray(shape, dtype=np.float64)[[0, 1, 3, 2], :2].T
+    return abs(np.dot(x, np.roll(y, -1)) - np.dot(y, np.roll(x, -1))) / 2
+
+# Largest coordinate range of the shape vertices
+def shape_extent(shape):
+    points = np.concatenate(shape.rings) if isinstance(shape, PlantPolygon) else np.asarray(shape, dtype=np.float64)
+    return np.ptp(points, axis=0).max()
+
+def count_points(shapes, step, height, fill="volume"):
+    return sum(make_area(shape, step, height, fill).num_points() for shape in shapes)
+
+def plan_steps(elements, step, fill="volume", density=None, point_budget=None, warnings=None):
+    """
+    Choose a step (>= step) per element so that it has at most area * density points, and return
+    {key: step}. With point_budget the budget is shared in proportion to area; elements that exceed
+    their share even at their coarsest step keep that step and the overflow is taken from the share
+    of the others. Elements that still cannot fit are reported in warnings.
+    """
+    elements = [(key, shapes, height, sum(shape_area(s) for s in shapes)) for key, shapes, height in elements]
+    if density is None and point_budget is None:
+        return {key: step for key, *_ in elements}
+
+    # Coarsest step: each shape and the height in a single interval
+    coarsest = {key: max(step, max(shape_extent(s) for s in shapes), height or 0) for key, shapes, height, _ in elements}
+    floors = {key: count_points(shapes, coarsest[key], height, fill) for key, shapes, height, _ in elements}
+
+    budgets = {}
+    remaining = elements
+    budget_left = point_budget
+    while True:
+        element_density = density
+        if point_budget is not None:
+            area_left = sum(area for *_, area in remaining)
+            share = budget_left / area_left if area_left > 0 else 0.0
+            element_density = share if density is None else min(density, share)
+        over = [e for e in remaining if floors[e[0]] > e[3] * element_density]
+        if point_budget is None or not over:
+            break
+        for key, *_ in over:
+            budgets[key] = None
+            budget_left -= floors[key]
+        remaining = [e for e in remaining if e[0] not in budgets]
+    for key, _, _, area in remaining:
+        budgets[key] = area * element_density
+
+    steps = {}
+    for key, shapes, height, area in elements:
+        budget = budgets[key]
+        if budget is None or floors[key] > budget:
+            steps[key] = float(coarsest[key])
+            if density is not None and floors[key] > area * density and warnings is not None:
+                warnings.append(f"{key[0].capitalize()} {key[1]}: {floors[key]} points at the coarsest step exceed --max-density.")
+            continue
+        low, high = step, coarsest[key]
+        if count_points(shapes, low, height, fill) <= budget:
+            steps[key] = low
+            continue
+        # The point count is not always monotonic in the step, so bisect for a step within budget
+        for _ in range(PLAN_STEP_ITERATIONS):
+            middle = np.sqrt(low * high)
+            if count_points(shapes, middle, height, fill) <= budget:
+                high = middle
+            else:
+                low = middle
+        steps[key] = float(high)
+    return steps
+
+# Split the fills into tasks of about task_points points by rung ranges; a task is a list of
+# (shape, height, step, first rung, last rung + 1, whether the line points are included)
+def split_tasks(shapes, task_points, fill="volume"):
+    task = []
+    task_size = 0
+    for shape, height, step in shapes:
+        area = make_area(shape, step, height, fill)
+        first = 0
+        while True:
+            # Rungs that fit in the task (at least one)
+            budget = max(1, (task_points - task_size) // max(1, area.rung_layers))
+            limit = area._rung_offset(first) + budget
+            last = min(area.num_rungs, max(first + 1, int(np.searchsorted(area.rung_ends, limit, side="right"))))
+            lines = last >= area.num_rungs
+            task.append((shape, height, step, first, last, lines))
+            task_size += area.num_points(first, last, lines)
+            if task_size >= task_points:
+                yield task
+                task = []
+                task_size = 0
+            if lines:
+                break
+            first = last
+    if task:
+        yield task
+
+# Write the points of a task to output in encoding (ascii or binary) and return the count (run in a worker)
+def fill_task(task, value, max_points, output, encoding, fill="volume", jitter=False):
+    count = 0
+    with open(output, "wb") as f:
+        for shape, height, step, first, last, lines in task:
+            area = make_area(shape, step, height, fill, jitter)
+            for points in area.iter_points(value, max_points, first, last, lines):
+                encode_points(f, points, encoding)
+                count += len(points)
+    return count
+
+# Run the tasks in worker processes and write their points to writer in task order; workers write
+# to temporary files and at most 2 * jobs tasks are in flight
+def write_parallel(shapes, value, writer, max_points, jobs, fill="volume", jitter=False):
+    # Keep the points waiting to be written plus those held by the workers within the limit
+    worker_points = max(1, (max_points or DEFAULT_TASK_POINTS) // (jobs + 1))
+    tmp_dir = tempfile.mkdtemp(prefix=".plant_", dir=os.path.dirname(os.path.abspath(writer.path)))
+    # ascii and binary data formatted by the workers is copied as is; otherwise (binary_compressed,
+    # voxel filter) it is read back into arrays and passed to writer
+    encoded = hasattr(writer, "write_encoded") and writer.data_format != "binary_compressed"
+    encoding = writer.data_format if encoded else "binary"
+    num_points = 0
+    pending = deque()
+    try:
+        with ProcessPoolExecutor(max_workers=jobs) as pool:
+            def drain(limit):
+                nonlocal num_points
+                while len(pending) > limit:
+                    future, path = pending.popleft()
+                    count = future.result()
+                    if not encoded:
+                        for start in range(0, count, worker_points):
+                            size = min(worker_points, count - start)
+                            points = np.fromfile(path, dtype="<f4", count=size * 4, offset=start * 16)
+                            writer.write(points.reshape(-1, 4))
+                    else:
+                        with open(path, "rb") as src:
+                            writer.write_encoded(src, count)
+                    os.remove(path)
+                    num_points += count
+
+            for i, task in enumerate(split_tasks(shapes, worker_points, fill)):
+                path = os.path.join(tmp_dir, f"{i}.bin")
+                future = pool.submit(fill_task, task, value, worker_points, path, encoding, fill, jitter)
+                pending.append((future, path))
+                drain(jobs * 2)
+            drain(0)
+    finally:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+    return num_points
+
+# Yield (path, tile bounds (x_min, y_min, x_max, y_max)) for the base map, a binary PCD file
+# (bounds None) or a directory of tiles with metadata
+def iter_base_files(base):
+    if not os.path.isdir(base):
+        yield base, None
+        return
+    x_resolution, y_resolution, tiles = read_tile_metadata(os.path.join(base, METADATA_FILENAME))
+    for name, (x_min, y_min) in tiles.items():
+        yield os.path.join(base, name), (x_min, y_min, x_min + x_resolution, y_min + y_resolution)
+
+# Copy the base map points to writer chunk_points at a time through a memory map, dropping those
+# inside footprint (tiles that do not overlap it are not checked); returns (kept, removed)
+def merge_base(base_files, writer, footprint=None, chunk_points=DEFAULT_TASK_POINTS):
+    kept = removed = 0
+    for path, bounds in base_files:
+        header, data = map_pcd(path)
+        if header.fields != writer.fields or not header.is_float32():
+            raise ValueError(f"{path}: fields must be float32 {' '.join(writer.fields)}")
+        check = footprint is not None and (bounds is None or footprint.intersects(bounds))
+        for start in range(0, len(data), chunk_points):
+            points = np.array(data[start:start + chunk_points]).view("<f4").reshape(-1, len(writer.fields))
+            if check:
+                inside = footprint.contains(points)
+                removed += int(inside.sum())
+                points = points[~inside]
+            writer.write(points)
+            kept += len(points)
+        del data
+    return kept, removed
+
+# Map generated (x, y, z, value) points to the writer's fields; value is dropped if writer has no
+# value_field and other missing fields are 0
+class FieldMapper:
+    def __init__(self, writer, value_field):
+        missing = [name for name in ("x", "y", "z") if name not in writer.fields]
+        if missing:
+            raise ValueError(f"Output fields have no {', '.join(missing)}")
+        self.writer = writer
+        self.columns = [
+            (writer.fields.index(name), k) for k, name in enumerate(("x", "y", "z", value_field)) if name in writer.fields
+        ]
+
+    @property
+    def path(self):
+        return self.writer.path
+
+    def write(self, points):
+        mapped = np.zeros((len(points), len(self.writer.fields)), dtype=np.float32)
+        for dst, src in self.columns:
+            mapped[:, dst] = points[:, src]
+        self.writer.write(mapped)
+
+    def close(self):
+        self.writer.close()
+
+def remove_output(path):
+    # Drop a partly written output file or tile directory
+    if os.path.isdir(path):
+        shutil.rmtree(path)
+    elif os.path.exists(path):
+        os.remove(path)
+
+def get_way_by_ref(index, ref):
+    if ref is None:
+        return None
+    return index.ways.get(ref)
+
+def get_nodes_for_way(index, way):
+    return index.way_coords(way.id)
+
+def pcd_fields(use_rgb):
+    return ["x", "y", "z", "rgb" if use_rgb else "intensity"]
 
 def main():
+    profiler = init_profiler("plant_area_maker")
     parser = argparse.ArgumentParser(description="Process OSM XML and generate PCD point cloud.")
     parser.add_argument("input_file", help="Input OSM XML file")
     parser.add_argument("--step", type=float, default=0.1, help="Step size for filling points")
     parser.add_argument("--intensity", type=float, help="Intensity value for points")
     parser.add_argument("--rgb", type=int, nargs=3, metavar=('R', 'G', 'B'), help="RGB values (0-255) to encode into the point cloud")
+    parser.add_argument("--format", choices=DATA_FORMATS, help="PCD data format (default: ascii, binary with --tile-size or --merge)")
+    parser.add_argument("--max-memory", type=float, default=256, help="Approximate memory ceiling in MB for points held while generating")
+    parser.add_argument("--jobs", "-j", type=int, default=1, help="Number of worker processes for generating points")
+    parser.add_argument("--fill", choices=FILL_MODES, default="volume", help="Fill the whole volume or only the top face and the side walls")
+    parser.add_argument("--sampling", choices=SAMPLING_MODES, default="uniform", help="Place points on the step grid or jitter them within their grid cells")
+    parser.add_argument("--max-density", type=float, help="Maximum points per square metre of plant area; coarsens the step per relation (soft cap: an element that exceeds it even at its coarsest step is kept and reported)")
+    parser.add_argument("--max-points", type=int, help="Maximum total number of points; coarsens the step per relation in proportion to its area (soft cap: elements that exceed their share at the coarsest step take it from the others, and a warning is printed if the total still exceeds it)")
+    parser.add_argument("--voxel", type=float, help="Keep only the first point in each voxel of this size (meters)")
+    parser.add_argument("--tile-size", type=float, help="Split the output into square XY tiles of this size (meters) with Autoware pointcloud map metadata")
+    parser.add_argument("--merge", metavar="BASE", help="Merge the plant points into this binary PCD map (a file, or a directory of tiles with pointcloud_map_metadata.yaml)")
+    parser.add_argument("--merge-mode", choices=MERGE_MODES, default="append", help="Keep all base points, or drop the base points inside the plant areas")
 
     args = parser.parse_args()
-
-    output_file = generate_output_filename(args.input_file)
+    if args.tile_size is not None and args.tile_size <= 0:
+        parser.error("--tile-size must be a positive value")
+    if args.merge and not os.path.exists(args.merge):
+        parser.error(f"--merge: {args.merge} not found")
+    # A tiled base map is merged into tiles on the same grid
+    tile_size = args.tile_size
+    if tile_size is None and args.merge and os.path.isdir(args.merge):
+        try:
+            x_resolution, y_resolution, _ = read_tile_metadata(os.path.join(args.merge, METADATA_FILENAME))
+        except (OSError, ValueError) as e:
+            parser.error(f"--merge: {e}")
+        tile_size = (x_resolution, y_resolution)
+    if tile_size and args.format == "binary_compressed":
+        parser.error("--tile-size supports only ascii and binary")
+    data_format = args.format or ("binary" if tile_size or args.merge else "ascii")
+    if args.max_density is not None and args.max_density <= 0:
+        parser.error("--max-density must be a positive value")
+    if args.max_points is not None and args.max_points <= 0:
+        parser.error("--max-points must be a positive value")
+
+    # With tiles the output is a directory of tile files and metadata
+    suffix = "plant_merged" if args.merge else "plant"
+    output_file = generate_output_filename(args.input_file, suffix, extension="" if tile_size else ".pcd")
 
     use_rgb = args.rgb is not None
     if use_rgb:
@@ -226,10 +905,61 @@ def main():
     else:
         value = args.intensity if args.intensity is not None else 1.0
 
-    filled_points, excluded_relations = process_xml(args.input_file, args.step, value)
-    write_pcd_file(filled_points, output_file, use_rgb)
-
-    print(f"PCD file '{output_file}' generated successfully with {len(filled_points)} points.")
+    # Points handled at a time so that generated and buffered points stay within --max-memory
+    max_points = max(1, int(args.max_memory * 1024 * 1024 / BYTES_PER_POINT))
+    fields = pcd_fields(use_rgb)
+    if args.merge:
+        # The output keeps the fields of the base map
+        try:
+            base_files = list(iter_base_files(args.merge))
+            fields = read_pcd_header(base_files[0][0]).fields if base_files else fields
+        except (OSError, ValueError) as e:
+            parser.error(f"--merge: {e}")
+    if tile_size:
+        writer = TileWriter(output_file, fields, tile_size, data_format, buffer_points=max_points)
+    else:
+        writer = PCDWriter(output_file, fields, data_format, buffer_points=max_points)
+    index = load_plant_index(args.input_file)
+    try:
+        with writer:
+            plant_writer = writer
+            if args.merge:
+                footprint = None
+                if args.merge_mode == "replace":
+                    with profiler.phase("build_footprint"):
+                        footprint = Footprint(((shape, height) for shape, height, _ in iter_plant_shapes(index, [], args.step)), args.step)
+                with profiler.phase("merge_base") as phase:
+                    base_points, removed_points = merge_base(base_files, writer, footprint, max_points)
+                    phase.count(files=len(base_files), points=base_points, removed=removed_points)
+                plant_writer = FieldMapper(writer, pcd_fields(use_rgb)[3])
+            # The voxel table gets the same memory ceiling as the generated points
+            sink = VoxelFilter(plant_writer, args.voxel, args.max_memory * 1024 * 1024) if args.voxel else plant_writer
+            warnings = []
+            num_points, excluded_relations = fill_plants(
+                index, args.step, value, sink, max_points, args.jobs, args.fill,
+                args.sampling == "jitter", args.max_density, args.max_points, warnings,
+            )
+            # close rewrites the point count in the header (and compresses binary_compressed)
+            with profiler.phase("write_pcd_file") as phase:
+                writer.close()
+                phase.count(points=writer.count)
+    except VoxelMemoryError as e:
+        remove_output(output_file)
+        parser.error(f"--voxel: {e} Use a larger --voxel or --max-memory.")
+
+    if tile_size:
+        print(f"PCD tiles generated successfully in '{output_file}' with {writer.count} points in {len(writer.tiles)} tiles.")
+        print(f"Metadata file: {writer.metadata_path}")
+    else:
+        print(f"PCD file '{output_file}' generated successfully with {writer.count} points.")
+    if args.merge:
+        print(f"Merged {base_points} points of '{args.merge}' ({removed_points} points inside the plant areas removed).")
+    if args.voxel:
+        print(f"Voxel filter ({args.voxel} m): {num_points - sink.kept} of {num_points} plant points removed.")
+    if warnings:
+        print("Warnings:")
+        for msg in warnings:
+            print(f"  - {msg}")
     if excluded_relations:
         print("Excluded relations:")
         for msg in excluded_relations:
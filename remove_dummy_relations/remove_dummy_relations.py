@@ -1,14 +1,23 @@
 import sys
 import os
-import xml.etree.ElementTree as ET
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from osm_common.map_edit import MapEditor
+from osm_common.osm_loader import load_osm
+from osm_common.profiler import init_profiler
 
 def should_delete_relation(relation):
-    for tag in relation.findall('tag'):
-        k = tag.attrib.get('k')
-        v = tag.attrib.get('v')
-        if (k == 'subtype' and v == 'dummy') or (k == 'dummy'):
-            return True
-    return False
+    tags = relation.tags
+    return tags.get('subtype') == 'dummy' or 'dummy' in tags
+
+def remove_dummy_relations(editor):
+    """ダミーの relation を削除し、削除した relation の ID のリストを返す"""
+    removed = []
+    for relation in editor.iter_relations():
+        if should_delete_relation(relation):
+            editor.remove("relation", relation.id)
+            removed.append(relation.id)
+    return removed
 
 def generate_output_filename(input_file):
     base, ext = os.path.splitext(input_file)
@@ -20,6 +29,7 @@ def generate_output_filename(input_file):
     return output_file
 
 def main():
+    profiler = init_profiler("remove_dummy_relations")
     if len(sys.argv) != 2:
         print("Usage: python remove_dummy_relations.py <input_file.osm>")
         sys.exit(1)
@@ -30,26 +40,22 @@ def main():
         print(f"File not found: {input_file}")
         sys.exit(1)
 
-    tree = ET.parse(input_file)
-    root = tree.getroot()
+    editor = MapEditor(load_osm(input_file))
 
-    relations = root.findall('relation')
-    to_delete = []
-
-    for relation in relations:
-        if should_delete_relation(relation):
-            to_delete.append(relation)
+    with profiler.phase("remove_dummy_relations") as phase:
+        removed = remove_dummy_relations(editor)
+        phase.count(relations=len(editor.osm.relations), dummy=len(removed))
 
-    if not to_delete:
+    if not removed:
         print("削除対象の relation は存在しません。")
         return
 
-    for rel in to_delete:
-        print(f"削除: relation id={rel.attrib.get('id')}")
-        root.remove(rel)
+    for rel_id in removed:
+        print(f"削除: relation id={rel_id}")
 
+    # 削除する relation 以外は元のファイルの内容をそのまま書き出す
     output_file = generate_output_filename(input_file)
-    tree.write(output_file, encoding="utf-8", xml_declaration=True)
+    editor.write(output_file)
     print(f"出力ファイル: {output_file}")
 
 if __name__ == "__main__":
@@ -0,0 +1,55 @@
+import sys
+import os
+import argparse
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from osm_common.map_edit import MapEditor
+from osm_common.orphan import format_size_report, remove_orphan_nodes
+from osm_common.osm_loader import load_osm
+from osm_common.profiler import init_profiler
+
+def generate_output_filename(input_file):
+    base, ext = os.path.splitext(input_file)
+    output_file = base + "_GC" + ext
+    counter = 1
+    while os.path.exists(output_file):
+        output_file = f"{base}_GC_{counter}{ext}"
+        counter += 1
+    return output_file
+
+def main():
+    profiler = init_profiler("remove_orphan_nodes")
+    parser = argparse.ArgumentParser(description="Remove nodes that are not referenced by any way or relation.")
+    parser.add_argument("input_file", help="Path to the OSM file")
+    parser.add_argument("-o", "--output", help="Output OSM file (default: <input>_GC.osm)")
+    parser.add_argument("--verbose", action="store_true", help="Print the ID of each removed node")
+    args = parser.parse_args()
+
+    if not os.path.exists(args.input_file):
+        print(f"File not found: {args.input_file}")
+        sys.exit(1)
+
+    editor = MapEditor(load_osm(args.input_file))
+
+    with profiler.phase("remove_orphan_nodes") as phase:
+        removed = remove_orphan_nodes(editor)
+        phase.count(nodes=len(editor.osm.nodes), orphans=len(removed))
+
+    if not removed:
+        print("参照されていない node は存在しません。")
+        return
+
+    if args.verbose:
+        for node_id in removed:
+            print(f"削除: node id={node_id}")
+
+    # 削除する node 以外は元のファイルの内容をそのまま書き出す
+    output_file = args.output or generate_output_filename(args.input_file)
+    with profiler.phase("write_osm"):
+        counts = editor.write(output_file)
+    print(f"removed_nodes={len(removed)}")
+    print(format_size_report(args.input_file, output_file, counts))
+    print(f"出力ファイル: {output_file}")
+
+if __name__ == "__main__":
+    main()
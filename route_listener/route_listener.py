@@ -3,6 +3,10 @@ import os
 import re
 import xml.etree.ElementTree as ET
 
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from osm_common.osm_loader import load_osm
+from osm_common.profiler import init_profiler
+
 import rclpy
 from rclpy.node import Node
 
@@ -60,12 +64,9 @@ class ActionDataManager:
             print(f"[{i}] ID: {aid}, Action: {act}")
 
 class RouteListener(Node):
-    def __init__(self, osm_tree):
+    def __init__(self, osm):
         super().__init__('lanelet_route_listener')
-        self.osm_tree = osm_tree  # ElementTree オブジェクトを保持
-        self.nodes = {node.attrib['id']: node for node in osm_tree.findall('node')}
-        self.ways = {way.attrib['id']: way for way in osm_tree.findall('way')}
-        self.relations = osm_tree.findall('relation')
+        self.osm = osm  # load_osm で読み込んだ OSMData を保持
         self.last_lanelet_id = None  # 直近のCurrent ID保持用
 
         self.lane_data = LaneDataManager()
@@ -124,22 +125,17 @@ class RouteListener(Node):
         preferred_ids = [segment.preferred_primitive.id for segment in msg.segments]
         self.get_logger().info(f'Preferred Primitive IDs: {preferred_ids}')
 
-        # OSM XML の <relation> 要素を取得
-        root = self.osm_tree.getroot()
-        relations = root.findall('relation')
+        osm = self.osm
 
         all_ok = True  # フラグ：全てOKなら True のまま
 
         for pid in preferred_ids:
-            # relation の id 属性が一致するものを探す
-            match = next((rel for rel in relations if rel.attrib.get('id') == str(pid)), None)
+            # relation の id が一致するものを探す
+            match = osm.relation_by_id(pid)
 
             if match:
                 # tag type=lanelet が含まれているか確認
-                has_lanelet_tag = any(
-                    tag.attrib.get('k') == 'type' and tag.attrib.get('v') == 'lanelet'
-                    for tag in match.findall('tag')
-                )
+                has_lanelet_tag = match.tags.get('type') == 'lanelet'
                 if has_lanelet_tag:
                     status = "OK"
                 else:
@@ -157,27 +153,19 @@ class RouteListener(Node):
             # 全てOKならまとめて通知
             self.get_logger().info('All preferred primitives are valid lanelet relations.')
             # 長さ計算用: ノードの local_x, local_y, ele を取得する関数
-            def get_node_xyz(node_elem):
-                tags = {tag.attrib['k']: tag.attrib['v'] for tag in node_elem.findall('tag')}
-                try:
-                    x = float(tags.get('local_x', '0.0'))
-                    y = float(tags.get('local_y', '0.0'))
-                    z = float(tags.get('ele', '0.0'))
-                    return x, y, z
-                except ValueError:
-                    return None  # 値が不正な場合
+            def get_node_xyz(node_id):
+                i = osm.node_index(node_id)
+                if i is None or not osm.nodes.has_coords(i):
+                    return None  # ノードが無い・値が不正な場合
+                return osm.nodes.xyz(i)
 
             # 距離計算関数
-            def compute_way_length(way_elem):
-                nd_refs = [nd.attrib['ref'] for nd in way_elem.findall('nd')]
+            def compute_way_length(way):
+                nd_refs = way.refs
                 length = 0.0
                 for i in range(len(nd_refs) - 1):
-                    n1 = self.nodes.get(nd_refs[i])
-                    n2 = self.nodes.get(nd_refs[i + 1])
-                    if n1 is None or n2 is None:
-                        continue
-                    p1 = get_node_xyz(n1)
-                    p2 = get_node_xyz(n2)
+                    p1 = get_node_xyz(nd_refs[i])
+                    p2 = get_node_xyz(nd_refs[i + 1])
                     if p1 is None or p2 is None:
                         continue
                     dx = p2[0] - p1[0]
@@ -187,17 +175,15 @@ class RouteListener(Node):
                 return length
             length_sum=0
             for rid in preferred_ids:
-                relation = next(rel for rel in relations if rel.attrib.get('id') == str(rid))
+                relation = osm.relation_by_id(rid)
                 left_way = None
                 right_way = None
-                for member in relation.findall('member'):
-                    if member.attrib.get('type') == 'way':
-                        role = member.attrib.get('role')
-                        ref = member.attrib.get('ref')
-                        if role == 'left':
-                            left_way = self.ways.get(ref)
-                        elif role == 'right':
-                            right_way = self.ways.get(ref)
+                for member in relation.members:
+                    if member.type == 'way':
+                        if member.role == 'left':
+                            left_way = osm.way_by_id(member.ref)
+                        elif member.role == 'right':
+                            right_way = osm.way_by_id(member.ref)
 
                 if left_way and right_way:
                     left_length = compute_way_length(left_way)
@@ -213,25 +199,24 @@ class RouteListener(Node):
             found_any_traffic_light = False  # 一つでも見つかれば True にする
             traffic_light_lane_relations = []
             for rid in preferred_ids:
-                lanelet_rel = next((rel for rel in self.relations if rel.attrib.get('id') == str(rid)), None)
+                lanelet_rel = osm.relation_by_id(rid)
                 if lanelet_rel is None:
                     continue
 
                 reg_elements = [
-                    m.attrib.get('ref') for m in lanelet_rel.findall('member')
-                    if m.attrib.get('type') == 'relation' and m.attrib.get('role') == 'regulatory_element'
+                    m.ref for m in lanelet_rel.members
+                    if m.type == 'relation' and m.role == 'regulatory_element'
                 ]
 
                 traffic_light_ids = []
                 for reg_id in reg_elements:
-                    reg_rel = next((rel for rel in self.relations if rel.attrib.get('id') == str(reg_id)), None)
+                    reg_rel = osm.relation_by_id(reg_id)
                     if reg_rel is None:
                         continue
 
-                    for tag in reg_rel.findall('tag'):
-                        if tag.attrib.get('k') == 'subtype' and tag.attrib.get('v') == 'traffic_light':
-                            traffic_light_ids.append(reg_id)
-                            traffic_light_lane_relations.append((rid, reg_id))
+                    if reg_rel.tags.get('subtype') == 'traffic_light':
+                        traffic_light_ids.append(reg_id)
+                        traffic_light_lane_relations.append((rid, reg_id))
 
                 count = len(traffic_light_ids)
                 if count == 1:
@@ -309,9 +294,9 @@ class RouteListener(Node):
 
 def load_osm_file(file_path):
     try:
-        tree = ET.parse(file_path)
+        osm = load_osm(file_path)
         print(f"[INFO] Successfully loaded OSM file into memory: {file_path}")
-        return tree
+        return osm
 
     except ET.ParseError as e:
         print(f"[ERROR] Failed to parse OSM file: {e}")
@@ -325,6 +310,7 @@ def load_osm_file(file_path):
 
 
 def main(args=None):
+    init_profiler("route_listener")
     rclpy.init(args=args)
 
     if len(sys.argv) < 2:
@@ -338,10 +324,10 @@ def main(args=None):
         sys.exit(1)
 
     # OSMファイルを読み込んでメモリに保持
-    osm_tree = load_osm_file(osm_path)
+    osm = load_osm_file(osm_path)
 
-    # ROS2ノード起動、osm_treeを渡す
-    node = RouteListener(osm_tree)
+    # ROS2ノード起動、osmを渡す
+    node = RouteListener(osm)
     rclpy.spin(node)
     node.destroy_node()
     rclpy.shutdown()
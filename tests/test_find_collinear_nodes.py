@@ -0,0 +1,97 @@
+import numpy as np
+import pytest
+
+from find_collinear_nodes.find_collinear_nodes import (
+    build_ref_count,
+    collect_target_ways,
+    douglas_peucker,
+    flatten_ways,
+    node_coords,
+    remove_collinear_nodes,
+    segment_distance,
+    visvalingam,
+)
+from osm_common.map_edit import MapEditor
+from osm_common.osm_loader import parse_osm
+
+EPS = 0.05
+
+
+def write_osm(path, nodes, ways):
+    lines = ['<?xml version="1.0" encoding="UTF-8"?>', '<osm version="0.6" generator="test">']
+    for node_id, (x, y, z) in nodes.items():
+        lines.append(
+            f'  <node id="{node_id}" lat="35.0" lon="139.0"><tag k="local_x" v="{x!r}"/>'
+            f'<tag k="local_y" v="{y!r}"/><tag k="ele" v="{z!r}"/></node>'
+        )
+    for way_id, (refs, way_type) in ways.items():
+        nds = "".join(f'<nd ref="{ref}"/>' for ref in refs)
+        lines.append(f'  <way id="{way_id}">{nds}<tag k="type" v="{way_type}"/></way>')
+    lines.append("</osm>")
+    path.write_text("\n".join(lines) + "\n", encoding="utf-8")
+    return str(path)
+
+
+def sample_map(tmp_path):
+    """ノイズを含む曲線・ほぼ直線のway と、それらと中間のノードを共有するway"""
+    rng = np.random.default_rng(0)
+    nodes = {}
+    ways = {}
+    t = np.linspace(0, 20, 300)
+    curve = np.column_stack([t, 2 * np.sin(t / 3), 0.01 * t]) + rng.normal(0, 0.01, (len(t), 3))
+    line = np.column_stack([t, np.full(len(t), 10.0), np.zeros(len(t))]) + rng.normal(0, 0.005, (len(t), 3))
+    for base, points in ((1000, curve), (2000, line)):
+        for i, point in enumerate(points):
+            nodes[base + i] = tuple(float(v) for v in point)
+    ways[10] = ([1000 + i for i in range(len(t))], "line_thin")
+    ways[11] = ([2000 + i for i in range(len(t))], "road_border")
+    # 中間のノードを共有する横断のway
+    ways[12] = ([1100, 2100, 1200, 2250], "virtual")
+    return write_osm(tmp_path / "map.osm", nodes, ways)
+
+
+def max_deviation(xyz, original, simplified):
+    """simplified（original の部分列）の各辺から、その間で外した original のノードまでの最大の距離"""
+    kept = np.nonzero(np.isin(original, simplified))[0]
+    assert [original[i] for i in kept] == simplified
+    worst = 0.0
+    for start, end in zip(kept, kept[1:]):
+        if end - start > 1:
+            inner = xyz[start + 1:end]
+            d = segment_distance(inner, np.repeat(xyz[start:start + 1], len(inner), 0), np.repeat(xyz[end:end + 1], len(inner), 0))
+            worst = max(worst, float(d.max()))
+    return worst
+
+
+@pytest.mark.parametrize("method", ["dp", "vw"])
+def test_simplify_within_eps_and_keeps_shared(tmp_path, method):
+    editor = MapEditor(parse_osm(sample_map(tmp_path)))
+    ways = collect_target_ways(editor)
+    refs, _ = flatten_ways(ways)
+    shared = set(refs[build_ref_count(refs) > 1].tolist())
+    assert shared == {1100, 1200, 2100, 2250}
+
+    removed, updated = remove_collinear_nodes(editor, EPS, log=lambda *args: None, simplify=method)
+    assert removed and not removed & shared
+
+    for way_id, original, _ in ways:
+        simplified = list(editor.way_refs.get(way_id, original))
+        assert simplified[0] == original[0] and simplified[-1] == original[-1]
+        assert shared & set(original) <= set(simplified)
+        assert max_deviation(node_coords(editor, original), original, simplified) <= EPS
+    # ほぼ直線のwayはほとんどのノードを外せる（dp では両端と共有するノードだけが残る）
+    assert len(editor.way_refs[11]) < 20
+    if method == "dp":
+        assert editor.way_refs[11] == [2000, 2100, 2250, 2299]
+
+
+@pytest.mark.parametrize("simplify", [douglas_peucker, visvalingam])
+def test_zigzag_within_eps(simplify):
+    # 振れ幅が端に向かって小さくなるジグザグは dp の分割が1点ずつしか進まず、途中から vw に切り替わる
+    n = 3000
+    i = np.arange(n, dtype=np.float64)
+    xyz = np.column_stack([i, (n - i + 1) * (-1) ** i / n, np.zeros(n)])
+    kept = simplify(xyz, np.array([0]), np.array([n - 1]), 0.5)
+
+    assert kept[0] and kept[-1]
+    assert max_deviation(xyz, list(range(n)), np.nonzero(kept)[0].tolist()) <= 0.5
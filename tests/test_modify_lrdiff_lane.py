@@ -0,0 +1,97 @@
+import math
+
+import pytest
+
+from modify_lrdiff_lane.modify_lrdiff_lane import ENGINES, correct_lrdiff_lanes
+from osm_common.map_edit import MapEditor
+from osm_common.osm_loader import parse_osm
+
+
+def arc(radius, count, start_id, z_slope=0.002):
+    """原点を中心とする半径 radius の四分円を count 個のノードで表した {id: (x, y, z)}"""
+    nodes = {}
+    for i in range(count):
+        angle = 0.5 * math.pi * i / (count - 1)
+        nodes[start_id + i] = (radius * math.cos(angle), radius * math.sin(angle), z_slope * radius * angle)
+    return nodes
+
+
+def write_map(path):
+    nodes = {}
+    ways = {}
+    # lanelet 100: 左 30 ノード・右 8 ノードの曲線
+    nodes.update(arc(50.0, 30, 1000))
+    nodes.update(arc(53.5, 8, 2000))
+    ways[10] = list(range(1000, 1030))
+    ways[11] = list(range(2000, 2008))
+    # lanelet 101: 左 3 ノードの直線・右 12 ノードの直線（間隔が不揃い）
+    nodes.update({3000: (0.0, -10.0, 0.0), 3001: (4.0, -10.0, 0.0), 3002: (20.0, -10.0, 0.0)})
+    nodes.update({4000 + i: (20.0 * (i / 11) ** 2, -13.5, 0.0) for i in range(12)})
+    ways[12] = [3000, 3001, 3002]
+    ways[13] = list(range(4000, 4012))
+    # lanelet 102: lanelet 100 の左のウェイを右に共有し、左は 5 ノード
+    nodes.update(arc(46.5, 5, 5000))
+    ways[14] = list(range(5000, 5005))
+    relations = {100: (10, 11), 101: (12, 13), 102: (14, 10)}
+
+    lines = ['<?xml version="1.0" encoding="UTF-8"?>', '<osm version="0.6" generator="test">']
+    for node_id, (x, y, z) in nodes.items():
+        lines.append(
+            f'  <node id="{node_id}" lat="" lon=""><tag k="local_x" v="{x!r}"/>'
+            f'<tag k="local_y" v="{y!r}"/><tag k="ele" v="{z!r}"/></node>'
+        )
+    for way_id, refs in ways.items():
+        nds = "".join(f'<nd ref="{ref}"/>' for ref in refs)
+        lines.append(f'  <way id="{way_id}">{nds}<tag k="type" v="line_thin"/></way>')
+    for rel_id, (left, right) in relations.items():
+        lines.append(
+            f'  <relation id="{rel_id}"><member type="way" ref="{left}" role="left"/>'
+            f'<member type="way" ref="{right}" role="right"/><tag k="type" v="lanelet"/></relation>'
+        )
+    lines.append("</osm>")
+    path.write_text("\n".join(lines) + "\n", encoding="utf-8")
+    return str(path)
+
+
+def polyline_position(point, polyline):
+    """折れ線上の point の位置（線分の番号 + 線分内の比率）と、折れ線までの距離"""
+    best = (math.inf, 0.0)
+    for i, (a, b) in enumerate(zip(polyline, polyline[1:])):
+        ab = [b[k] - a[k] for k in range(3)]
+        length2 = sum(v * v for v in ab)
+        t = sum((point[k] - a[k]) * ab[k] for k in range(3)) / length2 if length2 > 0 else 0.0
+        t = min(1.0, max(0.0, t))
+        d = math.dist(point, [a[k] + ab[k] * t for k in range(3)])
+        if d < best[0]:
+            best = (d, i + t)
+    return best[1], best[0]
+
+
+@pytest.mark.parametrize("engine", ENGINES)
+def test_equal_counts_and_inserted_on_polyline(tmp_path, engine):
+    source = write_map(tmp_path / "map.osm")
+    before = MapEditor(parse_osm(source))
+    osm = correct_lrdiff_lanes(MapEditor(parse_osm(source)), log=lambda *args: None, engine=engine)
+    output = tmp_path / "out.osm"
+    osm.write(str(output))
+
+    after = MapEditor(parse_osm(str(output)))
+    assert sorted(osm.modified_ways, key=int) == ["11", "12", "14"]
+    for relation in after.iter_relations():
+        members = {m.role: m.ref for m in relation.members}
+        assert len(after.way_by_id(members["left"]).refs) == len(after.way_by_id(members["right"]).refs)
+
+    for way_id in (11, 12, 14):
+        original = list(before.way_by_id(way_id).refs)
+        refs = list(after.way_by_id(way_id).refs)
+        # 元のノードは同じ順序のまま残る
+        assert [ref for ref in refs if ref in set(original)] == original
+        polyline = [before.node_xyz(ref) for ref in original]
+        positions = []
+        for ref in refs:
+            position, d = polyline_position(after.node_xyz(ref), polyline)
+            assert d < 1e-6
+            positions.append(position)
+        if engine == "arclength":
+            # 挿入したノードも元の折れ線に沿った順に並ぶ
+            assert positions == sorted(positions)
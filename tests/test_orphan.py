@@ -0,0 +1,104 @@
+from osm_common.map_edit import MapEditor
+from osm_common.orphan import find_orphan_nodes, format_size_report, remove_orphan_nodes
+from osm_common.osm_loader import parse_osm
+
+HEAD = """<?xml version="1.0" encoding="UTF-8"?>
+<osm version="0.6" generator="test">"""
+TAIL = """
+</osm>
+"""
+
+
+def node(node_id, tags=True):
+    if not tags:
+        return f'\n  <node id="{node_id}" lat="35.0" lon="139.0"/>'
+    return (
+        f'\n  <node id="{node_id}" lat="35.0" lon="139.0">'
+        f'\n    <tag k="local_x" v="{node_id}.0"/>\n    <tag k="local_y" v="0.0"/>\n    <tag k="ele" v="0.0"/>\n  </node>'
+    )
+
+
+# 1・2: way 10、3: way 11、4: relation 20 の node member、5・6・7: どこからも参照されない
+# （relation 20 の way member の ref="5" はノードの参照ではない）
+ELEMENTS = {
+    ("node", 1): node(1),
+    ("node", 2): node(2),
+    ("node", 5): node(5, tags=False),
+    ("node", 3): node(3),
+    ("node", 6): node(6),
+    ("node", 4): node(4),
+    ("node", 7): node(7, tags=False),
+    ("way", 10): """
+  <way id="10">
+    <nd ref="1"/>
+    <nd ref="2"/>
+    <tag k="type" v="line_thin"/>
+  </way>""",
+    ("way", 11): """
+  <way id="11">
+    <nd ref="3"/>
+    <nd ref="1"/>
+  </way>""",
+    ("way", 5): """
+  <way id="5">
+    <nd ref="2"/>
+    <nd ref="1"/>
+  </way>""",
+    ("relation", 20): """
+  <relation id="20">
+    <member type="node" ref="4" role="refers"/>
+    <member type="way" ref="5" role="left"/>
+    <tag k="type" v="regulatory_element"/>
+  </relation>""",
+}
+
+
+def write_map(tmp_path):
+    source = tmp_path / "map.osm"
+    source.write_text(HEAD + "".join(ELEMENTS.values()) + TAIL, encoding="utf-8")
+    return source
+
+
+def node_ids(path):
+    return set(parse_osm(str(path)).nodes.ids)
+
+
+def test_sweep_removes_only_unreferenced_nodes(tmp_path):
+    source = write_map(tmp_path)
+    editor = MapEditor(parse_osm(str(source)))
+
+    assert find_orphan_nodes(editor) == [5, 6, 7]
+    assert remove_orphan_nodes(editor) == [5, 6, 7]
+    # 削除済みのノードは2回目には見つからない
+    assert find_orphan_nodes(editor) == []
+
+    output = tmp_path / "out.osm"
+    counts = editor.write(str(output))
+    assert node_ids(output) == {1, 2, 3, 4}
+    assert counts["removed"] == 3 and counts["modified"] == counts["added"] == 0
+    # 削除した要素のバイト数（前の空白を含む）がそのままファイルの大きさの差になる
+    expected_bytes = sum(len(ELEMENTS[("node", node_id)].encode("utf-8")) for node_id in (5, 6, 7))
+    assert counts["removed_bytes"] == expected_bytes
+    assert source.stat().st_size - output.stat().st_size == expected_bytes
+    assert format_size_report(str(source), str(output), counts) == (
+        f"removed_elements=3, removed_bytes={expected_bytes}, "
+        f"size={source.stat().st_size} -> {output.stat().st_size} bytes (saved {expected_bytes} bytes)"
+    )
+
+
+def test_sweep_follows_edits(tmp_path):
+    source = write_map(tmp_path)
+    editor = MapEditor(parse_osm(str(source)))
+    # way 11 を削除すると 3 が参照されなくなる。way 10 から外した 2 は way 5 が参照するので残る。
+    # 追加したノードは変更したwayが参照する 8 だけが残る
+    editor.remove("way", 11)
+    editor.set_way_refs(10, [1, 8])
+    editor.add_node(8.0, 0.0, 0.0, node_id=8)
+    editor.add_node(9.0, 0.0, 0.0, node_id=9)
+
+    assert remove_orphan_nodes(editor) == [5, 3, 6, 7, 9]
+
+    output = tmp_path / "out.osm"
+    counts = editor.write(str(output))
+    assert node_ids(output) == {1, 2, 4, 8}
+    assert (counts["removed"], counts["modified"], counts["added"]) == (5, 1, 1)
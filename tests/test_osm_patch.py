@@ -0,0 +1,92 @@
+import xml.etree.ElementTree as ET
+
+import pytest
+
+from osm_common import osm_patch
+from osm_common.osm_patch import OSMPatch, set_nd_refs, write_patched
+
+HEAD = """<?xml version="1.0" encoding="UTF-8"?>
+<osm version="0.6" generator="VMB">
+  <MetaInfo format_version="1" map_version="2"/>
+  <!-- <node id="2"/> in a comment is not an element -->
+  <node id="1" visible="true" version="1" lat="35.0" lon="139.0">
+    <tag k="note" v="a > b"/>
+  </node>"""
+NODE2 = """
+  <node id='2' visible="true" version="1" lat="35.1" lon="139.1"/>"""
+NODE3 = """
+  <node id="3" visible="true" version="1" lat="35.2" lon="139.2">
+    <tag k="ele" v="1.0"/>
+  </node>"""
+WAY10 = """
+  <way id="10" visible="true" version="1">
+    <nd ref="1"/>
+    <nd ref="2"/>
+    <tag k="type" v="line_thin"/>
+  </way>"""
+TAIL = """
+  <relation id="100" visible="true" version="1">
+    <member type="way" ref="10" role="left"/>
+    <tag k="type" v="lanelet"/>
+  </relation>
+</osm>
+"""
+
+ADDED_NODE = """
+  <node id="4" visible="true" version="1" lat="35.3" lon="139.3"/>"""
+PATCHED_WAY10 = """
+  <way id="10" visible="true" version="1">
+    <nd ref="1"/>
+    <nd ref="3"/>
+    <nd ref="4"/>
+    <tag k="type" v="line_thin"/>
+  </way>"""
+
+
+@pytest.fixture(params=[osm_patch._CHUNK_SIZE, 7])
+def chunk_size(request, monkeypatch):
+    # 小さいチャンクでも要素・コメントの途中でバッファを継ぎ足して同じ結果になる
+    monkeypatch.setattr(osm_patch, "_CHUNK_SIZE", request.param)
+    return request.param
+
+
+def test_remove_modify_add(tmp_path, chunk_size):
+    source = tmp_path / "map.osm"
+    source.write_bytes((HEAD + NODE2 + NODE3 + WAY10 + TAIL).encode("utf-8"))
+
+    patch = OSMPatch()
+    patch.remove("node", 2)
+    patch.modify("way", 10, lambda elem: set_nd_refs(elem, [1, 3, 4]))
+    patch.add(ET.Element("node", {"id": "4", "visible": "true", "version": "1", "lat": "35.3", "lon": "139.3"}))
+
+    output = tmp_path / "out.osm"
+    counts = write_patched(str(source), str(output), patch)
+
+    expected = HEAD + NODE3 + ADDED_NODE + PATCHED_WAY10 + TAIL
+    assert output.read_bytes() == expected.encode("utf-8")
+    assert counts == {"removed": 1, "modified": 1, "added": 1, "removed_bytes": len(NODE2.encode("utf-8"))}
+
+
+def test_empty_patch_copies_source(tmp_path, chunk_size):
+    source = tmp_path / "map.osm"
+    data = (HEAD + NODE2 + NODE3 + WAY10 + TAIL).encode("utf-8")
+    source.write_bytes(data)
+
+    output = tmp_path / "out.osm"
+    counts = write_patched(str(source), str(output), OSMPatch())
+    assert output.read_bytes() == data
+    assert counts == {"removed": 0, "modified": 0, "added": 0, "removed_bytes": 0}
+
+
+def test_missing_ids_are_not_counted(tmp_path):
+    source = tmp_path / "map.osm"
+    data = (HEAD + NODE3 + TAIL).encode("utf-8")
+    source.write_bytes(data)
+
+    patch = OSMPatch()
+    patch.remove("node", 2)
+    patch.modify("way", 10, lambda elem: set_nd_refs(elem, []))
+    output = tmp_path / "out.osm"
+    counts = write_patched(str(source), str(output), patch)
+    assert output.read_bytes() == data
+    assert counts["removed"] == 0 and counts["modified"] == 0
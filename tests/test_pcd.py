@@ -0,0 +1,93 @@
+import struct
+
+import numpy as np
+import pytest
+
+from osm_common import pcd
+from osm_common.pcd import lzf_compress, lzf_decompress, read_pcd_header, write_pcd
+
+FIELDS = ["x", "y", "z", "intensity"]
+
+
+def samples():
+    rng = np.random.default_rng(0)
+    yield b"a"
+    yield b"abcabcabc"
+    # 参照範囲が現在位置と重なる一致・最大長（264）を超える一致
+    yield b"a" * 1000
+    # 最大オフセット（8192）付近の一致
+    block = rng.integers(0, 256, 8190, dtype=np.uint8).tobytes()
+    yield block + b"xyz" + block
+    yield rng.integers(0, 256, 5000, dtype=np.uint8).tobytes()
+    yield np.repeat(np.arange(100, dtype="<f4"), 37).tobytes()
+
+
+@pytest.fixture(params=["python", "python-lzf"])
+def backend(request, monkeypatch):
+    if request.param == "python":
+        monkeypatch.setattr(pcd, "lzf", None)
+    else:
+        monkeypatch.setattr(pcd, "lzf", pytest.importorskip("lzf"))
+    return request.param
+
+
+def test_lzf_round_trip(backend):
+    assert lzf_compress(b"") == b""
+    for data in samples():
+        assert lzf_decompress(lzf_compress(data), len(data)) == data
+
+
+def test_lzf_compresses_repeats(backend):
+    data = b"0123456789" * 1000
+    assert len(lzf_compress(data)) < len(data) // 10
+
+
+def test_lzf_decompress_known_stream(backend):
+    # リテラル "abc" と、3バイト前からの長さ3の参照
+    assert lzf_decompress(b"\x02abc\x20\x02", 6) == b"abcabc"
+    # 展開後が size より短い・長い場合、参照が先頭より前を指す場合
+    for data, size in [(b"\x02abc", 6), (b"\x02abc\x20\x02", 3), (b"\x02abc\x20\x09", 6)]:
+        with pytest.raises(ValueError):
+            lzf_decompress(data, size)
+
+
+def read_binary_compressed(path):
+    """binary_compressed のPCDファイルの点を (N, フィールド数) の float32 配列で返す"""
+    header = read_pcd_header(path)
+    assert header.data_format == "binary_compressed"
+    with open(path, "rb") as f:
+        f.seek(header.data_offset)
+        compressed_size, size = struct.unpack("<II", f.read(8))
+        data = f.read(compressed_size)
+        assert f.read() == b""
+    columns = np.frombuffer(lzf_decompress(data, size), dtype="<f4")
+    return header, columns.reshape(len(header.fields), header.num_points).T
+
+
+@pytest.mark.parametrize("num_points", [0, 1, 5000])
+def test_binary_compressed_decode(tmp_path, backend, num_points):
+    rng = np.random.default_rng(num_points)
+    points = np.column_stack([
+        np.round(rng.uniform(-100, 100, (num_points, 3)), 1),
+        np.full(num_points, 1.0),
+    ]).astype("<f4")
+    path = str(tmp_path / "points.pcd")
+    write_pcd(path, points, FIELDS, "binary_compressed")
+
+    header, decoded = read_binary_compressed(path)
+    assert header.fields == FIELDS
+    assert header.num_points == num_points
+    np.testing.assert_array_equal(decoded, points)
+
+
+def test_binary_compressed_in_blocks(tmp_path, backend):
+    # 列ごと・ブロック（64KiB）ごとに圧縮したものを連結して1つの圧縮データとする
+    points = np.arange(160000, dtype="<f4").reshape(-1, 4)
+    path = str(tmp_path / "points.pcd")
+    with pcd.PCDWriter(path, FIELDS, "binary_compressed", buffer_points=100) as writer:
+        for start in range(0, len(points), 300):
+            writer.write(points[start:start + 300])
+
+    header, decoded = read_binary_compressed(path)
+    assert header.num_points == len(points)
+    np.testing.assert_array_equal(decoded, points)
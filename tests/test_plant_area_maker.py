@@ -0,0 +1,77 @@
+import numpy as np
+import pytest
+
+from plant_area_maker.plant_area_maker import PlantPolygon, PolygonArea, _scanline_spans
+
+STEP = 0.25
+# 格子の点が辺の上に乗らないよう、頂点は格子からずらしておく
+OUTER = [(0.013, 0.021), (10.07, 0.033), (10.09, 7.97), (5.03, 3.11), (0.017, 8.03)]
+HOLE = [(1.51, 1.03), (3.47, 1.09), (3.53, 2.97), (1.49, 3.01)]
+# 輪どうしが重なる（偶奇規則で重なりは外側になる）
+OVERLAP = [[(0.011, 0.019), (4.03, 0.027), (4.07, 4.01), (0.023, 3.97)],
+           [(2.03, 2.01), (6.07, 2.03), (6.01, 6.07), (2.09, 5.99)]]
+
+
+def ring3d(ring, slope=0.1):
+    return [(x, y, slope * x) for x, y in ring]
+
+
+def reference_fill(rings, step):
+    """格子のすべての点を偶奇規則の点の多角形内判定（各辺との交差の数）で調べた内側の点 (x, y)"""
+    vertices = np.concatenate([np.asarray(ring, dtype=np.float64) for ring in rings])
+    cols = np.arange(np.floor(vertices[:, 0].min() / step), np.ceil(vertices[:, 0].max() / step) + 1)
+    rows = np.arange(np.floor(vertices[:, 1].min() / step), np.ceil(vertices[:, 1].max() / step) + 1)
+    x, y = (grid.ravel() * step for grid in np.meshgrid(cols, rows))
+    inside = np.zeros(len(x), dtype=bool)
+    for ring in rings:
+        ring = np.asarray(ring, dtype=np.float64)
+        for (x0, y0), (x1, y1) in zip(ring, np.roll(ring, -1, axis=0)):
+            crosses = (y0 > y) != (y1 > y)
+            x_cross = x0 + (y - y0) * (x1 - x0) / np.where(y1 != y0, y1 - y0, 1)
+            inside ^= crosses & (x < x_cross)
+    return np.column_stack([x[inside], y[inside]])
+
+
+def sorted_xy(xy):
+    xy = np.round(np.asarray(xy)[:, :2] / STEP).astype(np.int64)
+    return xy[np.lexsort((xy[:, 0], xy[:, 1]))]
+
+
+@pytest.mark.parametrize("outer, inner", [([OUTER], []), ([OUTER], [HOLE]), (OVERLAP, [])])
+def test_scanline_fill_matches_point_in_polygon(outer, inner):
+    polygon = PlantPolygon([ring3d(ring) for ring in outer], [ring3d(ring) for ring in inner])
+    area = PolygonArea(polygon, STEP)
+    filled = area._rung_points(0, area.num_rungs)
+
+    expected = reference_fill(outer + inner, STEP)
+    assert len(filled) == area.num_points(lines=False) == len(expected)
+    np.testing.assert_array_equal(sorted_xy(filled), sorted_xy(expected))
+    # 内側の点の z は頂点に当てはめた平面上にある
+    np.testing.assert_allclose(filled[:, 2], 0.1 * filled[:, 0], atol=1e-9)
+
+
+def test_jitter_stays_inside():
+    polygon = PlantPolygon([ring3d(OUTER)], [ring3d(HOLE)])
+    uniform = PolygonArea(polygon, STEP)
+    jittered = PolygonArea(polygon, STEP, jitter=True)
+    points = jittered._rung_points(0, jittered.num_rungs)
+
+    assert len(points) == uniform.num_points(lines=False)
+    assert not np.array_equal(points, uniform._rung_points(0, uniform.num_rungs))
+    # 行の上で区間の中だけを動くので、y は格子のまま、x は区間の端（境界上）までに収まる
+    np.testing.assert_allclose(points[:, 1] / STEP, np.round(points[:, 1] / STEP), atol=1e-9)
+    for row in np.unique(points[:, 1]):
+        on_row = points[points[:, 1] == row]
+        spans = jittered.span_rows == int(round(row / STEP))
+        assert np.any((on_row[:, :1] >= jittered.span_starts[spans]) & (on_row[:, :1] <= jittered.span_ends[spans]), axis=1).all()
+
+
+def test_scanline_spans_chunks():
+    rings = [np.asarray(ring, dtype=np.float64) for ring in [OUTER, HOLE]]
+    starts = np.concatenate(rings)
+    ends = np.concatenate([np.roll(ring, -1, axis=0) for ring in rings])
+    rows = np.arange(0, 33)
+    whole = _scanline_spans(starts, ends, rows, rows * STEP)
+    # 一度に扱う行と辺の組を少なくしても同じ区間になる
+    for expected, actual in zip(whole, _scanline_spans(starts, ends, rows, rows * STEP, max_cells=5)):
+        np.testing.assert_array_equal(actual, expected)
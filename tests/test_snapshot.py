@@ -0,0 +1,86 @@
+import os
+
+from osm_common.osm_loader import parse_osm
+from osm_common.snapshot import load_with_snapshot, snapshot_path
+
+OSM = """<?xml version="1.0" encoding="UTF-8"?>
+<osm version="0.6" generator="test">
+  <node id="1" lat="35.0" lon="139.0">
+    <tag k="local_x" v="1.5"/>
+    <tag k="local_y" v="2.5"/>
+    <tag k="ele" v="3.5"/>
+  </node>
+  <node id="2" lat="35.0" lon="139.0">
+    <tag k="local_x" v="4.0"/>
+    <tag k="local_y" v="5.0"/>
+    <tag k="ele" v="6.0"/>
+    <tag k="type" v="{node_type}"/>
+  </node>
+  <way id="10">
+    <nd ref="1"/>
+    <nd ref="2"/>
+    <tag k="type" v="line_thin"/>
+  </way>
+  <relation id="100">
+    <member type="way" ref="10" role="left"/>
+    <member type="node" ref="2" role="ref"/>
+    <tag k="subtype" v="road"/>
+  </relation>
+</osm>
+"""
+
+
+def write_osm(path, node_type="pole"):
+    path.write_text(OSM.format(node_type=node_type), encoding="utf-8")
+    return str(path)
+
+
+def dump(osm):
+    return (
+        osm.root_attrib,
+        [(osm.nodes.ids[i], osm.nodes.xyz(i), osm.node_tags(i)) for i in range(len(osm.nodes))],
+        list(osm.iter_ways()),
+        list(osm.iter_relations()),
+    )
+
+
+def test_round_trip(tmp_path):
+    source = write_osm(tmp_path / "map.osm")
+    cache = str(tmp_path / "cache")
+
+    first = load_with_snapshot(source, cache)
+    assert first.mmap is None
+    assert os.path.exists(snapshot_path(source, cache))
+
+    second = load_with_snapshot(source, cache)
+    assert second.mmap is not None
+    assert second.path == source
+    assert dump(second) == dump(parse_osm(source))
+    assert list(second.way_by_id(10).refs) == [1, 2]
+    assert second.strings._lookup["node"] == parse_osm(source).strings._lookup["node"]
+
+
+def test_content_change_invalidates(tmp_path):
+    source = write_osm(tmp_path / "map.osm")
+    cache = str(tmp_path / "cache")
+    load_with_snapshot(source, cache)
+
+    # 同じサイズで内容だけが異なる場合も sha256 で古いと判定する
+    write_osm(tmp_path / "map.osm", node_type="post")
+    reloaded = load_with_snapshot(source, cache)
+    assert reloaded.mmap is None
+    assert reloaded.node_tags(1)["type"] == "post"
+
+    cached = load_with_snapshot(source, cache)
+    assert cached.mmap is not None
+    assert cached.node_tags(1)["type"] == "post"
+
+
+def test_touch_keeps_snapshot(tmp_path):
+    source = write_osm(tmp_path / "map.osm")
+    cache = str(tmp_path / "cache")
+    load_with_snapshot(source, cache)
+
+    st = os.stat(source)
+    os.utime(source, ns=(st.st_atime_ns, st.st_mtime_ns + 10**9))
+    assert load_with_snapshot(source, cache).mmap is not None
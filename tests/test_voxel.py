@@ -0,0 +1,71 @@
+import numpy as np
+import pytest
+
+from osm_common.voxel import SLOT_BYTES, VoxelFilter, VoxelGrid, VoxelMemoryError, voxel_indices
+
+
+class ListWriter:
+    def __init__(self):
+        self.chunks = []
+        self.closed = False
+
+    def write(self, points):
+        self.chunks.append(np.array(points))
+
+    def close(self):
+        self.closed = True
+
+
+def first_occurrence(keys):
+    _, first = np.unique(keys, axis=0, return_index=True)
+    mask = np.zeros(len(keys), dtype=bool)
+    mask[first] = True
+    return mask
+
+
+def test_grid_matches_unique():
+    rng = np.random.default_rng(0)
+    keys = rng.integers(-20, 20, (30000, 3)).astype(np.int32)
+    # 小さい表から始めて拡張・衝突・同じバッチ内の重複を含める
+    grid = VoxelGrid(capacity=16)
+    added = np.concatenate([grid.add(keys[start:start + 7000]) for start in range(0, len(keys), 7000)])
+
+    np.testing.assert_array_equal(added, first_occurrence(keys))
+    assert grid.size == len(np.unique(keys, axis=0))
+    assert not grid.add(keys).any()
+
+
+def test_filter_keeps_first_point_per_voxel():
+    rng = np.random.default_rng(1)
+    points = np.column_stack([rng.uniform(-5, 5, (20000, 3)), np.arange(20000)]).astype(np.float32)
+    writer = ListWriter()
+    voxel = VoxelFilter(writer, 0.5)
+    for start in range(0, len(points), 3000):
+        voxel.write(points[start:start + 3000])
+    voxel.write(points[:0])
+    voxel.close()
+
+    kept = np.concatenate(writer.chunks)
+    expected = points[first_occurrence(voxel_indices(points, 0.5))]
+    np.testing.assert_array_equal(kept, expected)
+    assert voxel.received == len(points)
+    assert voxel.kept == len(expected) == len(np.unique(np.floor(points[:, :3] / 0.5), axis=0))
+    assert writer.closed
+
+
+def test_max_bytes():
+    keys = np.arange(3000, dtype=np.int32).repeat(3).reshape(-1, 3)
+    grid = VoxelGrid(max_bytes=1 << 20)
+    assert grid.capacity * SLOT_BYTES <= 1 << 20
+    assert grid.add(keys).all()
+
+    grid = VoxelGrid(max_bytes=4096 * SLOT_BYTES)
+    with pytest.raises(VoxelMemoryError):
+        grid.add(keys)
+
+
+def test_invalid_size():
+    with pytest.raises(ValueError):
+        VoxelFilter(ListWriter(), 0)
+    with pytest.raises(ValueError):
+        voxel_indices(np.array([[1e9, 0, 0]]), 1e-3)